@@ -0,0 +1,239 @@
+"""
+流式生成的准入控制 (Admission Control) 与会话间公平调度
+
+- 全局并发上限：同时进行的 SSE 生成数不超过 admission_max_active_streams
+- 会话上限：单个会话同时进行的生成数 / 排队数有上限，超出直接 429
+- 加权公平队列 (WFQ)：按预估 prompt token 计费，每个请求的虚拟完成时间
+  finish = max(V, 该会话上一请求的 finish) + cost，出队时取 finish 最小者，
+  大 payload 的会话不会饿死其他会话
+- 队列满 / 排队超时：返回 429 + Retry-After (按平均占用时长估算)
+- 请求体大小：BodySizeLimitMiddleware 在解析前拒绝过大的请求 (413)
+"""
+import asyncio
+import itertools
+import math
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from starlette.exceptions import HTTPException
+
+from app.core.config import settings
+from app.core.metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_QUEUE_WAIT_SECONDS, ADMISSION_REJECTED
+
+# 尚无占用时长样本时用于估算 Retry-After 的默认值 (秒)
+DEFAULT_HOLD_SECONDS = 10.0
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class Ticket:
+    session_id: str
+    cost: float
+    start_tag: float
+    finish_tag: float
+    seq: int
+    granted: asyncio.Future = field(repr=False)
+    acquired_at: float = 0.0
+    released: bool = False
+
+
+class AdmissionController:
+    """单进程内的准入控制器；所有方法都在事件循环线程上调用"""
+
+    def __init__(self):
+        self._seq = itertools.count()
+        self._waiting: List[Ticket] = []
+        self._active = 0
+        self._session_active: Counter = Counter()
+        self._session_queued: Counter = Counter()
+        self._session_finish: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._avg_hold = DEFAULT_HOLD_SECONDS
+
+    def snapshot(self) -> dict:
+        return {
+            "active": self._active,
+            "queued": len(self._waiting),
+            "virtual_time": round(self._virtual_time, 1),
+            "avg_hold_seconds": round(self._avg_hold, 2),
+            "sessions": {
+                sid: {"active": self._session_active[sid], "queued": self._session_queued[sid]}
+                for sid in set(self._session_active) | set(self._session_queued)
+            },
+        }
+
+    def retry_after(self) -> int:
+        slots = max(1, settings.admission_max_active_streams)
+        return max(1, math.ceil(self._avg_hold * (len(self._waiting) + 1) / slots))
+
+    def _reject(self, reason: str):
+        ADMISSION_REJECTED.labels(reason).inc()
+        raise AdmissionRejected(reason, self.retry_after())
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE.set(self._active)
+        ADMISSION_QUEUED.set(len(self._waiting))
+
+    def _pick(self) -> Optional[Ticket]:
+        cap = settings.admission_session_max_active
+        best: Optional[Tuple[float, int]] = None
+        chosen = None
+        for ticket in self._waiting:
+            if self._session_active[ticket.session_id] >= cap:
+                continue
+            key = (ticket.finish_tag, ticket.seq)
+            if best is None or key < best:
+                best, chosen = key, ticket
+        return chosen
+
+    def _dispatch(self):
+        while self._active < settings.admission_max_active_streams:
+            ticket = self._pick()
+            if ticket is None:
+                break
+            self._waiting.remove(ticket)
+            self._session_queued[ticket.session_id] -= 1
+            if not self._session_queued[ticket.session_id]:
+                del self._session_queued[ticket.session_id]
+            self._virtual_time = max(self._virtual_time, ticket.start_tag)
+            self._active += 1
+            self._session_active[ticket.session_id] += 1
+            ticket.acquired_at = time.perf_counter()
+            ticket.granted.set_result(True)
+        self._prune_finish_tags()
+        self._update_gauges()
+
+    def _prune_finish_tags(self):
+        """
+        清理空闲会话 (无执行、无排队) 的完成标签：
+        - 系统完全空闲时，把 V 推进到最大完成标签并全部清空 (此时没有积压，各会话重新公平起步)
+        - 否则只清理完成标签已不超过 V 的会话 (下次按 V 计算结果相同)
+        """
+        if not self._active and not self._waiting:
+            if self._session_finish:
+                self._virtual_time = max(self._virtual_time, max(self._session_finish.values()))
+                self._session_finish.clear()
+            return
+        stale = [
+            sid for sid, finish in self._session_finish.items()
+            if finish <= self._virtual_time
+            and sid not in self._session_active and sid not in self._session_queued
+        ]
+        for sid in stale:
+            del self._session_finish[sid]
+
+    async def acquire(self, session_id: str, cost: float) -> Ticket:
+        """排队直到获得执行名额；被拒绝时抛出 AdmissionRejected"""
+        pending = self._session_active[session_id] + self._session_queued[session_id]
+        if pending >= settings.admission_session_max_active + settings.admission_session_max_queued:
+            self._reject("session_limit")
+        if len(self._waiting) >= settings.admission_max_queue:
+            self._reject("queue_full")
+
+        start_tag = max(self._virtual_time, self._session_finish.get(session_id, 0.0))
+        ticket = Ticket(
+            session_id=session_id,
+            cost=max(cost, 1.0),
+            start_tag=start_tag,
+            finish_tag=start_tag + max(cost, 1.0),
+            seq=next(self._seq),
+            granted=asyncio.get_running_loop().create_future(),
+        )
+        self._session_finish[session_id] = ticket.finish_tag
+        self._waiting.append(ticket)
+        self._session_queued[session_id] += 1
+        enqueued = time.perf_counter()
+        self._dispatch()
+
+        if not ticket.granted.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(ticket.granted), settings.admission_queue_timeout_seconds)
+            except asyncio.TimeoutError:
+                if not ticket.granted.done():
+                    self._withdraw(ticket)
+                    self._reject("queue_timeout")
+            except asyncio.CancelledError:
+                # 客户端在排队期间断开
+                if ticket.granted.done():
+                    self.release(ticket)
+                else:
+                    self._withdraw(ticket)
+                raise
+        ADMISSION_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - enqueued)
+        return ticket
+
+    def _withdraw(self, ticket: Ticket):
+        self._waiting.remove(ticket)
+        self._session_queued[ticket.session_id] -= 1
+        if not self._session_queued[ticket.session_id]:
+            del self._session_queued[ticket.session_id]
+        self._prune_finish_tags()
+        self._update_gauges()
+
+    def release(self, ticket: Ticket):
+        """归还名额 (幂等)"""
+        if ticket.released:
+            return
+        ticket.released = True
+        held = time.perf_counter() - ticket.acquired_at
+        self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+        self._active -= 1
+        self._session_active[ticket.session_id] -= 1
+        if not self._session_active[ticket.session_id]:
+            del self._session_active[ticket.session_id]
+        self._dispatch()
+
+
+admission = AdmissionController()
+
+
+class BodySizeLimitMiddleware:
+    """
+    纯 ASGI 中间件：对指定路径前缀限制请求体大小。
+    先检查 Content-Length (直接返回 413)；分块传输时边读边计数，超限时抛出 413。
+    """
+
+    def __init__(self, app, max_bytes: int, path_prefixes: Tuple[str, ...]):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefixes = path_prefixes
+
+    async def _reject(self, send):
+        ADMISSION_REJECTED.labels("body_too_large").inc()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": b'{"detail":"Request body too large"}'})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0 or not scope["path"].startswith(self.path_prefixes):
+            return await self.app(scope, receive, send)
+
+        for name, value in scope.get("headers") or []:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                return await self._reject(send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # 由 FastAPI 在读取请求体时原样抛出，经异常处理器转换为 413 响应
+                    ADMISSION_REJECTED.labels("body_too_large").inc()
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
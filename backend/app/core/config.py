@@ -2,6 +2,7 @@
 应用配置管理文件 - Google Standard Refactor (CORS Enabled)
 """
 import os
+from typing import Any, Dict
 from dotenv import load_dotenv
 
 # 修正：.env 在 backend 目录下
@@ -26,11 +27,98 @@ class Settings(BaseSettings):
     upload_dir: str = "./uploads"
     
     deepseek_api_key: str = ""
+    deepseek_base_url: str = "https://api.deepseek.com"
+    # [New] 会话历史后端: "redis" | "memory" (进程内，仅用于本地开发/基准测试)
+    chat_history_backend: str = "redis"
     embedding_model_name: str = "moka-ai/m3e-base"
+    # [New] Embedding 运行时: "huggingface" (PyTorch，默认) | "onnx" (ONNX Runtime + int8 动态量化，实验性；启用前先运行 benchmarks.embedding_parity)
+    embedding_runtime: str = "huggingface"
+    embedding_batch_size: int = 32
+    onnx_model_dir: str = "./models/onnx"
+    onnx_quantize: bool = True
+    onnx_intra_op_threads: int = 0  # 0 = 由 ONNX Runtime 自动决定
     milvus_host: str = "milvus" 
     milvus_port: str = "19530"
-    milvus_collection: str = "chatppt_rag_v1"
-    
+    # v2: 精简 schema (chunk_id + file_id + 向量)，文本与元数据存于本地切片存储
+    milvus_collection: str = "chatppt_rag_v2"
+    # [New] 知识库本地状态目录 (文件元数据 rag_metadata.json、墓碑 rag_tombstones.json)
+    # 与切片存储一样必须持久化 (容器内挂载卷)，且只能由单个后端进程写入
+    rag_data_dir: str = "."
+    # [New] 本地切片存储 (内存映射的追加写文件) 的目录与热点切片 LRU 容量
+    chunk_store_dir: str = "./chunk_store"
+    chunk_store_cache_size: int = 4096
+
+    # [New] RAG 上下文打包: 过量召回 -> MMR 去冗余 -> token 预算 (按所选文件平均分配)
+    rag_fetch_k: int = 24
+    rag_max_chunks: int = 8
+    rag_context_token_budget: int = 1800
+    rag_mmr_lambda: float = 0.6
+
+    # [New] 批量入库: 解析进程数 (0 = min(4, CPU 核数))、编码批大小、单次写入条数、单请求文件数上限
+    rag_parse_workers: int = 0
+    rag_embed_batch_size: int = 256
+    rag_insert_batch_size: int = 1000
+    rag_bulk_max_files: int = 50
+
+    # [New] 知识库生命周期: 会话闲置 TTL (0 = 不过期)、后台清理间隔、
+    # 单条删除表达式包含的 file_id 数、向量集合压缩间隔 (0 = 关闭)
+    rag_session_ttl_seconds: int = 7 * 24 * 3600
+    rag_sweep_interval_seconds: float = 60.0
+    rag_delete_batch_size: int = 200
+    rag_compact_interval_seconds: float = 6 * 3600
+
+    # [New] 流式生成准入控制: 全局并发、单会话并发/排队上限、全局队列长度、排队超时、请求体上限
+    admission_max_active_streams: int = 16
+    admission_session_max_active: int = 2
+    admission_session_max_queued: int = 4
+    admission_max_queue: int = 64
+    admission_queue_timeout_seconds: float = 30.0
+    stream_max_body_bytes: int = 1024 * 1024
+
+    # [New] 可续传生成流: 后端 ("redis" | "memory") 与生成结束后的回放保留时间 (秒)
+    stream_backend: str = "redis"
+    stream_replay_ttl_seconds: int = 600
+    # 最后一个订阅者断开后等待重连的宽限期 (秒)，超时即取消生成并中止上游请求；0 = 断开立即取消
+    stream_disconnect_grace_seconds: float = 10.0
+
+    # [New] 配图服务: 关键词解析器、扩展词典 (JSON)、图片来源模板、预生成尺寸、下载超时、缓存上限
+    image_keyword_provider: str = "dictionary"
+    image_keyword_dict_path: str = ""
+    image_source_url: str = "https://loremflickr.com/{width}/{height}/{keyword}?lock={lock}"
+    image_variants: str = "1280x720,800x600,400x300"
+    image_fetch_timeout_seconds: float = 10.0
+    # 本地图片缓存上限 (MB)，由后台维护任务按最近使用时间淘汰；0 = 不限制
+    image_cache_max_mb: float = 1024
+
+    # [New] 幻灯片 JSON 修复: 输出被截断时最多请求续写的轮数 (0 = 只做本地补全) 及每轮续写的 token 上限
+    slide_continuation_max_rounds: int = 1
+    slide_continuation_max_tokens: int = 2048
+
+    # [New] 模型路由: 路由名 -> {model, base_url, api_key, temperature, max_tokens, fallback}
+    # (JSON，环境变量 LLM_ROUTES；未填写的 model/base_url/api_key 沿用 deepseek_*)。
+    # 轻量修改走 llm_route_light，整份生成/重写走 llm_route_heavy；路由未配置时使用 llm_route_default。
+    # 例: {"primary": {"model": "deepseek-chat"}, "fast": {"model": "qwen-turbo", "base_url": "...", "fallback": "primary"}}
+    llm_routes: Dict[str, Dict[str, Any]] = {"primary": {"model": "deepseek-chat"}}
+    llm_route_default: str = "primary"
+    llm_route_light: str = "fast"
+    llm_route_heavy: str = "primary"
+    routing_enabled: bool = True
+    # 轻量请求的判定阈值: 指令字符数、涉及的幻灯片页数、当前幻灯片 JSON 的估算 token 数
+    routing_light_max_chars: int = 60
+    routing_light_max_slides: int = 2
+    routing_light_max_deck_tokens: int = 4000
+
+    # [New] 后台预热 RAG (模型加载/Milvus 连接) 失败后的重试间隔 (秒)
+    rag_warmup_retry_seconds: float = 10.0
+
+    # [New] 按需剖析 / 慢请求追踪 (追踪文件写入 {output_dir}/traces)
+    profiling_enabled: bool = False           # 是否响应 X-Profile 头 / ?profile=1 (另需 admin_token)
+    profile_slow_threshold_ms: float = 0      # >0 时记录超过阈值的请求 (仅阶段耗时)
+    profile_sample_interval_ms: float = 5.0
+    profile_loop_block_ms: float = 50.0       # 事件循环阻塞上报阈值
+    profile_max_traces: int = 50
+    admin_token: str = ""                     # 为空时 /admin 接口与剖析触发均关闭；否则需携带 X-Admin-Token
+
     class Config:
         case_sensitive = False
         env_file = ".env"
@@ -0,0 +1,178 @@
+"""
+Prometheus 指标定义 - 由 /metrics 暴露
+"""
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "chatppt_stage_duration_seconds",
+    "Duration of a request processing stage",
+    ["operation", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_TTFT_SECONDS = Histogram(
+    "chatppt_llm_ttft_seconds",
+    "Upstream LLM time to first token",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_TOKENS_PER_SECOND = Histogram(
+    "chatppt_llm_tokens_per_second",
+    "Upstream LLM streaming rate after the first token (estimated tokens)",
+    ["operation"],
+    buckets=(5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500),
+)
+
+LLM_OUTPUT_TOKENS = Counter(
+    "chatppt_llm_output_tokens_total",
+    "Estimated tokens streamed from the LLM",
+    ["operation"],
+)
+
+LLM_PROMPT_CACHE_TOKENS = Counter(
+    "chatppt_llm_prompt_cache_tokens_total",
+    "Prompt tokens reported by the provider as prefix-cache hits / misses",
+    ["operation", "result"],
+)
+
+LLM_PROMPT_CACHE_HIT_RATIO = Histogram(
+    "chatppt_llm_prompt_cache_hit_ratio",
+    "Per-request share of prompt tokens served from the provider prefix cache",
+    ["operation"],
+    buckets=(0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 1.0),
+)
+
+LLM_ROUTE_REQUESTS = Counter(
+    "chatppt_llm_route_requests_total",
+    "Generation attempts per model route and outcome",
+    ["operation", "route", "status"],
+)
+
+LLM_ROUTE_LATENCY_SECONDS = Histogram(
+    "chatppt_llm_route_latency_seconds",
+    "Upstream LLM latency per model route (phase: ttft / total)",
+    ["operation", "route", "phase"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_ROUTE_FALLBACKS = Counter(
+    "chatppt_llm_route_fallbacks_total",
+    "Requests retried on the fallback route after the routed model failed before its first token",
+    ["operation", "route", "fallback"],
+)
+
+PROMPT_TOKENS = Histogram(
+    "chatppt_prompt_tokens",
+    "Estimated prompt size of the final user turn (excluding history)",
+    ["operation"],
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000),
+)
+
+RAG_CHUNKS_RETRIEVED = Histogram(
+    "chatppt_rag_chunks_retrieved",
+    "Number of knowledge base chunks injected into a prompt",
+    ["operation"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34),
+)
+
+GENERATION_CANCELLED = Counter(
+    "chatppt_generation_cancelled_total",
+    "Generations cancelled before completion",
+    ["operation", "reason"],
+)
+
+ADMISSION_ACTIVE = Gauge(
+    "chatppt_admission_active_streams",
+    "Generation streams currently holding an admission slot",
+)
+
+ADMISSION_QUEUED = Gauge(
+    "chatppt_admission_queued_requests",
+    "Generation requests waiting in the fair queue",
+)
+
+ADMISSION_QUEUE_WAIT_SECONDS = Histogram(
+    "chatppt_admission_queue_wait_seconds",
+    "Time spent in the fair queue before a stream is admitted",
+    buckets=LATENCY_BUCKETS,
+)
+
+ADMISSION_REJECTED = Counter(
+    "chatppt_admission_rejected_total",
+    "Requests rejected by admission control",
+    ["reason"],
+)
+
+INGEST_CHUNKS = Counter(
+    "chatppt_ingest_chunks_total",
+    "Chunks written to the vector store",
+)
+
+INGEST_DEDUP_HITS = Counter(
+    "chatppt_ingest_dedup_hits_total",
+    "Uploaded files attached to already-indexed content (no parse / embed)",
+)
+
+RAG_SESSIONS_EXPIRED = Counter(
+    "chatppt_rag_sessions_expired_total",
+    "Knowledge-base sessions removed by the TTL sweeper",
+)
+
+RAG_VECTOR_FILES_PURGED = Counter(
+    "chatppt_rag_vector_files_purged_total",
+    "Tombstoned file ids whose vectors were deleted from the vector store",
+)
+
+RAG_TOMBSTONES_PENDING = Gauge(
+    "chatppt_rag_tombstones_pending",
+    "File ids waiting for a batched vector delete",
+)
+
+RAG_SWEEP_SECONDS = Histogram(
+    "chatppt_rag_sweep_duration_seconds",
+    "Duration of one maintenance sweep (expire + flush + compaction)",
+    buckets=LATENCY_BUCKETS,
+)
+
+RAG_COMPACTIONS = Counter(
+    "chatppt_rag_compactions_total",
+    "Vector collection compactions triggered",
+)
+
+INGEST_CHUNKS_PER_SECOND = Histogram(
+    "chatppt_ingest_chunks_per_second",
+    "Per-upload ingestion rate (parse + embed + insert)",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+
+CHUNK_STORE_LOOKUPS = Counter(
+    "chatppt_chunk_store_lookups_total",
+    "Chunk text lookups by LRU cache result",
+    ["result"],
+)
+
+GENERATION_REQUESTS = Counter(
+    "chatppt_generation_requests_total",
+    "Streaming generation requests by outcome",
+    ["operation", "status"],
+)
+
+SLIDE_REPAIRS = Counter(
+    "chatppt_slide_repairs_total",
+    "Generated slide JSON by validation outcome (valid / repaired / refusal / failed)",
+    ["operation", "outcome"],
+)
+
+SLIDE_CONTINUATIONS = Counter(
+    "chatppt_slide_continuations_total",
+    "Continuation requests for truncated slide JSON by outcome",
+    ["operation", "outcome"],
+)
+
+
+def render_metrics():
+    """返回 (payload, content_type)"""
+    return generate_latest(), CONTENT_TYPE_LATEST
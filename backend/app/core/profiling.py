@@ -0,0 +1,308 @@
+"""
+请求级按需剖析 (On-demand Profiling) 与慢请求追踪
+
+触发方式：
+- 请求头 `X-Profile: 1` 或查询参数 `?profile=1`：对该请求启动采样剖析 + 事件循环阻塞监测
+  (需 settings.profiling_enabled 且配置了 admin_token，请求同时携带匹配的 X-Admin-Token)
+- 请求耗时超过 settings.profile_slow_threshold_ms：仅记录阶段耗时 (无采样开销)
+
+采样器按线程分类而非按请求过滤，因此剖析请求之间串行执行，避免两份追踪互相计入对方的样本；
+同一时段内未剖析的普通请求仍可能出现在事件循环样本中。
+
+追踪文件写入 {output_dir}/traces/，包含阶段耗时、循环阻塞报告，以及
+事件循环线程上 busy/idle 与线程池 (off-loop) 的采样分布和热点栈。
+未触发时每个请求只多一次头部检查与一次计时比较。
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from app.core.config import settings
+from app.core.timing import current_timer
+
+logger = logging.getLogger(__name__)
+
+TRACE_DIR_NAME = "traces"
+
+# 线程池 worker 的线程名前缀 (asyncio.to_thread / starlette run_in_threadpool)
+_WORKER_THREAD_PREFIXES = ("asyncio_", "AnyIO worker thread", "ThreadPoolExecutor")
+_IDLE_WAIT_FILES = ("threading.py", "queue.py", os.path.join("concurrent", "futures", "thread.py"))
+_LOOP_IDLE_FUNCS = {"run", "run_forever", "run_until_complete"}
+
+
+def trace_dir() -> str:
+    return os.path.join(settings.output_dir, TRACE_DIR_NAME)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+def _folded_stack(frame, depth: int = 24) -> str:
+    """折叠栈 (root;...;leaf)，可直接用于火焰图工具"""
+    labels = []
+    while frame is not None and len(labels) < depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _loop_is_idle(frame) -> bool:
+    filename = frame.f_code.co_filename
+    if filename.endswith("selectors.py"):
+        return True
+    # uvloop 在 C 层等待 I/O，空闲时栈顶停留在启动事件循环的 Python 帧
+    return frame.f_code.co_name in _LOOP_IDLE_FUNCS and "asyncio" in filename
+
+
+def _worker_is_idle(frame) -> bool:
+    return frame.f_code.co_filename.endswith(_IDLE_WAIT_FILES)
+
+
+class StackSampler(threading.Thread):
+    """
+    以固定间隔采样所有线程的栈：
+    - loop_busy: 事件循环线程正在执行 Python 代码 (阻塞循环)
+    - loop_idle: 事件循环线程在等待 I/O
+    - off_loop: 线程池 worker 正在执行 (不阻塞循环)
+    """
+
+    def __init__(self, loop_thread_id: int, interval_ms: float):
+        super().__init__(daemon=True, name="chatppt-profiler")
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval_ms / 1000
+        self.samples = 0
+        self.counts: Counter = Counter()
+        self.stacks: Dict[str, Counter] = {"loop_busy": Counter(), "off_loop": Counter()}
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                if thread_id == self.loop_thread_id:
+                    category = "loop_idle" if _loop_is_idle(frame) else "loop_busy"
+                elif names.get(thread_id, "").startswith(_WORKER_THREAD_PREFIXES):
+                    if _worker_is_idle(frame):
+                        continue
+                    category = "off_loop"
+                else:
+                    continue
+                self.counts[category] += 1
+                if category in self.stacks:
+                    self.stacks[category][_folded_stack(frame)] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join(timeout=1)
+
+    def report(self, top: int = 15) -> dict:
+        interval_ms = self.interval * 1000
+        return {
+            "interval_ms": interval_ms,
+            "samples": self.samples,
+            "loop_busy_ms": round(self.counts["loop_busy"] * interval_ms, 1),
+            "loop_idle_ms": round(self.counts["loop_idle"] * interval_ms, 1),
+            "off_loop_ms": round(self.counts["off_loop"] * interval_ms, 1),
+            "top_loop_busy_stacks": self.stacks["loop_busy"].most_common(top),
+            "top_off_loop_stacks": self.stacks["off_loop"].most_common(top),
+        }
+
+
+class LoopLagMonitor:
+    """周期性 sleep 并测量超时量：超出部分即事件循环被阻塞的时长"""
+
+    def __init__(self, interval_ms: float, threshold_ms: float):
+        self.interval = interval_ms / 1000
+        self.threshold_ms = threshold_ms
+        self.started = time.perf_counter()
+        self.max_lag_ms = 0.0
+        self.blocked_ms = 0.0
+        self.events: List[Dict[str, float]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._sleep_started = self.started
+
+    def _observe(self, now: float):
+        lag_ms = (now - self._sleep_started - self.interval) * 1000
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        if lag_ms >= self.threshold_ms:
+            self.blocked_ms += lag_ms
+            self.events.append({
+                "at_ms": round((self._sleep_started - self.started) * 1000, 1),
+                "lag_ms": round(lag_ms, 1),
+            })
+
+    async def _run(self):
+        while True:
+            self._sleep_started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._observe(time.perf_counter())
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            # 请求末尾的阻塞可能让监测任务来不及醒来，这里补记最后一次等待
+            self._observe(time.perf_counter())
+            self._task.cancel()
+
+    def report(self) -> dict:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "blocked_ms": round(self.blocked_ms, 1),
+            "events": self.events[:200],
+        }
+
+
+_TRUTHY = ("1", "true")
+
+
+def admin_token_valid(token: Optional[str]) -> bool:
+    """admin_token 未配置时一律拒绝；比较使用常量时间"""
+    if not settings.admin_token or not token:
+        return False
+    return hmac.compare_digest(token.encode(), settings.admin_token.encode())
+
+
+def _profile_requested(scope) -> Optional[str]:
+    """剖析标记仅对携带有效 X-Admin-Token 的请求生效"""
+    headers = {}
+    for name, value in scope.get("headers") or []:
+        if name in (b"x-profile", b"x-admin-token"):
+            headers[name] = value.decode("latin-1")
+    if not admin_token_valid(headers.get(b"x-admin-token")):
+        return None
+
+    if headers.get(b"x-profile", "").lower() in _TRUTHY:
+        return "header"
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if any(value.lower() in _TRUTHY for value in query.get("profile", [])):
+        return "query"
+    return None
+
+
+def _write_trace(trace: dict) -> str:
+    directory = trace_dir()
+    os.makedirs(directory, exist_ok=True)
+    name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{trace['id']}.json"
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+        json.dump(trace, f, ensure_ascii=False, indent=2)
+
+    # 仅保留最近 N 份
+    files = sorted(f for f in os.listdir(directory) if f.endswith(".json"))
+    for old in files[:-settings.profile_max_traces]:
+        os.remove(os.path.join(directory, old))
+    return name
+
+
+def list_traces() -> List[dict]:
+    directory = trace_dir()
+    if not os.path.isdir(directory):
+        return []
+    traces = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        traces.append({
+            "name": name,
+            "size": os.path.getsize(path),
+            "trigger": data.get("trigger"),
+            "method": data.get("method"),
+            "path": data.get("path"),
+            "duration_ms": data.get("duration_ms"),
+            "created": data.get("created"),
+        })
+    return traces
+
+
+class ProfilingMiddleware:
+    """
+    纯 ASGI 中间件，需位于 ServerTimingMiddleware 之内 (以读取请求的 StageTimer)。
+    请求结束以响应体发送完毕为准，流式响应 (SSE) 的整个生命周期都会被覆盖。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # 同一时刻只允许一个剖析中的请求 (采样器覆盖全部线程)
+        self._profile_lock = asyncio.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trigger = _profile_requested(scope) if settings.profiling_enabled else None
+        threshold_ms = settings.profile_slow_threshold_ms
+        if trigger is None and threshold_ms <= 0:
+            return await self.app(scope, receive, send)
+
+        if trigger:
+            async with self._profile_lock:
+                return await self._observe(scope, receive, send, trigger, threshold_ms)
+        return await self._observe(scope, receive, send, trigger, threshold_ms)
+
+    async def _observe(self, scope, receive, send, trigger: Optional[str], threshold_ms: float):
+        started = time.perf_counter()
+        sampler = monitor = None
+        if trigger:
+            sampler = StackSampler(threading.get_ident(), settings.profile_sample_interval_ms)
+            sampler.start()
+            monitor = LoopLagMonitor(settings.profile_sample_interval_ms, settings.profile_loop_block_ms)
+            monitor.start()
+
+        status = {"code": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if sampler:
+                sampler.stop()
+                monitor.stop()
+            if trigger is None and duration_ms >= threshold_ms:
+                trigger = "slow"
+            if trigger:
+                trace = {
+                    "id": uuid.uuid4().hex[:12],
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "trigger": trigger,
+                    "method": scope.get("method"),
+                    "path": scope.get("path"),
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status["code"],
+                    "duration_ms": round(duration_ms, 1),
+                    "stages": current_timer().as_dict(),
+                    "profile": sampler.report() if sampler else None,
+                    "loop_blocking": monitor.report() if monitor else None,
+                }
+                try:
+                    name = await asyncio.to_thread(_write_trace, trace)
+                    logger.info(f"[Profile] {trigger} trace for {trace['path']} -> {name}")
+                except OSError as e:
+                    logger.warning(f"[Profile] Failed to write trace: {e}")
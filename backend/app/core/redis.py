@@ -0,0 +1,32 @@
+"""
+Redis 异步客户端 (进程级单例)
+"""
+from typing import Optional
+from app.core.config import settings
+
+_client = None
+
+
+def get_redis():
+    """获取共享的 redis.asyncio 客户端 (首次调用时创建，连接按需建立)"""
+    global _client
+    if _client is None:
+        import redis.asyncio as aioredis
+        _client = aioredis.from_url(settings.redis_url, decode_responses=True)
+    return _client
+
+
+async def ping_redis(timeout: float = 1.0) -> bool:
+    """探测 Redis 连通性"""
+    import asyncio
+    try:
+        return bool(await asyncio.wait_for(get_redis().ping(), timeout=timeout))
+    except Exception:
+        return False
+
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
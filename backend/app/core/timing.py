@@ -0,0 +1,141 @@
+"""
+请求级分阶段计时 (Stage Timing)
+
+- 每个 HTTP 请求由 ServerTimingMiddleware 绑定一个 StageTimer (ContextVar)
+- 服务层通过 `with stage("vector_search"):` 记录阶段耗时，同时写入 Prometheus 直方图
+- 普通响应携带 Server-Timing 头；SSE 流在结束前追加一条 timing 事件
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, AsyncIterator
+
+from app.core.metrics import STAGE_SECONDS, LLM_TTFT_SECONDS, LLM_TOKENS_PER_SECOND, LLM_OUTPUT_TOKENS
+from app.core.tokens import estimate_tokens
+
+
+class StageTimer:
+    """累积记录各阶段耗时 (毫秒)，同名阶段多次出现时累加"""
+
+    def __init__(self, operation: str = "http"):
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        # [New] 上游 LLM 的 token 用量 (含提示词缓存命中)，随 SSE timing 事件下发
+        self.usage: Dict[str, int] = {}
+
+    def add_usage(self, name: str, tokens: int):
+        self.usage[name] = self.usage.get(name, 0) + tokens
+
+    def record(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+        STAGE_SECONDS.labels(self.operation, name).observe(seconds)
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        data = {name: round(ms, 2) for name, ms in self.stages.items()}
+        data["total"] = round(self.elapsed_ms(), 2)
+        return data
+
+    def server_timing(self) -> str:
+        """RFC Server-Timing 头格式: `stage;dur=12.3, other;dur=4.5`"""
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.stages.items())
+
+
+_current_timer: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+
+
+def current_timer() -> StageTimer:
+    """返回当前上下文的计时器；不在请求上下文中 (后台任务/基准脚本) 时新建并绑定一个"""
+    timer = _current_timer.get()
+    if timer is None:
+        timer = StageTimer("background")
+        _current_timer.set(timer)
+    return timer
+
+
+def bind_timer(timer: StageTimer):
+    return _current_timer.set(timer)
+
+
+def start_operation(operation: str) -> StageTimer:
+    """标记当前请求的业务操作名 (outline/content/upload...)，用作指标标签"""
+    timer = current_timer()
+    timer.operation = operation
+    return timer
+
+
+@contextmanager
+def stage(name: str):
+    with current_timer().span(name):
+        yield
+
+
+async def track_llm_stream(stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    透传 LLM 流，记录上游 TTFT (扣除期间的会话历史加载) 与首 token 之后的出 token 速率。
+    """
+    timer = current_timer()
+    operation = timer.operation
+    started = time.perf_counter()
+    history_before = timer.stages.get("history_load", 0.0)
+    first_token_at = None
+    tokens = 0
+
+    async for text in stream:
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+            history_ms = timer.stages.get("history_load", 0.0) - history_before
+            ttft = max(first_token_at - started - history_ms / 1000, 0.0)
+            timer.record("llm_ttft", ttft)
+            LLM_TTFT_SECONDS.labels(operation).observe(ttft)
+        tokens += estimate_tokens(text)
+        yield text
+
+    if first_token_at is not None:
+        streaming = time.perf_counter() - first_token_at
+        timer.record("llm_stream", streaming)
+        LLM_OUTPUT_TOKENS.labels(operation).inc(tokens)
+        if streaming > 0:
+            LLM_TOKENS_PER_SECOND.labels(operation).observe(tokens / streaming)
+
+
+class ServerTimingMiddleware:
+    """
+    纯 ASGI 中间件：为每个 HTTP 请求绑定 StageTimer，并在响应头中写入 Server-Timing。
+    (流式响应的头在流开始前发送，只包含此前完成的阶段；完整数据见 SSE timing 事件)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timer = StageTimer()
+        token = bind_timer(timer)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = timer.server_timing()
+                total = f"total;dur={timer.elapsed_ms():.1f}"
+                value = f"{header}, {total}" if header else total
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"server-timing", value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timer.reset(token)
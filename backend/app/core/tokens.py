@@ -0,0 +1,18 @@
+"""
+Token 数估算 - 无需加载分词器的快速近似
+"""
+import re
+
+_CJK = re.compile(r'[　-〿㐀-䶿一-鿿＀-￯]')
+
+# DeepSeek 官方换算：1 个中文字符 ≈ 0.6 token，1 个英文字符 ≈ 0.3 token
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    other = len(text) - cjk
+    return int(cjk * CJK_TOKENS_PER_CHAR + other * OTHER_TOKENS_PER_CHAR) + 1
@@ -1,29 +1,92 @@
 """
 FastAPI Application Entry Point
 """
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from app.core.config import settings
+from app.core.metrics import render_metrics
+from app.core.timing import ServerTimingMiddleware
+from app.core.profiling import ProfilingMiddleware
+from app.core.admission import BodySizeLimitMiddleware
+from app.core.redis import ping_redis, close_redis
 from app.routers import router
+from app.routers import generation
 from app.services.rag import rag_service
+from app.services.ingest import shutdown_parse_pool
+from app.services.stream_broker import broker
+from app.services.images import image_service
+
+logger = logging.getLogger(__name__)
+
+# 启动阶段耗时 (秒)，按阶段记录
+startup_timings = {"import_app": round(time.perf_counter() - _IMPORT_STARTED, 3)}
+
+async def _warm_up():
+    """
+    [Perf] 后台预热：先初始化 LLM 生成服务 (非 RAG 大纲可立即服务)，
+    再加载 Embedding 模型并连接 Milvus。失败时按间隔重试，直到就绪。
+    """
+    started = time.perf_counter()
+    await asyncio.to_thread(generation.init_services)
+    startup_timings["init_generators"] = round(time.perf_counter() - started, 3)
+    logger.info(f"[STARTUP] Generators ready in {startup_timings['init_generators']:.3f}s")
+
+    started = time.perf_counter()
+    while True:
+        try:
+            await asyncio.to_thread(rag_service.initialize)
+            break
+        except Exception as e:
+            print(f"[ERROR] RAG warm-up failed, retry in {settings.rag_warmup_retry_seconds}s: {e}")
+            await asyncio.sleep(settings.rag_warmup_retry_seconds)
+    startup_timings["init_rag"] = round(time.perf_counter() - started, 3)
+    print(f"[STARTUP] Warm-up complete. Timings: {startup_timings} RAG: {rag_service.startup_timings}")
+
+async def _maintenance():
+    """后台维护：定期过期闲置会话、批量删除墓碑向量、压缩集合，并按上限淘汰图片缓存"""
+    while True:
+        await asyncio.sleep(settings.rag_sweep_interval_seconds)
+        try:
+            await asyncio.to_thread(image_service.prune_cache)
+        except Exception as e:
+            logger.warning(f"[Warn] Image cache prune failed: {e}")
+        if not rag_service.is_ready:
+            continue
+        try:
+            await asyncio.to_thread(rag_service.sweep)
+        except Exception as e:
+            logger.warning(f"[Warn] RAG sweep failed: {e}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # [Startup]
-    print(f"[STARTUP] {settings.app_name} is starting up...")
-    try:
-        rag_service.initialize()
-    except Exception as e:
-        print(f"[ERROR] Critical Error during startup: {e}")
-    
+    # [Startup] 不再阻塞在模型加载上，立即开始接收请求
+    print(f"[STARTUP] {settings.app_name} is starting up... (import {startup_timings['import_app']:.3f}s)")
+    warmup_task = asyncio.create_task(_warm_up())
+    maintenance_task = asyncio.create_task(_maintenance())
+    # 接收其他 worker 转发的取消请求 (生产者只能在持有它的进程内被取消)
+    cancel_listener = asyncio.create_task(broker.listen_cancels())
+
     yield
-    
+
     # [Shutdown]
     print(f"[SHUTDOWN] {settings.app_name} is shutting down...")
+    warmup_task.cancel()
+    maintenance_task.cancel()
+    cancel_listener.cancel()
+    broker.cancel_all("shutdown")
+    shutdown_parse_pool()
+    await image_service.close()
+    await close_redis()
 
 app = FastAPI(
-    title=settings.app_name, 
+    title=settings.app_name,
     debug=settings.debug,
     lifespan=lifespan
 )
@@ -36,9 +99,17 @@ app.add_middleware(
     allow_origins=origins_list,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
+    allow_headers=["Content-Type", "Authorization", "X-Requested-With", "X-Profile", "Last-Event-ID"],
+    expose_headers=["Retry-After", "X-Generation-Id"],
 )
 
+# [Protection] 生成接口的请求体大小上限 (在 JSON 解析前拒绝)
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=settings.stream_max_body_bytes, path_prefixes=("/api/v1/stream",))
+
+# [Observability] 按需剖析 (内层，读取请求计时器) + 请求级阶段计时 / Server-Timing 响应头 (外层)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+
 app.include_router(router, prefix="/api/v1")
 
 @app.get("/")
@@ -47,4 +118,39 @@ def read_root():
 
 @app.get("/health")
 def health_check():
+    """Liveness: 进程存活即返回 200，不检查依赖"""
     return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 生成服务已初始化、Embedding 模型已加载、Milvus 与 Redis 可达"""
+    milvus_ok = False
+    if rag_service.is_ready:
+        try:
+            milvus_ok = await asyncio.wait_for(
+                asyncio.to_thread(rag_service.ping_vector_store), timeout=2.0
+            )
+        except asyncio.TimeoutError:
+            milvus_ok = False
+
+    checks = {
+        "generators": generation.services_ready(),
+        "embedding_model": rag_service.is_model_ready,
+        "milvus": milvus_ok,
+        "redis": await ping_redis(),
+    }
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "checks": checks,
+            "startup_timings": {**startup_timings, **rag_service.startup_timings},
+        },
+    )
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus 抓取端点"""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
@@ -1,9 +1,13 @@
 from fastapi import APIRouter
-from . import generation, rag # [Modified] 引入新的 rag 路由模块
+from . import generation, rag, admin, images # [Modified] 引入新的 rag 路由模块
 # 创建主路由实例
 router = APIRouter()
 
 # 仅保留 AI 生成路由
 router.include_router(generation.router, tags=["Conversational Generation (Async)"])
 # [New] 包含 RAG 知识库路由，URL 前缀设置为 /rag
-router.include_router(rag.router, prefix="/rag", tags=["Knowledge Base"])
\ No newline at end of file
+router.include_router(rag.router, prefix="/rag", tags=["Knowledge Base"])
+# [New] 配图服务 (关键词解析 + 同源图片缓存)
+router.include_router(images.router, prefix="/images", tags=["Images"])
+# [New] 运维管理接口 (剖析追踪)
+router.include_router(admin.router, prefix="/admin", tags=["Admin"])
\ No newline at end of file
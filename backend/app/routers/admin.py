@@ -0,0 +1,54 @@
+"""
+运维管理接口 - 剖析追踪文件的列表与下载、知识库维护任务、准入队列状态
+"""
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Depends
+from fastapi.responses import FileResponse
+
+from app.core.config import settings
+from app.core.profiling import admin_token_valid, list_traces, trace_dir
+from app.core.admission import admission
+from app.services.rag import rag_service
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """未配置 settings.admin_token 时管理接口整体关闭 (404)，否则校验 X-Admin-Token"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not admin_token_valid(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/traces", response_model=List[dict])
+def get_traces():
+    """最近的剖析/慢请求追踪 (新到旧)"""
+    return list_traces()
+
+@router.get("/traces/{name}")
+def download_trace(name: str):
+    """下载单个追踪文件 (JSON)"""
+    if os.path.basename(name) != name or not name.endswith(".json"):
+        raise HTTPException(status_code=400, detail="Invalid trace name")
+    path = os.path.join(trace_dir(), name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return FileResponse(path=path, filename=name, media_type="application/json")
+
+@router.get("/admission")
+async def get_admission_state():
+    """生成准入队列的实时状态 (全局与各会话的执行/排队数)"""
+    return admission.snapshot()
+
+@router.get("/rag/sweep")
+def get_last_sweep():
+    """最近一次知识库清理的统计"""
+    return rag_service.last_sweep
+
+@router.post("/rag/sweep")
+def run_sweep():
+    """立即执行一次清理 (过期会话、批量删除向量、按间隔压缩)"""
+    if not rag_service.is_ready:
+        raise HTTPException(status_code=503, detail="RAG service not ready")
+    return rag_service.sweep()
@@ -3,8 +3,14 @@
 """
 import logging
 import json
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+import threading
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.core.admission import admission, AdmissionRejected, Ticket
+from app.core.tokens import estimate_tokens
+from app.services.stream_broker import broker, is_valid_event_id
 from app.services.outline import create_outline_generator
 from app.services.content import ContentGeneratorV1
 # [CTO Note]: Import updated from 'task' to 'generation'
@@ -16,57 +22,128 @@ logger = logging.getLogger(__name__)
 # 全局变量预定义
 outline_service = None
 content_service = None
+_init_lock = threading.Lock()
 
-# 初始化服务 (带容错)
-try:
-    outline_service = create_outline_generator()
-    content_service = ContentGeneratorV1()
-    logger.info("AI Services Initialized Successfully.")
-except Exception as e:
-    logger.critical(f"Service Init Failed: {e}")
+def init_services():
+    """
+    初始化 AI 生成服务 (带容错)。
+    [Perf] 不再在模块导入时执行：由 lifespan 后台预热，或在首个请求到达时按需创建。
+    """
+    global outline_service, content_service
+    with _init_lock:
+        if outline_service and content_service:
+            return
+        try:
+            outline_service = outline_service or create_outline_generator()
+            content_service = content_service or ContentGeneratorV1()
+            logger.info("AI Services Initialized Successfully.")
+        except Exception as e:
+            logger.critical(f"Service Init Failed: {e}")
+
+def services_ready() -> bool:
+    return bool(outline_service and content_service)
+
+async def _ensure_services():
+    if not services_ready():
+        await run_in_threadpool(init_services)
+
+async def _admit(session_id: str, *parts) -> Ticket:
+    """按预估 prompt token 进入公平队列；被拒绝时返回 429 + Retry-After"""
+    cost = sum(estimate_tokens(p if isinstance(p, str) else json.dumps(p, ensure_ascii=False)) for p in parts)
+    try:
+        return await admission.acquire(session_id, cost)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many concurrent generations ({e.reason}). Please retry later.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+async def _start_stream(stream, operation: str, ticket: Ticket) -> StreamingResponse:
+    """
+    生成在独立任务中运行 (断线不中断)，准入名额由生产者任务持有至生成结束。
+    响应只是生成流的订阅者；响应头 X-Generation-Id 与首条事件均携带 generation id。
+    """
+    try:
+        generation_id = await broker.start(operation, stream, lambda: admission.release(ticket))
+    except Exception as e:
+        admission.release(ticket)
+        logger.error(f"Failed to start generation: {e}")
+        raise HTTPException(status_code=503, detail="Stream backend unavailable.")
+    return StreamingResponse(
+        broker.events(generation_id),
+        media_type="text/event-stream",
+        headers={"X-Generation-Id": generation_id},
+    )
 
 @router.post("/stream/outline")
 async def stream_outline(request: ConversationalOutlineRequest):
     """SSE: 大纲生成 (保持不变)"""
+    await _ensure_services()
     if not outline_service:
         raise HTTPException(
             status_code=503, 
             detail="AI Service Unavailable. Please check backend logs."
         )
 
-    async def _generator():
-        stream = outline_service.generate_outline_stream(
-            session_id=request.session_id, 
-            user_input=request.user_message,
-            rag_file_ids=request.rag_file_ids 
-        )
-        async for token in stream:
-            payload = json.dumps({"text": token}, ensure_ascii=False)
-            yield f"data: {payload}\n\n"
-        yield "data: [DONE]\n\n"
-
-    return StreamingResponse(_generator(), media_type="text/event-stream")
+    ticket = await _admit(request.session_id, request.user_message)
+    stream = outline_service.generate_outline_stream(
+        session_id=request.session_id, 
+        user_input=request.user_message,
+        rag_file_ids=request.rag_file_ids 
+    )
+    return await _start_stream(stream, "outline", ticket)
 
 @router.post("/stream/content")
 async def stream_content(request: ConversationalContentRequest):
     """SSE: 内容生成/精修"""
+    await _ensure_services()
     if not content_service:
         raise HTTPException(
             status_code=503, 
             detail="AI Service Unavailable. Please check backend logs."
         )
 
-    async def _generator():
-        stream = content_service.generate_content_stream(
-            session_id=request.session_id,
-            user_input=request.user_message,
-            current_slides=request.current_slides,
-            # [New] 将 RAG 文件列表传递给服务层
-            rag_file_ids=request.rag_file_ids 
-        )
-        async for token in stream:
-            payload = json.dumps({"text": token}, ensure_ascii=False)
-            yield f"data: {payload}\n\n"
-        yield "data: [DONE]\n\n"
+    ticket = await _admit(request.session_id, request.user_message, request.current_slides)
+    stream = content_service.generate_content_stream(
+        session_id=request.session_id,
+        user_input=request.user_message,
+        current_slides=request.current_slides,
+        # [New] 将 RAG 文件列表传递给服务层
+        rag_file_ids=request.rag_file_ids 
+    )
+    return await _start_stream(stream, "content", ticket)
+
+@router.post("/stream/{generation_id}/cancel")
+async def cancel_stream(generation_id: str):
+    """
+    显式取消生成 (用户点击停止)
+    - 立即中止上游 LLM 请求并归还准入名额；本轮对话不写入会话历史
+    - 生产者在其他 worker 上时转发取消请求并返回 202 "cancelling"，结果以流中的 cancelled 事件为准
+    """
+    status = await broker.request_cancel(generation_id, "user")
+    if status is None:
+        raise HTTPException(status_code=404, detail="Generation not found or expired")
+    if status == "cancelling":
+        return JSONResponse(status_code=202, content={"id": generation_id, "status": status})
+    return {"id": generation_id, "status": status}
 
-    return StreamingResponse(_generator(), media_type="text/event-stream")
\ No newline at end of file
+@router.get("/stream/{generation_id}")
+async def resume_stream(
+    generation_id: str,
+    last_event_id: Optional[str] = Header(default=None),
+):
+    """
+    SSE: 断线续传
+    - 携带 Last-Event-ID 时只补发其后的事件，然后继续实时推送
+    - 生成结束后在 stream_replay_ttl_seconds 内仍可完整回放
+    """
+    if last_event_id and not is_valid_event_id(last_event_id):
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    if not await broker.exists(generation_id):
+        raise HTTPException(status_code=404, detail="Generation not found or expired")
+    return StreamingResponse(
+        broker.events(generation_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"X-Generation-Id": generation_id},
+    )
\ No newline at end of file
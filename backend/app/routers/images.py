@@ -0,0 +1,41 @@
+"""
+配图路由 - 关键词解析与内容寻址图片的同源分发
+"""
+import logging
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from app.services.images import image_service
+from app.schemas.images import ImageResolveRequest, ImageResolveResponse
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# 文件名即内容摘要，内容永不变化
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@router.post("/resolve", response_model=ImageResolveResponse)
+async def resolve_image(request: ImageResolveRequest):
+    """
+    配图解析接口
+    - image_prompt -> 关键词 (本地解析) -> 图片 (首次下载后缓存，之后直接命中)
+    """
+    try:
+        image = await image_service.resolve(request.prompt, request.width, request.height)
+    except Exception as e:
+        logger.warning(f"[Image] Resolve failed for '{request.prompt[:30]}': {e}")
+        raise HTTPException(status_code=502, detail="Image source unavailable")
+    return ImageResolveResponse(keyword=image.keyword, digest=image.digest, url=f"/api/v1/images/{image.name}")
+
+@router.get("/{name}")
+def get_image(name: str, request: Request):
+    """图片分发：强缓存 + ETag (If-None-Match 命中时返回 304)"""
+    path = image_service.local_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    etag = f'"{name.rsplit(".", 1)[0]}"'
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="image/jpeg", headers=headers)
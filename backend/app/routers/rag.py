@@ -6,7 +6,8 @@ from typing import List
 
 # 引入核心服务和数据契约
 from app.services.rag import rag_service
-from app.schemas.rag import RagFileResponse, RagDeleteResponse
+from app.schemas.rag import RagFileResponse, RagDeleteResponse, RagBulkUploadResponse, RagSessionDeleteResponse
+from app.core.config import settings
 
 router = APIRouter()
 
@@ -27,6 +28,25 @@ async def upload_document(
     # 注意：service 内部已实现 initialize 检查，未就绪会报错
     return await rag_service.handle_file_upload(file, session_id)
 
+@router.post("/upload/batch", response_model=RagBulkUploadResponse)
+async def upload_documents(
+    files: List[UploadFile] = File(...),
+    session_id: str = Form(...)
+):
+    """
+    批量上传接口
+    - 一个 multipart 请求携带多个文件 (字段名 files)
+    - 并行解析、共享批次向量化、分组写入；返回逐文件结果
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    if len(files) > settings.rag_bulk_max_files:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {settings.rag_bulk_max_files})")
+
+    results = await rag_service.handle_bulk_upload(files, session_id)
+    failed = sum(1 for r in results if r.status == "error")
+    return RagBulkUploadResponse(files=results, indexed=len(results) - failed, failed=failed)
+
 @router.get("/files", response_model=List[RagFileResponse])
 def list_documents(session_id: str):
     """
@@ -39,7 +59,16 @@ def list_documents(session_id: str):
 def delete_document(file_id: str):
     """
     删除文档接口
-    - 从向量库中物理删除指定文件的所有切片
+    - 立即从元数据中移除 (检索不可见)，向量由后台清理任务批量删除
     """
     rag_service.delete_file(file_id)
-    return RagDeleteResponse(id=file_id, status="deleted")
\ No newline at end of file
+    return RagDeleteResponse(id=file_id, status="deleted")
+
+@router.delete("/sessions/{session_id}", response_model=RagSessionDeleteResponse)
+def delete_session_documents(session_id: str):
+    """
+    删除会话知识库接口
+    - 一次移除该会话的全部文件，向量随后批量删除
+    """
+    removed = rag_service.delete_session(session_id)
+    return RagSessionDeleteResponse(session_id=session_id, files_removed=removed)
\ No newline at end of file
@@ -0,0 +1,14 @@
+"""
+配图服务数据模型
+"""
+from pydantic import BaseModel, Field
+
+class ImageResolveRequest(BaseModel):
+    prompt: str = Field(..., description="幻灯片的 image_prompt (或标题)")
+    width: int = Field(default=1280, ge=16, le=4096)
+    height: int = Field(default=720, ge=16, le=4096)
+
+class ImageResolveResponse(BaseModel):
+    keyword: str
+    digest: str
+    url: str  # 同源地址，内容不可变，可长期缓存
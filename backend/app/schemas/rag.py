@@ -2,7 +2,7 @@
 RAG 业务数据模型 - 定义知识库文件的交互结构
 """
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 
 class RagFileResponse(BaseModel):
     """
@@ -14,6 +14,19 @@ class RagFileResponse(BaseModel):
     size: int
     status: str  # enum: "indexed" | "uploading" | "error"
     upload_time: str
+    error: Optional[str] = None  # status == "error" 时的失败原因
+    deduplicated: bool = False  # 内容已入库，直接引用已有向量
+
+class RagSessionDeleteResponse(BaseModel):
+    session_id: str
+    files_removed: int
+    status: str = "deleted"
+
+class RagBulkUploadResponse(BaseModel):
+    """批量上传响应：逐文件结果 (单个文件失败不影响其他文件)"""
+    files: List[RagFileResponse]
+    indexed: int
+    failed: int
 
 class RagDeleteResponse(BaseModel):
     """删除操作响应"""
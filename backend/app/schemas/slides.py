@@ -0,0 +1,62 @@
+"""
+幻灯片数据模型 - LLM 输出的服务端校验
+字段校验尽量宽松：类型不符时就地转换，而不是整页丢弃。
+"""
+import re
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+_BULLET_PREFIX = re.compile(r"^\s*(?:[-*•·]|\d+[.)、])\s*")
+
+
+def _to_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, dict):
+        return " ".join(_to_text(v) for v in value.values() if v is not None)
+    if isinstance(value, (list, tuple)):
+        return " ".join(_to_text(v) for v in value)
+    return str(value).strip()
+
+
+class Slide(BaseModel):
+    """单页幻灯片 (未知字段原样保留，如 notes)"""
+    model_config = ConfigDict(extra="allow")
+
+    slide_type: str = Field(default="content", description="title / content")
+    title: str = ""
+    subtitle: Optional[str] = None
+    content: List[str] = Field(default_factory=list)
+    image_prompt: str = ""
+
+    @field_validator("slide_type", mode="before")
+    @classmethod
+    def _slide_type(cls, value):
+        text = _to_text(value).lower()
+        return text or "content"
+
+    @field_validator("title", "image_prompt", mode="before")
+    @classmethod
+    def _text(cls, value):
+        return _to_text(value)
+
+    @field_validator("subtitle", mode="before")
+    @classmethod
+    def _optional_text(cls, value):
+        if value is None:
+            return None
+        return _to_text(value) or None
+
+    @field_validator("content", mode="before")
+    @classmethod
+    def _content(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            lines = value.splitlines()
+        elif isinstance(value, (list, tuple)):
+            lines = [_to_text(v) for v in value]
+        else:
+            lines = [_to_text(value)]
+        return [_BULLET_PREFIX.sub("", line).strip() for line in lines if line and line.strip()]
@@ -0,0 +1,295 @@
+"""
+本地切片存储 - 追加写的内存映射文件 + 定长偏移索引
+
+向量库只保存 向量 + 整数 chunk_id + file_id (分区键)；切片文本与元数据只在本地存一份：
+- chunks.dat: 追加写的记录 (文本 UTF-8 字节 + 元数据紧凑 JSON)，读取时 mmap，无需 read 系统调用
+- chunks.idx: 定长索引项 (offset u64, text_len u32, meta_len u32)，按序号 O(1) 定位
+- chunk_id = epoch << 40 | 序号；epoch 在存储创建时随机生成，存储被重建后新 id 不会与向量库中的旧 id 冲突
+- 热点切片经 LRU 缓存，命中时不再解码
+写入顺序为 先数据后索引，启动时丢弃未完整写入的尾部，崩溃后索引与数据保持一致。
+
+回收：向量被删除后调用 delete_files 记录其 file_id (持久化到 deleted 日志)，compact 把仍存活的记录
+重写到新数据文件并更新索引偏移；被回收的序号保留为空洞索引项，chunk_id 不变，向量库无需改动。
+新文件就绪后写入 compact.ready 标记再替换，替换中途崩溃时启动会继续完成替换。
+
+并发：单写多读。写入与压缩持有写锁；读取不加锁，只读取一份不可变快照 (索引, 条目数, 映射)，
+写入/压缩完成后整体替换快照，旧映射在最后一个读者释放后回收。
+"""
+import json
+import logging
+import mmap
+import os
+import secrets
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.metrics import CHUNK_STORE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+DATA_FILE = "chunks.dat"
+INDEX_FILE = "chunks.idx"
+EPOCH_FILE = "epoch"
+DELETED_FILE = "deleted"
+COMPACT_SUFFIX = ".compact"
+COMPACT_MARKER = "compact.ready"
+_ENTRY = struct.Struct("<QII")
+_POSITION_BITS = 40
+# 已回收的索引项: text_len 取此值
+_RECLAIMED = 0xFFFFFFFF
+_RECLAIMED_ENTRY = _ENTRY.pack(0, _RECLAIMED, 0)
+
+
+def _load_epoch(path: str) -> int:
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return int(f.read().strip())
+    epoch = secrets.randbelow(2 ** 22 - 1) + 1
+    with open(path, "w") as f:
+        f.write(str(epoch))
+    return epoch
+
+
+def _write_synced(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class ChunkStore:
+    def __init__(self, directory: str, cache_size: int = 4096):
+        self.directory = directory
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[int, Tuple[str, dict]]" = OrderedDict()
+
+        os.makedirs(directory, exist_ok=True)
+        self._base = _load_epoch(os.path.join(directory, EPOCH_FILE)) << _POSITION_BITS
+        self._data_path = os.path.join(directory, DATA_FILE)
+        self._index_path = os.path.join(directory, INDEX_FILE)
+        self._deleted_path = os.path.join(directory, DELETED_FILE)
+        self._finish_compaction()
+        self._open_files()
+        index = bytearray(self._recover())
+        self._data_end = os.path.getsize(self._data_path)
+        # 读者快照: (索引, 条目数, 数据映射)
+        self._snapshot = (index, len(index) // _ENTRY.size, self._map())
+
+    def _open_files(self):
+        self._data = open(self._data_path, "a+b")
+        self._index_file = open(self._index_path, "a+b")
+
+    def _map(self) -> Optional[mmap.mmap]:
+        if not os.path.getsize(self._data_path):
+            return None
+        return mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _recover(self) -> bytes:
+        """截断不完整的索引项与索引未覆盖的数据尾部 (写入中途崩溃)"""
+        with open(self._index_path, "rb") as f:
+            index = f.read()
+        index = index[:len(index) - len(index) % _ENTRY.size]
+        data_size = os.path.getsize(self._data_path)
+        count = len(index) // _ENTRY.size
+        while count:
+            offset, text_len, meta_len = _ENTRY.unpack_from(index, (count - 1) * _ENTRY.size)
+            if text_len == _RECLAIMED or offset + text_len + meta_len <= data_size:
+                break
+            count -= 1
+        index = index[:count * _ENTRY.size]
+        end = 0
+        for position in range(count - 1, -1, -1):
+            offset, text_len, meta_len = _ENTRY.unpack_from(index, position * _ENTRY.size)
+            if text_len != _RECLAIMED:
+                end = offset + text_len + meta_len
+                break
+        if os.path.getsize(self._index_path) != len(index) or data_size != end:
+            logger.warning(f"[ChunkStore] Truncating incomplete tail ({count} chunks kept)")
+            os.truncate(self._index_path, len(index))
+            os.truncate(self._data_path, end)
+        return index
+
+    def _finish_compaction(self):
+        """标记存在则新文件已完整落盘：继续替换；否则丢弃未完成的压缩产物"""
+        marker = os.path.join(self.directory, COMPACT_MARKER)
+        pending = [(self._index_path + COMPACT_SUFFIX, self._index_path),
+                   (self._data_path + COMPACT_SUFFIX, self._data_path)]
+        if os.path.exists(marker):
+            for source, target in pending:
+                if os.path.exists(source):
+                    os.replace(source, target)
+            if os.path.exists(self._deleted_path):
+                os.truncate(self._deleted_path, 0)
+            os.remove(marker)
+            return
+        for source, _ in pending:
+            if os.path.exists(source):
+                os.remove(source)
+
+    def __len__(self) -> int:
+        return self._snapshot[1]
+
+    def append(self, texts: List[str], metadatas: List[dict]) -> List[int]:
+        """追加一批切片，返回分配的 chunk_id (连续递增)"""
+        payload = bytearray()
+        entries = bytearray()
+        with self._lock:
+            index, first_id, _ = self._snapshot
+            offset = self._data_end
+            for text, metadata in zip(texts, metadatas):
+                text_bytes = text.encode("utf-8")
+                meta_bytes = json.dumps(metadata, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                entries += _ENTRY.pack(offset, len(text_bytes), len(meta_bytes))
+                payload += text_bytes
+                payload += meta_bytes
+                offset += len(text_bytes) + len(meta_bytes)
+            self._data.write(payload)
+            self._data.flush()
+            self._index_file.write(entries)
+            self._index_file.flush()
+            # 原地追加只影响新序号，旧快照按自身条目数读取不受影响
+            index += entries
+            self._data_end = offset
+            self._snapshot = (index, first_id + len(texts), self._map())
+            return list(range(self._base + first_id, self._base + first_id + len(texts)))
+
+    @staticmethod
+    def _read(index: bytearray, mapped: mmap.mmap, position: int) -> Optional[Tuple[str, dict]]:
+        offset, text_len, meta_len = _ENTRY.unpack_from(index, position * _ENTRY.size)
+        if text_len == _RECLAIMED:
+            return None
+        # 直接在映射内存上解码，不产生中间 bytes 副本
+        with memoryview(mapped) as view:
+            text = str(view[offset:offset + text_len], "utf-8")
+            metadata = json.loads(str(view[offset + text_len:offset + text_len + meta_len], "utf-8"))
+        return text, metadata
+
+    def get(self, chunk_ids: List[int]) -> List[Optional[Tuple[str, dict]]]:
+        """按 chunk_id 批量读取 (文本, 元数据)；未知或已回收的 id (含其他 epoch 的 id) 返回 None"""
+        index, count, mapped = self._snapshot
+        cache = self._cache
+        results = []
+        hits = 0
+        for chunk_id in chunk_ids:
+            chunk_id = int(chunk_id)
+            cached = cache.get(chunk_id)
+            if cached is not None:
+                try:
+                    cache.move_to_end(chunk_id)
+                except KeyError:
+                    pass  # 并发淘汰
+                hits += 1
+                results.append(cached)
+                continue
+            position = chunk_id - self._base
+            if not 0 <= position < count:
+                results.append(None)
+                continue
+            record = self._read(index, mapped, position)
+            if record is not None and self.cache_size > 0:
+                cache[chunk_id] = record
+                while len(cache) > self.cache_size:
+                    try:
+                        cache.popitem(last=False)
+                    except KeyError:
+                        break
+            results.append(record)
+        CHUNK_STORE_LOOKUPS.labels("hit").inc(hits)
+        CHUNK_STORE_LOOKUPS.labels("miss").inc(len(chunk_ids) - hits)
+        return results
+
+    def file_ids(self) -> Set[str]:
+        """存有未回收切片的 file_id (全量扫描，仅用于启动时的一致性检查)"""
+        index, count, mapped = self._snapshot
+        found = set()
+        for position in range(count):
+            start, text_len, meta_len = _ENTRY.unpack_from(index, position * _ENTRY.size)
+            if text_len == _RECLAIMED:
+                continue
+            file_id = json.loads(mapped[start + text_len:start + text_len + meta_len]).get("file_id")
+            if file_id:
+                found.add(file_id)
+        return found
+
+    def delete_files(self, file_ids: Iterable[str]):
+        """记录向量已被删除的 file_id，其切片在下一次 compact 时回收"""
+        lines = "".join(f"{file_id}\n" for file_id in file_ids)
+        if not lines:
+            return
+        with self._lock:
+            with open(self._deleted_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+    def pending_deletes(self) -> int:
+        try:
+            with open(self._deleted_path, "r", encoding="utf-8") as f:
+                return sum(1 for line in f if line.strip())
+        except OSError:
+            return 0
+
+    def compact(self) -> Dict[str, int]:
+        """
+        重写数据文件，只保留未被删除的记录 (阻塞调用，在线程中执行)。
+        chunk_id 不变：被回收的序号写为空洞索引项。压缩期间写入被阻塞，读取照常进行。
+        """
+        with self._lock:
+            try:
+                with open(self._deleted_path, "r", encoding="utf-8") as f:
+                    deleted = {line.strip() for line in f if line.strip()}
+            except OSError:
+                deleted = set()
+            if not deleted:
+                return {"reclaimed": 0, "bytes_before": self._data_end, "bytes_after": self._data_end}
+
+            index, count, mapped = self._snapshot
+            new_index = bytearray()
+            reclaimed = 0
+            offset = 0
+            with open(self._data_path + COMPACT_SUFFIX, "wb") as out:
+                for position in range(count):
+                    start, text_len, meta_len = _ENTRY.unpack_from(index, position * _ENTRY.size)
+                    if text_len == _RECLAIMED:
+                        new_index += _RECLAIMED_ENTRY
+                        continue
+                    end = start + text_len + meta_len
+                    metadata = json.loads(mapped[start + text_len:end])
+                    if metadata.get("file_id") in deleted:
+                        new_index += _RECLAIMED_ENTRY
+                        reclaimed += 1
+                        continue
+                    out.write(mapped[start:end])
+                    new_index += _ENTRY.pack(offset, text_len, meta_len)
+                    offset += text_len + meta_len
+                out.flush()
+                os.fsync(out.fileno())
+            _write_synced(self._index_path + COMPACT_SUFFIX, bytes(new_index))
+            _write_synced(os.path.join(self.directory, COMPACT_MARKER), b"")
+
+            bytes_before = self._data_end
+            self._data.close()
+            self._index_file.close()
+            self._finish_compaction()
+            self._open_files()
+            self._data_end = offset
+            for chunk_id in [cid for cid, record in list(self._cache.items()) if record[1].get("file_id") in deleted]:
+                self._cache.pop(chunk_id, None)
+            # 旧映射不关闭：读取中的快照仍可能引用它，随引用释放回收
+            self._snapshot = (new_index, count, self._map())
+
+        logger.info(f"[ChunkStore] Compacted: reclaimed {reclaimed} chunks, {bytes_before} -> {offset} bytes")
+        return {"reclaimed": reclaimed, "bytes_before": bytes_before, "bytes_after": offset}
+
+    def stats(self) -> Dict[str, int]:
+        return {"chunks": len(self), "bytes": self._data_end, "cached": len(self._cache)}
+
+    def close(self):
+        with self._lock:
+            mapped = self._snapshot[2]
+            if mapped is not None:
+                mapped.close()
+            self._snapshot = (bytearray(), 0, None)
+            self._data.close()
+            self._index_file.close()
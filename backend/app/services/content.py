@@ -1,17 +1,19 @@
+import asyncio
 import logging
 import json
 import sys
-from typing import AsyncGenerator, List, Dict, Any
+import time
+from typing import AsyncGenerator, List, Dict, Any, Union
 from app.core.config import settings
+from app.core.metrics import PROMPT_TOKENS
+from app.core.timing import current_timer, start_operation, stage, track_llm_stream
+from app.core.tokens import estimate_tokens
+from app.services.history import append_turn, load_history
+from app.services.llm import create_chat_model
+from app.services.prompting import assemble_context, build_chat_prompt, format_turn
 from app.services.rag import rag_service # [New] 导入 RAG 核心服务
-
-try:
-    from langchain_openai import ChatOpenAI
-    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-    from langchain_community.chat_message_histories import RedisChatMessageHistory
-    from langchain_core.runnables.history import RunnableWithMessageHistory
-except ImportError:
-    pass
+from app.services.routing import classify, stream_with_fallback
+from app.services.slide_repair import CONTINUE_INSTRUCTION, finalize_slides, history_reply
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,6 +26,7 @@ Your job is to **MODIFY** or **REFINE** the current slides based on user instruc
 2. **Action**: Return the **FULL updated JSON** array.
 3. **Images**: Maintain or update `image_prompt` (English) if content changes significantly.
 4. Keep the structure valid.
+5. The current slides are given in the [Current Slides JSON] section of the message that follows the latest instruction.
 """
 
 class ContentGeneratorV1:
@@ -31,76 +34,87 @@ class ContentGeneratorV1:
         if not settings.deepseek_api_key:
             raise ValueError("DEEPSEEK_API_KEY is not set.")
 
-        self.llm = ChatOpenAI(
-            model="deepseek-chat",
-            temperature=0.2,
-            api_key=settings.deepseek_api_key,
-            base_url="https://api.deepseek.com",
-            streaming=True,
-            model_kwargs={"response_format": {"type": "json_object"}}
+        # [New] 截断输出的续写：非流式、不强制 json_object (续写内容只是 JSON 的尾部)
+        self.continuation_llm = create_chat_model(
+            temperature=0.2, json_mode=False, streaming=False, max_tokens=settings.slide_continuation_max_tokens
         )
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", CONTENT_SYSTEM_PROMPT),
-            ("system", "Current Slides JSON: {current_slides_json}"),
-            MessagesPlaceholder(variable_name="history"),
-            ("human", "{input}"),
-        ])
-
-        self.chain = RunnableWithMessageHistory(
-            prompt | self.llm,
-            self._get_session_history,
-            input_messages_key="input",
-            history_messages_key="history",
-        )
+        # [Perf] 当前幻灯片不再作为历史之前的 system 消息：每次改动都会使其后 (含全部历史) 的前缀缓存失效。
+        # 顺序改为 静态 system -> 历史 -> 本轮指令 -> 本轮易变上下文 (上下文 -> 幻灯片)
+        self.prompt = build_chat_prompt(CONTENT_SYSTEM_PROMPT)
 
-    def _get_session_history(self, session_id: str):
-        return RedisChatMessageHistory(
-            session_id=session_id, 
-            url=settings.redis_url, 
-            ttl=3600
-        )
+        # [New] 按路由 (settings.llm_routes) 懒加载模型
+        self._models = {}
+        self._model(settings.llm_route_default)
+
+    def _model(self, route: str):
+        model = self._models.get(route)
+        if model is None:
+            model = create_chat_model(temperature=0.2, route=route)
+            self._models[route] = model
+        return model
 
     # [Modified] 接收 rag_file_ids
-    async def generate_content_stream(self, session_id: str, user_input: str, current_slides: List[Dict[str, Any]], rag_file_ids: list = None) -> AsyncGenerator[str, None]:
+    async def generate_content_stream(self, session_id: str, user_input: str, current_slides: List[Dict[str, Any]], rag_file_ids: list = None) -> AsyncGenerator[Union[str, dict], None]:
         logger.info(f"[Refine Start] Session: {session_id}")
+        start_operation("content")
         
         # 1. RAG 检索逻辑
         context_str = ""
         if rag_file_ids and user_input:
             logger.info("RAG Activated: Retrieving context for content refinement.")
             # 调用 RAG Service 进行语义检索
-            context_str = rag_service.search_context(user_input, session_id)
+            with stage("rag_search"):
+                context_str = await asyncio.to_thread(rag_service.search_context, user_input, session_id, rag_file_ids)
 
-        # 2. 构造最终输入，注入上下文
+        # 2. 构造本轮输入：指令 (写入历史) + 易变上下文 (知识库上下文 -> 当前幻灯片，不写入历史)
+        prompt_started = time.perf_counter()
         slides_str = json.dumps(current_slides, ensure_ascii=False)
-        final_input = f"{user_input} (Return FULL JSON, Chinese)"
-        
+        instruction = f"{user_input} (Return FULL JSON, Chinese)"
         if context_str:
-            # [Critical Injection]: 将检索到的上下文置于用户输入之前
-            rag_prefix = f"""
-            --- 知识库参考内容 START ---
-            请严格参考以下知识库内容来精修幻灯片内容，如果上下文内容与用户指令相关，则将其作为精修的基础:
-            {context_str}
-            --- 知识库参考内容 END ---
-            """
-            final_input = rag_prefix + final_input
+            instruction = "请严格参考随后提供的知识库内容来精修幻灯片内容，如果上下文内容与用户指令相关，则将其作为精修的基础。\n" + instruction
             logger.info("Context successfully injected into refinement prompt.")
+        context = assemble_context(context_str, deck=slides_str)
+        current_timer().record("prompt_build", time.perf_counter() - prompt_started)
+        PROMPT_TOKENS.labels("content").observe(estimate_tokens(instruction) + estimate_tokens(context))
 
+        # [New] 按复杂度选择模型路由 (本地规则，无额外 LLM 调用)
+        decision = classify("content", user_input, current_slides, rag=bool(context_str))
+        logger.info(f"Route: {decision.route} ({decision.tier}, {decision.reason})")
+
+        # 指令按原样写入历史，下一轮请求的前缀与本轮逐字节相同
+        messages = format_turn(self.prompt, await load_history(session_id), instruction, context)
+        parts = []
         try:
             # 3. 调用链
-            async for chunk in self.chain.astream(
-                {
-                    "input": final_input,
-                    "current_slides_json": slides_str
-                },
-                config={"configurable": {"session_id": session_id}}
-            ):
-                if chunk.content:
-                    yield chunk.content
+            async for text in track_llm_stream(stream_with_fallback(
+                "content", decision, lambda route: self._astream_text(messages, route)
+            )):
+                parts.append(text)
+                yield text
         except Exception as e:
             logger.error(f"[Refine Error]: {e}", exc_info=True)
             yield json.dumps({"error": str(e)})
+            return
+
+        # 4. [New] 本地校验/修复，截断时只续写缺失的尾部；历史记录修复后的最终幻灯片
+        raw = "".join(parts)
+        final = await finalize_slides("content", raw, lambda partial: self._continue(partial, instruction, context))
+        await append_turn(session_id, instruction, history_reply(final, raw))
+        yield final
+
+    async def _continue(self, partial: str, instruction: str, context: str) -> str:
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        messages = format_turn(self.prompt, [], instruction, context)
+        messages += [AIMessage(content=partial), HumanMessage(content=CONTINUE_INSTRUCTION)]
+        reply = await self.continuation_llm.ainvoke(messages)
+        return reply.content
+
+    async def _astream_text(self, messages: list, route: str) -> AsyncGenerator[str, None]:
+        async for chunk in self._model(route).astream(messages):
+            if chunk.content:
+                yield chunk.content
 
 def create_content_generator():
     return ContentGeneratorV1()
\ No newline at end of file
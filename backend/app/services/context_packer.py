@@ -0,0 +1,142 @@
+"""
+RAG 上下文打包器 (Context Packer)
+
+输入：过量召回的候选切片 (含向量)；输出：在 token 预算内、低冗余的上下文。
+1. MMR (最大边际相关) 选择：复用检索返回的向量，不再重复编码
+2. 去重：丢弃完全重复的文本，裁掉与已选切片重叠的 chunk_overlap 边界
+3. 预算：总 token 预算在涉及的文件间平均分配，首轮未用完的额度再按 MMR 顺序回填
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict
+
+import numpy as np
+
+from app.core.tokens import estimate_tokens
+
+# 与 RecursiveCharacterTextSplitter(chunk_overlap=100) 保持一致
+CHUNK_OVERLAP_CHARS = 100
+# 与已选切片的余弦相似度高于该值时视为近似重复
+NEAR_DUPLICATE_SIMILARITY = 0.97
+# 裁剪重叠部分后剩余内容过短则丢弃
+MIN_CHUNK_CHARS = 20
+
+
+@dataclass
+class Candidate:
+    text: str
+    vector: np.ndarray
+    file_id: str = ""
+    metadata: Dict = field(default_factory=dict)
+
+
+def mmr_order(
+    query_vector: np.ndarray,
+    vectors: np.ndarray,
+    lambda_mult: float = 0.5,
+    limit: Optional[int] = None,
+) -> List[int]:
+    """
+    按 MMR 返回候选下标顺序 (向量需已 L2 归一化)：
+    score = λ * sim(q, d) - (1 - λ) * max_{s ∈ selected} sim(d, s)
+    """
+    count = len(vectors)
+    limit = count if limit is None else min(limit, count)
+    if count == 0 or limit <= 0:
+        return []
+
+    relevance = vectors @ query_vector
+    redundancy = np.full(count, -np.inf)
+    remaining = np.ones(count, dtype=bool)
+    order: List[int] = []
+
+    for _ in range(limit):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = lambda_mult * relevance - (1 - lambda_mult) * penalty
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        order.append(best)
+        remaining[best] = False
+        redundancy = np.maximum(redundancy, vectors @ vectors[best])
+    return order
+
+
+def trim_overlap(text: str, selected: List[str], max_overlap: int = CHUNK_OVERLAP_CHARS) -> str:
+    """
+    去掉 text 与已选切片之间重叠的边界 (切分器在相邻切片间保留的 overlap)。
+    - 已选切片的结尾 == text 的开头：裁掉 text 开头
+    - text 的结尾 == 已选切片的开头：裁掉 text 结尾
+    """
+    for other in selected:
+        upper = min(max_overlap, len(other), len(text))
+        for size in range(upper, MIN_CHUNK_CHARS - 1, -1):
+            if other.endswith(text[:size]):
+                text = text[size:]
+                break
+        upper = min(max_overlap, len(other), len(text))
+        for size in range(upper, MIN_CHUNK_CHARS - 1, -1):
+            if text.endswith(other[:size]):
+                text = text[:-size]
+                break
+    return text.strip()
+
+
+def pack_context(
+    query_vector,
+    candidates: List[Candidate],
+    token_budget: int,
+    lambda_mult: float = 0.5,
+    max_chunks: Optional[int] = None,
+) -> List[Candidate]:
+    """在 token 预算内按 MMR 选择候选；返回的 Candidate.text 已去除重叠边界"""
+    if not candidates or token_budget <= 0:
+        return []
+
+    vectors = np.asarray([c.vector for c in candidates], dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+    order = mmr_order(query, vectors, lambda_mult)
+
+    files = {c.file_id for c in candidates}
+    file_quota = token_budget / len(files)
+    file_used: Dict[str, int] = {}
+    total_used = 0
+    picked: List[int] = []
+    picked_texts: Dict[str, List[str]] = {}
+    packed: Dict[int, Candidate] = {}
+    seen_texts = set()
+    max_chunks = max_chunks or len(candidates)
+
+    def _try_add(index: int, enforce_quota: bool) -> bool:
+        nonlocal total_used
+        candidate = candidates[index]
+        if candidate.text in seen_texts:
+            return False
+        if picked and float(np.max(vectors[picked] @ vectors[index])) >= NEAR_DUPLICATE_SIMILARITY:
+            return False
+
+        text = trim_overlap(candidate.text, picked_texts.get(candidate.file_id, []))
+        if len(text) < MIN_CHUNK_CHARS:
+            return False
+        tokens = estimate_tokens(text)
+        if total_used + tokens > token_budget:
+            return False
+        if enforce_quota and file_used.get(candidate.file_id, 0) + tokens > file_quota:
+            return False
+
+        seen_texts.add(candidate.text)
+        picked.append(index)
+        picked_texts.setdefault(candidate.file_id, []).append(candidate.text)
+        file_used[candidate.file_id] = file_used.get(candidate.file_id, 0) + tokens
+        total_used += tokens
+        packed[index] = Candidate(text, candidate.vector, candidate.file_id, candidate.metadata)
+        return True
+
+    # 第一轮：每个文件不超过平均额度；第二轮：剩余预算按 MMR 顺序回填
+    for enforce_quota in (True, False):
+        for index in order:
+            if len(picked) >= max_chunks:
+                break
+            if index not in packed:
+                _try_add(index, enforce_quota)
+
+    # 保持 MMR 顺序输出
+    return [packed[i] for i in order if i in packed]
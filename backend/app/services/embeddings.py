@@ -0,0 +1,171 @@
+"""
+Embedding 运行时工厂 - HuggingFace (PyTorch) / ONNX Runtime (int8 动态量化)
+
+通过 settings.embedding_runtime 选择：
+- "huggingface": 原有 HuggingFaceEmbeddings (sentence-transformers, CPU)
+- "onnx": 将模型导出为 ONNX 并做 int8 动态量化，使用 ONNX Runtime 推理
+两种运行时输出均为 L2 归一化向量 (等价于 normalize_embeddings=True)。
+"""
+import os
+import json
+import logging
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    # [Perf] 仅用于类型标注：避免在应用启动路径上导入 langchain_core
+    from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_FILE = "model_int8.onnx"
+
+
+def pool_and_normalize(
+    last_hidden_state: np.ndarray,
+    attention_mask: np.ndarray,
+    pooling: str = "mean",
+) -> np.ndarray:
+    """
+    复现 sentence-transformers 的 Pooling + Normalize 模块。
+    last_hidden_state: [batch, seq, dim]; attention_mask: [batch, seq]
+    """
+    if pooling == "cls":
+        pooled = last_hidden_state[:, 0]
+    else:
+        mask = attention_mask[..., None].astype(last_hidden_state.dtype)
+        summed = (last_hidden_state * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled = summed / counts
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return pooled / np.clip(norms, 1e-12, None)
+
+
+def _read_pooling_mode(model_dir: str) -> str:
+    """读取 sentence-transformers 的 1_Pooling/config.json，默认 mean pooling (m3e-base)"""
+    config_path = os.path.join(model_dir, "1_Pooling", "config.json")
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        if config.get("pooling_mode_cls_token"):
+            return "cls"
+    except (OSError, ValueError):
+        pass
+    return "mean"
+
+
+class OnnxEmbeddings:
+    """
+    基于 ONNX Runtime 的句向量模型 (CPU)。
+    首次使用时从 HuggingFace 权重导出 ONNX 图并缓存到 model_dir，之后直接加载。
+    与 langchain Embeddings 接口兼容 (embed_documents / embed_query)，但不继承它。
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        model_dir: str,
+        quantize: bool = True,
+        intra_op_threads: int = 0,
+        batch_size: int = 32,
+        max_length: int = 512,
+    ):
+        self.model_name = model_name
+        self.model_dir = os.path.join(model_dir, model_name.replace("/", "__"))
+        self.quantize = quantize
+        self.intra_op_threads = intra_op_threads
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+        self._export_if_needed()
+
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # 0 表示交由 ORT 按物理核数决定；容器内建议显式设置为 CPU 配额
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+
+        graph = ONNX_QUANTIZED_FILE if quantize else ONNX_MODEL_FILE
+        self.session = ort.InferenceSession(
+            os.path.join(self.model_dir, graph),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        self.pooling = _read_pooling_mode(self.model_dir)
+        logger.info(
+            f"   - ONNX Runtime embeddings loaded: {graph} "
+            f"(threads={intra_op_threads or 'auto'}, pooling={self.pooling})"
+        )
+
+    def _export_if_needed(self):
+        """导出 ONNX 图 (optimum) 并生成 int8 动态量化版本，结果缓存于磁盘"""
+        model_path = os.path.join(self.model_dir, ONNX_MODEL_FILE)
+        if not os.path.exists(model_path):
+            logger.info(f"   - Exporting {self.model_name} to ONNX at {self.model_dir}...")
+            from optimum.exporters.onnx import main_export
+            main_export(
+                self.model_name,
+                output=self.model_dir,
+                task="feature-extraction",
+                library_name="sentence_transformers",
+            )
+
+        quantized_path = os.path.join(self.model_dir, ONNX_QUANTIZED_FILE)
+        if self.quantize and not os.path.exists(quantized_path):
+            logger.info("   - Quantizing ONNX graph (dynamic int8)...")
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            encoded = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+            outputs = self.session.run(None, feeds)
+            vectors.append(pool_and_normalize(outputs[0], encoded["attention_mask"], self.pooling))
+        return np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def create_embeddings(runtime: Optional[str] = None) -> "Embeddings":
+    """按配置创建 Embedding 运行时 (阻塞：包含模型加载)"""
+    runtime = (runtime or settings.embedding_runtime).lower()
+
+    if runtime == "onnx":
+        return OnnxEmbeddings(
+            model_name=settings.embedding_model_name,
+            model_dir=settings.onnx_model_dir,
+            quantize=settings.onnx_quantize,
+            intra_op_threads=settings.onnx_intra_op_threads,
+            batch_size=settings.embedding_batch_size,
+        )
+    if runtime == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=settings.embedding_model_name,
+            model_kwargs={'device': 'cpu'},
+            encode_kwargs={'normalize_embeddings': True, 'batch_size': settings.embedding_batch_size}
+        )
+    raise ValueError(f"Unknown embedding runtime: {runtime}")
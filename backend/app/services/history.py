@@ -0,0 +1,75 @@
+"""
+会话历史存储 - 生成器共享的 Chat History 工厂
+
+生成器在一轮生成 (含本地修复/续写) 完成后才调用 append_turn 写入历史：
+被取消或失败的一轮不会进入历史，写入的 AI 回复是修复后的最终幻灯片而不是截断的原始输出。
+"""
+from typing import Dict
+from app.core.config import settings
+from app.core.timing import stage
+
+# settings.chat_history_backend == "memory" 时使用的进程内存储 (本地开发 / 基准测试)
+_memory_histories: Dict[str, object] = {}
+
+HISTORY_TTL_SECONDS = 3600
+
+
+class TimedHistory:
+    """
+    透明代理：将历史读写计入 history_load / history_save 阶段。
+    生成器仅通过 (a)get_messages / (a)add_messages 访问历史对象。
+    """
+
+    def __init__(self, inner):
+        self._inner = inner
+
+    @property
+    def messages(self):
+        with stage("history_load"):
+            return self._inner.messages
+
+    async def aget_messages(self):
+        with stage("history_load"):
+            return await self._inner.aget_messages()
+
+    def add_messages(self, messages):
+        with stage("history_save"):
+            return self._inner.add_messages(messages)
+
+    async def aadd_messages(self, messages):
+        with stage("history_save"):
+            return await self._inner.aadd_messages(messages)
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+def _create_history(session_id: str):
+    if settings.chat_history_backend == "memory":
+        if session_id not in _memory_histories:
+            from langchain_core.chat_history import InMemoryChatMessageHistory
+            _memory_histories[session_id] = InMemoryChatMessageHistory()
+        return _memory_histories[session_id]
+
+    from langchain_community.chat_message_histories import RedisChatMessageHistory
+    return RedisChatMessageHistory(
+        session_id=session_id,
+        url=settings.redis_url,
+        ttl=HISTORY_TTL_SECONDS
+    )
+
+
+def get_session_history(session_id: str):
+    """按配置返回会话历史对象 (Redis 或进程内存)，读写耗时计入请求阶段计时"""
+    return TimedHistory(_create_history(session_id))
+
+
+async def load_history(session_id: str) -> list:
+    return await get_session_history(session_id).aget_messages()
+
+
+async def append_turn(session_id: str, human: str, ai: str):
+    """一轮生成完成后写入 (用户消息, AI 回复)"""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    await get_session_history(session_id).aadd_messages([HumanMessage(content=human), AIMessage(content=ai)])
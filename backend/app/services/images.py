@@ -0,0 +1,300 @@
+"""
+配图服务 - 关键词解析 + 内容寻址的本地图片缓存
+
+1. image_prompt -> 英文关键词：由可插拔的 KeywordProvider 完成 (默认本地词典，不调用外部模型)，结果进程内缓存
+2. (关键词, lock) -> 原图只下载一次，按 sha256 存入 {output_dir}/image_cache/，
+   同时用 Pillow 预生成 settings.image_variants 中的各个尺寸 (居中裁剪)
+3. 图片由本服务的 /images/{name} 提供，文件名即内容摘要，可设置长期不可变缓存头；
+   PPTX 导出与预览读取同源缓存，不再依赖外部站点
+4. 磁盘缓存总量超过 settings.image_cache_max_mb 时，由后台维护任务按最近使用时间 (原图 mtime) 淘汰
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = "image_cache"
+DEFAULT_KEYWORD = "business"
+_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}(_\d+x\d+)?\.jpg$")
+_KEYWORD_CACHE_SIZE = 4096
+
+# 常见 PPT 主题词 -> 配图关键词 (可通过 settings.image_keyword_dict_path 扩展/覆盖)
+KEYWORD_DICTIONARY: Dict[str, str] = {
+    "人工智能": "robot", "智能": "technology", "科技": "technology", "技术": "technology",
+    "数据": "data", "数字化": "digital", "互联网": "network", "网络": "network", "云": "cloud",
+    "芯片": "chip", "软件": "software", "编程": "code", "安全": "security",
+    "汽车": "car", "新能源": "solar", "电池": "battery", "能源": "energy", "充电": "charging",
+    "光伏": "solar", "储能": "battery", "电力": "electricity", "环保": "nature", "环境": "nature",
+    "碳": "forest", "气候": "climate", "农业": "farm", "食品": "food",
+    "市场": "market", "营销": "marketing", "销售": "sales", "品牌": "brand", "客户": "customer",
+    "金融": "finance", "投资": "investment", "经济": "economy", "增长": "growth", "成本": "money",
+    "财务": "finance", "银行": "bank", "战略": "strategy", "管理": "management", "企业": "office",
+    "团队": "team", "合作": "teamwork", "领导": "leadership", "人才": "people", "招聘": "interview",
+    "教育": "education", "学习": "study", "培训": "training", "学校": "school", "研究": "laboratory",
+    "医疗": "hospital", "健康": "health", "医药": "medicine", "生物": "biology",
+    "城市": "city", "建筑": "architecture", "交通": "traffic", "物流": "logistics", "供应链": "warehouse",
+    "制造": "factory", "工业": "industry", "产品": "product", "设计": "design", "创新": "innovation",
+    "旅游": "travel", "文化": "culture", "艺术": "art", "音乐": "music", "体育": "sports",
+    "总结": "mountain", "展望": "horizon", "未来": "future", "目标": "target", "挑战": "mountain",
+    "风险": "storm", "机遇": "sunrise", "趋势": "chart", "分析": "analytics", "报告": "report",
+    "全球": "globe", "国际": "world", "中国": "china", "政策": "government",
+}
+
+_ENGLISH_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "for", "to", "in", "on", "with", "by", "at", "from",
+    "image", "photo", "picture", "background", "showing", "about", "this", "that", "slide",
+}
+
+
+class DictionaryKeywordProvider:
+    """本地词典：命中最长的中文主题词；英文提示取第一个实词"""
+
+    def __init__(self, dictionary: Optional[Dict[str, str]] = None):
+        self.dictionary = dict(KEYWORD_DICTIONARY)
+        if dictionary:
+            self.dictionary.update(dictionary)
+        # 长词优先，避免 "新能源汽车" 先命中 "能源"
+        self._terms = sorted(self.dictionary, key=len, reverse=True)
+
+    def resolve(self, text: str) -> str:
+        for term in self._terms:
+            if term in text:
+                return self.dictionary[term]
+        for word in re.findall(r"[A-Za-z]+", text):
+            word = word.lower()
+            if len(word) > 2 and word not in _ENGLISH_STOPWORDS:
+                return word
+        return DEFAULT_KEYWORD
+
+
+def _load_dictionary_provider():
+    extra = None
+    if settings.image_keyword_dict_path:
+        with open(settings.image_keyword_dict_path, "r", encoding="utf-8") as f:
+            extra = json.load(f)
+    return DictionaryKeywordProvider(extra)
+
+
+# 关键词解析器注册表：其他实现 (如本地小模型) 通过 register_keyword_provider 接入
+KEYWORD_PROVIDERS: Dict[str, Callable[[], object]] = {"dictionary": _load_dictionary_provider}
+
+
+def register_keyword_provider(name: str, factory: Callable[[], object]):
+    KEYWORD_PROVIDERS[name] = factory
+
+
+def parse_variants(spec: str) -> List[Tuple[int, int]]:
+    sizes = []
+    for item in spec.split(","):
+        if "x" in item:
+            width, height = item.strip().lower().split("x")
+            sizes.append((int(width), int(height)))
+    return sorted(sizes)
+
+
+def _lock_id(text: str) -> int:
+    """同一提示词稳定映射到同一张图 (与旧前端的 lock 参数取值范围一致)"""
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest(), 16) % 1000
+
+
+def _render_variants(data: bytes, directory: str, digest: str, sizes: List[Tuple[int, int]]):
+    """保存原图 (统一转 JPEG) 并生成各尺寸变体 (阻塞调用，在线程中执行)"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("RGB")
+        img.save(os.path.join(directory, f"{digest}.jpg"), "JPEG", quality=88)
+        for width, height in sizes:
+            variant = ImageOps.fit(img, (width, height), Image.LANCZOS)
+            variant.save(os.path.join(directory, f"{digest}_{width}x{height}.jpg"), "JPEG", quality=85, optimize=True)
+
+
+@dataclass
+class ResolvedImage:
+    keyword: str
+    digest: str
+    name: str
+
+
+class ImageService:
+    def __init__(self):
+        self._provider = None
+        self._keywords: Dict[str, str] = {}
+        self._fetches: Dict[str, asyncio.Future] = {}
+        self._client = None
+
+    @property
+    def cache_dir(self) -> str:
+        return os.path.join(settings.output_dir, CACHE_DIR_NAME)
+
+    @property
+    def provider(self):
+        if self._provider is None:
+            self._provider = KEYWORD_PROVIDERS[settings.image_keyword_provider]()
+        return self._provider
+
+    def resolve_keyword(self, text: str) -> str:
+        keyword = self._keywords.get(text)
+        if keyword is None:
+            keyword = self.provider.resolve(text) or DEFAULT_KEYWORD
+            if len(self._keywords) >= _KEYWORD_CACHE_SIZE:
+                self._keywords.pop(next(iter(self._keywords)))
+            self._keywords[text] = keyword
+        return keyword
+
+    def _ref_path(self, source_url: str) -> str:
+        return os.path.join(self.cache_dir, "refs", hashlib.sha1(source_url.encode("utf-8")).hexdigest())
+
+    def local_path(self, name: str) -> Optional[str]:
+        """缓存文件的本地路径 (服务端导出直接读取)；名称不合法或文件不存在时返回 None"""
+        if not _NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.cache_dir, name[:2], name)
+        return path if os.path.exists(path) else None
+
+    def variant_name(self, digest: str, width: int, height: int) -> str:
+        """取覆盖所需尺寸的最小预生成变体，超出所有变体时返回原图"""
+        for variant_w, variant_h in parse_variants(settings.image_variants):
+            if variant_w >= width and variant_h >= height:
+                return f"{digest}_{variant_w}x{variant_h}.jpg"
+        return f"{digest}.jpg"
+
+    async def _download(self, source_url: str) -> bytes:
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(timeout=settings.image_fetch_timeout_seconds, follow_redirects=True)
+        response = await self._client.get(source_url)
+        response.raise_for_status()
+        return response.content
+
+    def _touch(self, digest: str):
+        """刷新原图 mtime 作为最近使用时间 (LRU 淘汰依据)"""
+        try:
+            os.utime(os.path.join(self.cache_dir, digest[:2], f"{digest}.jpg"))
+        except OSError:
+            pass
+
+    async def _fetch(self, source_url: str) -> str:
+        """下载并写入内容寻址缓存，返回摘要；同一来源并发请求只下载一次"""
+        ref_path = self._ref_path(source_url)
+        if os.path.exists(ref_path):
+            with open(ref_path, "r") as f:
+                digest = f.read().strip()
+            if os.path.exists(os.path.join(self.cache_dir, digest[:2], f"{digest}.jpg")):
+                self._touch(digest)
+                return digest
+
+        pending = self._fetches.get(source_url)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # 下载者 (leader) 被取消而非本请求被取消：由本请求重新发起下载
+                return await self._fetch(source_url)
+
+        future = asyncio.get_running_loop().create_future()
+        self._fetches[source_url] = future
+        try:
+            data = await self._download(source_url)
+            digest = hashlib.sha256(data).hexdigest()
+            directory = os.path.join(self.cache_dir, digest[:2])
+            os.makedirs(directory, exist_ok=True)
+            os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+            if not os.path.exists(os.path.join(directory, f"{digest}.jpg")):
+                await asyncio.to_thread(
+                    _render_variants, data, directory, digest, parse_variants(settings.image_variants)
+                )
+            with open(ref_path, "w") as f:
+                f.write(digest)
+            future.set_result(digest)
+            return digest
+        except BaseException as e:
+            # 任何退出路径 (含取消) 都要让 future 完成，否则等待者永远挂起
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 没有其他等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+            raise
+        finally:
+            self._fetches.pop(source_url, None)
+
+    def prune_cache(self) -> dict:
+        """
+        缓存总量超过 image_cache_max_mb 时按最近使用时间淘汰整组图片 (原图 + 变体)，
+        并删除指向已淘汰图片的来源引用。阻塞调用，在线程中执行。
+        """
+        limit = settings.image_cache_max_mb * 1024 * 1024
+        groups: Dict[str, List] = {}
+        if limit <= 0 or not os.path.isdir(self.cache_dir):
+            return {"evicted": 0, "bytes": 0}
+
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or entry.name == "refs":
+                continue
+            for item in os.scandir(entry.path):
+                if not _NAME_PATTERN.match(item.name):
+                    continue
+                group = groups.setdefault(item.name[:64], [0.0, 0, []])
+                stat = item.stat()
+                if len(item.name) == 68:  # 原图: {digest}.jpg
+                    group[0] = stat.st_mtime
+                group[1] += stat.st_size
+                group[2].append(item.path)
+
+        total = sum(group[1] for group in groups.values())
+        evicted = set()
+        for digest, (last_used, size, paths) in sorted(groups.items(), key=lambda kv: kv[1][0]):
+            if total <= limit:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            evicted.add(digest)
+
+        refs_dir = os.path.join(self.cache_dir, "refs")
+        if evicted and os.path.isdir(refs_dir):
+            for item in os.scandir(refs_dir):
+                try:
+                    with open(item.path, "r") as f:
+                        if f.read().strip() in evicted:
+                            os.remove(item.path)
+                except OSError:
+                    pass
+
+        if evicted:
+            logger.info(f"[Images] Evicted {len(evicted)} cached images, {total / 1024 / 1024:.1f} MB remain")
+        return {"evicted": len(evicted), "bytes": total}
+
+    async def resolve(self, prompt: str, width: int, height: int) -> ResolvedImage:
+        keyword = self.resolve_keyword(prompt)
+        # 按最大变体的尺寸下载原图，其余尺寸由本地缩放生成
+        source_w, source_h = (parse_variants(settings.image_variants) or [(1280, 720)])[-1]
+        source_url = settings.image_source_url.format(
+            keyword=keyword, lock=_lock_id(prompt), width=source_w, height=source_h
+        )
+        digest = await self._fetch(source_url)
+        return ResolvedImage(keyword=keyword, digest=digest, name=self.variant_name(digest, width, height))
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+image_service = ImageService()
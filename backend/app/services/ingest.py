@@ -0,0 +1,61 @@
+"""
+文档解析与切分 - 在进程池中执行
+
+PDF/DOCX 文本抽取是 CPU 密集型操作，放在事件循环线程上会阻塞所有请求，
+放在线程池中又受 GIL 限制无法并行，因此使用独立的进程池。
+parse_and_split 必须保持为模块级函数且只返回可 pickle 的基础类型。
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 600
+CHUNK_OVERLAP = 100
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def parse_and_split(file_path: str, filename: str) -> List[Tuple[str, dict]]:
+    """加载并切分单个文件，返回 [(page_content, loader_metadata), ...]"""
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    if filename.endswith(".pdf"):
+        loader = PyPDFLoader(file_path)
+    elif filename.endswith(".docx"):
+        loader = Docx2txtLoader(file_path)
+    else:
+        loader = TextLoader(file_path, encoding="utf-8")
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    docs = loader.load_and_split(text_splitter)
+    return [(doc.page_content, dict(doc.metadata)) for doc in docs]
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """进程池按需创建；使用 spawn 避免在多线程进程中 fork"""
+    global _pool
+    if _pool is None:
+        workers = settings.rag_parse_workers or min(4, os.cpu_count() or 1)
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"[Ingest] Parse process pool started with {workers} workers.")
+    return _pool
+
+
+def shutdown_parse_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def parse_in_pool(file_path: str, filename: str) -> List[Tuple[str, dict]]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_parse_pool(), parse_and_split, file_path, filename)
@@ -0,0 +1,114 @@
+"""
+LLM 客户端工厂 - 统一创建 DeepSeek (OpenAI 兼容) ChatModel，并记录提示词缓存命中
+
+DeepSeek 在 usage 中返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens，
+langchain_openai 转换 usage 时会丢弃这些字段，因此在 openai SDK 层包装 chat.completions，
+直接读取原始 usage (流式请求开启 stream_usage，usage 位于最后一个 chunk)。
+"""
+import logging
+
+from app.core.config import settings
+from app.core.metrics import LLM_PROMPT_CACHE_HIT_RATIO, LLM_PROMPT_CACHE_TOKENS
+from app.core.timing import current_timer
+from app.services.routing import route_spec
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_usage(usage):
+    """从原始 usage 中取 (命中, 未命中) token 数；兼容 OpenAI 的 prompt_tokens_details.cached_tokens"""
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    miss = getattr(usage, "prompt_cache_miss_tokens", None)
+    if hit is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        hit = getattr(details, "cached_tokens", None)
+        if hit is None:
+            return None
+        miss = (usage.prompt_tokens or 0) - hit
+    return int(hit), int(miss or 0)
+
+
+def record_prompt_usage(usage):
+    """写入当前请求的计时器 (随 SSE timing 事件下发) 与 Prometheus"""
+    if usage is None:
+        return
+    counts = _cache_usage(usage)
+    timer = current_timer()
+    timer.add_usage("prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    timer.add_usage("completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+    if counts is None:
+        return
+    hit, miss = counts
+    timer.add_usage("prompt_cache_hit_tokens", hit)
+    timer.add_usage("prompt_cache_miss_tokens", miss)
+    LLM_PROMPT_CACHE_TOKENS.labels(timer.operation, "hit").inc(hit)
+    LLM_PROMPT_CACHE_TOKENS.labels(timer.operation, "miss").inc(miss)
+    if hit + miss:
+        LLM_PROMPT_CACHE_HIT_RATIO.labels(timer.operation).observe(hit / (hit + miss))
+
+
+class _UsageStream:
+    """透传 openai AsyncStream，遇到携带 usage 的 chunk 时记录"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    async def __aenter__(self):
+        await self._stream.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._stream.__aexit__(*exc_info)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        async for chunk in self._stream:
+            if getattr(chunk, "usage", None) is not None:
+                record_prompt_usage(chunk.usage)
+            yield chunk
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class UsageRecordingCompletions:
+    """包装 AsyncOpenAI().chat.completions，其余属性透传"""
+
+    def __init__(self, inner):
+        self._inner = inner
+
+    async def create(self, **kwargs):
+        response = await self._inner.create(**kwargs)
+        if kwargs.get("stream"):
+            return _UsageStream(response)
+        record_prompt_usage(getattr(response, "usage", None))
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+def create_chat_model(temperature: float, json_mode: bool = True, streaming: bool = True, route: str = "", **kwargs):
+    """
+    创建 ChatOpenAI；json_mode 时强制 response_format=json_object。
+    route 对应 settings.llm_routes 中的一条路由：其 model/base_url/api_key/temperature/max_tokens 覆盖默认值。
+    """
+    from langchain_openai import ChatOpenAI
+
+    spec = route_spec(route or settings.llm_route_default)
+    if "max_tokens" in spec:
+        kwargs.setdefault("max_tokens", spec["max_tokens"])
+    llm = ChatOpenAI(
+        model=spec.get("model", "deepseek-chat"),
+        temperature=spec.get("temperature", temperature),
+        api_key=spec.get("api_key") or settings.deepseek_api_key,
+        base_url=spec.get("base_url") or settings.deepseek_base_url,
+        streaming=streaming,
+        stream_usage=True,
+        model_kwargs={"response_format": {"type": "json_object"}} if json_mode else {},
+        **kwargs,
+    )
+    llm.async_client = UsageRecordingCompletions(llm.async_client)
+    return llm
@@ -1,17 +1,19 @@
+import asyncio
 import logging
 import json
 import sys
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, Union
 from app.core.config import settings
+from app.core.metrics import PROMPT_TOKENS
+from app.core.timing import current_timer, start_operation, stage, track_llm_stream
+from app.core.tokens import estimate_tokens
+from app.services.history import append_turn, load_history
+from app.services.llm import create_chat_model
+from app.services.prompting import assemble_context, build_chat_prompt, format_turn
 from app.services.rag import rag_service
-
-try:
-    from langchain_openai import ChatOpenAI
-    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-    from langchain_community.chat_message_histories import RedisChatMessageHistory
-    from langchain_core.runnables.history import RunnableWithMessageHistory
-except ImportError:
-    pass
+from app.services.routing import classify, stream_with_fallback
+from app.services.slide_repair import CONTINUE_INSTRUCTION, finalize_slides, history_reply
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -56,37 +58,28 @@ class OutlineGenerator:
         if not settings.deepseek_api_key:
             raise ValueError("DEEPSEEK_API_KEY is not set.")
 
-        self.llm = ChatOpenAI(
-            model="deepseek-chat",
-            temperature=0.1, 
-            api_key=settings.deepseek_api_key,
-            base_url="https://api.deepseek.com",
-            streaming=True,
-            model_kwargs={"response_format": {"type": "json_object"}}
+        # [New] 截断输出的续写：非流式、不强制 json_object (续写内容只是 JSON 的尾部)
+        self.continuation_llm = create_chat_model(
+            temperature=0.1, json_mode=False, streaming=False, max_tokens=settings.slide_continuation_max_tokens
         )
 
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", OUTLINE_SYSTEM_PROMPT),
-            MessagesPlaceholder(variable_name="history"),
-            ("human", "{input}"),
-        ])
-
-        self.chain = RunnableWithMessageHistory(
-            prompt | self.llm,
-            self._get_session_history,
-            input_messages_key="input",
-            history_messages_key="history",
-        )
+        # [Perf] 静态 system -> 历史 -> 本轮指令 -> 本轮检索上下文，保持前缀稳定以命中提供方的 KV 缓存
+        self.prompt = build_chat_prompt(OUTLINE_SYSTEM_PROMPT)
 
-    def _get_session_history(self, session_id: str):
-        return RedisChatMessageHistory(
-            session_id=session_id, 
-            url=settings.redis_url, 
-            ttl=3600
-        )
+        # [New] 按路由 (settings.llm_routes) 懒加载模型
+        self._models = {}
+        self._model(settings.llm_route_default)
 
-    async def generate_outline_stream(self, session_id: str, user_input: str, rag_file_ids: list = None) -> AsyncGenerator[str, None]:
+    def _model(self, route: str):
+        model = self._models.get(route)
+        if model is None:
+            model = create_chat_model(temperature=0.1, route=route)
+            self._models[route] = model
+        return model
+
+    async def generate_outline_stream(self, session_id: str, user_input: str, rag_file_ids: list = None) -> AsyncGenerator[Union[str, dict], None]:
         logger.info(f"[Gen Start] Session: {session_id}")
+        start_operation("outline")
         
         context_str = ""
         
@@ -98,41 +91,65 @@ class OutlineGenerator:
             if len(user_input) < 10: 
                 search_query = "Summary key points main content"
             
-            context_str = rag_service.search_context(search_query, session_id)
+            with stage("rag_search"):
+                context_str = await asyncio.to_thread(rag_service.search_context, search_query, session_id, rag_file_ids)
             
-            if not context_str:
-                logger.warning("Semantic search empty. Fallback to file preview.")
-                context_str = rag_service.fetch_file_preview(rag_file_ids)
+                if not context_str:
+                    logger.warning("Semantic search empty. Fallback to file preview.")
+                    context_str = await asyncio.to_thread(rag_service.fetch_file_preview, session_id, rag_file_ids)
 
         # --- Logic Branch 2: Construct Final Prompt ---
-        # 注意：这里的 f-string 是 Python 层的变量替换，不需要双大括号
+        prompt_started = time.perf_counter()
         if context_str:
-            final_input = f"""
-            === [Knowledge Base Context] START ===
-            {context_str}
-            === [Knowledge Base Context] END ===
-            
-            User Request: {user_input}
-            Instruction: Generate a PPT outline based on the [Knowledge Base Context] above. Use Simplified Chinese.
-            """
+            instruction = (
+                f"User Request: {user_input}\n"
+                "Instruction: Generate a PPT outline based on the [Knowledge Base Context] that follows. Use Simplified Chinese."
+            )
             logger.info("Mode: RAG Generation")
         else:
-            final_input = f"""
-            User Request: {user_input}
-            Instruction: Generate a professional PPT outline based on this topic. Use Simplified Chinese. Output JSON Array.
-            """
+            instruction = (
+                f"User Request: {user_input}\n"
+                "Instruction: Generate a professional PPT outline based on this topic. Use Simplified Chinese. Output JSON Array."
+            )
             logger.info("Mode: Direct Generation")
+        context = assemble_context(context_str)
+        current_timer().record("prompt_build", time.perf_counter() - prompt_started)
+        PROMPT_TOKENS.labels("outline").observe(estimate_tokens(instruction) + estimate_tokens(context))
+        decision = classify("outline", user_input, rag=bool(context_str))
+        logger.info(f"Route: {decision.route} ({decision.tier}, {decision.reason})")
         
+        # 指令按原样写入历史，下一轮请求的前缀与本轮逐字节相同
+        messages = format_turn(self.prompt, await load_history(session_id), instruction, context)
+        parts = []
         try:
-            async for chunk in self.chain.astream(
-                {"input": final_input},
-                config={"configurable": {"session_id": session_id}}
-            ):
-                if chunk.content:
-                    yield chunk.content
+            async for text in track_llm_stream(stream_with_fallback(
+                "outline", decision, lambda route: self._astream_text(messages, route)
+            )):
+                parts.append(text)
+                yield text
         except Exception as e:
             logger.error(f"[Gen Error]: {e}", exc_info=True)
             yield json.dumps({"error": str(e)})
+            return
+
+        # [New] 本地校验/修复输出，截断时只续写缺失的尾部；最终幻灯片作为独立事件下发，并写入历史
+        raw = "".join(parts)
+        final = await finalize_slides("outline", raw, lambda partial: self._continue(partial, instruction, context))
+        await append_turn(session_id, instruction, history_reply(final, raw))
+        yield final
+
+    async def _continue(self, partial: str, instruction: str, context: str) -> str:
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        messages = format_turn(self.prompt, [], instruction, context)
+        messages += [AIMessage(content=partial), HumanMessage(content=CONTINUE_INSTRUCTION)]
+        reply = await self.continuation_llm.ainvoke(messages)
+        return reply.content
+
+    async def _astream_text(self, messages: list, route: str) -> AsyncGenerator[str, None]:
+        async for chunk in self._model(route).astream(messages):
+            if chunk.content:
+                yield chunk.content
 
 def create_outline_generator():
     return OutlineGenerator()
@@ -0,0 +1,50 @@
+"""
+Prompt 组装 - 按稳定性从高到低排列，最大化提供方的前缀 KV 缓存命中
+
+DeepSeek 对与历史请求相同的提示词前缀计费更低、首 token 更快，前缀中任何一处变化都会让其后的缓存失效。
+因此各段按 "变化频率从低到高" 排列：
+    [system]  静态系统提示 (进程内不变)
+    [history] 会话历史 (只追加)
+    [human]   本轮指令 (input) —— 与之后写入历史的用户消息逐字节相同
+    [human]   本轮易变上下文 (context)：知识库上下文 -> 当前幻灯片 JSON，不写入历史
+下一轮请求的前缀 = 本轮请求去掉最后一条易变上下文消息，因此除易变上下文外全部可命中缓存；
+历史也不会因为每轮携带的检索结果与幻灯片 JSON 而膨胀。
+"""
+from typing import List, Optional
+
+# 写入历史的本轮指令 / 仅本轮可见的易变上下文
+INPUT_KEY = "input"
+CONTEXT_KEY = "context"
+
+
+def build_chat_prompt(system_prompt: str):
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        MessagesPlaceholder(variable_name="history"),
+        ("human", "{" + INPUT_KEY + "}"),
+        MessagesPlaceholder(variable_name=CONTEXT_KEY, optional=True),
+    ])
+
+
+def assemble_context(context: str = "", deck: Optional[str] = None) -> str:
+    """拼接本轮易变上下文：知识库上下文 -> 当前幻灯片；两者皆无时返回空串"""
+    segments = []
+    if context:
+        segments.append(
+            "=== [Knowledge Base Context] START ===\n"
+            f"{context}\n"
+            "=== [Knowledge Base Context] END ==="
+        )
+    if deck is not None:
+        segments.append(f"=== [Current Slides JSON] ===\n{deck}")
+    return "\n\n".join(segments)
+
+
+def format_turn(prompt, history: list, instruction: str, context: str = "") -> List:
+    """渲染发送给模型的完整消息列表；易变上下文作为最后一条消息，不会出现在之后的历史中"""
+    from langchain_core.messages import HumanMessage
+
+    extra = [HumanMessage(content=context)] if context else []
+    return prompt.format_messages(history=history, **{INPUT_KEY: instruction, CONTEXT_KEY: extra})
@@ -1,181 +1,642 @@
 import os
 import uuid
-import shutil
 import json
+import asyncio
+import hashlib
+import tempfile
+import threading
+import time
 import logging
-from typing import List
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 from fastapi import UploadFile
 
-from langchain_huggingface import HuggingFaceEmbeddings 
-from langchain_milvus import Milvus
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
-
+# [Perf] LangChain / HuggingFace / Milvus 均为重量级依赖，延迟到 initialize() 与实际使用时再导入，
+# 避免拖慢进程冷启动 (import app.main 不再触发模型相关模块加载)。
 from app.core.config import settings
+from app.core.metrics import (
+    INGEST_CHUNKS, INGEST_CHUNKS_PER_SECOND, INGEST_DEDUP_HITS, RAG_CHUNKS_RETRIEVED,
+    RAG_SESSIONS_EXPIRED, RAG_VECTOR_FILES_PURGED, RAG_TOMBSTONES_PENDING, RAG_SWEEP_SECONDS, RAG_COMPACTIONS,
+)
+from app.core.timing import current_timer, start_operation, stage
+from app.services.context_packer import Candidate, pack_context
+from app.services.embeddings import create_embeddings
+from app.services.chunk_store import ChunkStore
+from app.services.ingest import parse_in_pool
+from app.services.vector_store import MilvusVectorIndex
 from app.schemas.rag import RagFileResponse
 
 logger = logging.getLogger(__name__)
 
 TEMP_UPLOAD_DIR = "./temp_uploads"
-METADATA_FILE = "./rag_metadata.json"
+METADATA_FILE = os.path.join(settings.rag_data_dir, "rag_metadata.json")
+# 待批量删除向量的 file_id (墓碑)，持久化以免重启后遗留孤儿向量
+TOMBSTONE_FILE = os.path.join(settings.rag_data_dir, "rag_tombstones.json")
+UPLOAD_READ_CHUNK = 1024 * 1024
+# 向量集合升级后，旧集合中的条目在新集合中没有向量与切片，标记为失效并提示重新上传
+STALE_ERROR = "索引已失效 (知识库存储已升级)，请重新上传该文件"
 
 os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
+os.makedirs(settings.rag_data_dir, exist_ok=True)
+
+
+def _read_state(path: str, default):
+    """
+    读取持久化状态文件；文件不存在时返回 default。
+    内容损坏时抛出异常并保留原文件供排查：以空状态继续运行会在下一次写盘时抹掉全部文件记录与墓碑。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        logger.critical(f"[RAG] State file {path} is unreadable, refusing to continue with empty state "
+                        f"(inspect, repair or remove it): {e}")
+        raise RuntimeError(f"Corrupt RAG state file: {path}") from e
+
+
+def _write_state(path: str, data, **dump_kwargs):
+    """原子写：同目录临时文件 -> fsync -> os.replace，崩溃或磁盘写满时旧文件保持完整"""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _vector_file_id(info: dict) -> str:
+    """文件条目引用的向量所属 file_id；去重功能上线前的条目向量归属于自身"""
+    return info.get("vector_file_id") or info["id"]
+
 
 class RagService:
     def __init__(self):
         self.vector_store = None
+        # 切片文本与元数据的本地存储 (向量库只保存向量与 chunk_id)
+        self.chunk_store = None
         self.embeddings = None
         self._is_initialized = False
+        # 各启动阶段耗时 (秒)，供启动日志与 /ready 诊断使用
+        self.startup_timings: Dict[str, float] = {}
+        # 元数据缓存；删除接口运行在线程池中，读写元数据需持有该锁
+        self._metadata: Optional[dict] = None
+        self._metadata_lock = threading.Lock()
+        # 正在入库的内容哈希 -> 完成事件 (同一内容并发上传时只入库一次)
+        self._inflight: Dict[str, asyncio.Event] = {}
+        self._tombstones: Optional[set] = None
+        # 维护任务状态：最近一次清理的统计、上次压缩时间、此后删除的文件数
+        self.last_sweep: Dict[str, float] = {}
+        self._last_compact = time.monotonic()
+        self._purged_since_compact = 0
         logger.info("RAG Service instantiated. Waiting for explicit initialization...")
 
+    @property
+    def is_model_ready(self) -> bool:
+        """Embedding 模型是否已加载并完成预热"""
+        return self.embeddings is not None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._is_initialized
+
+    def _record_phase(self, name: str, started: float):
+        elapsed = time.perf_counter() - started
+        self.startup_timings[name] = round(elapsed, 3)
+        logger.info(f"   - [Timing] {name}: {elapsed:.3f}s")
+
     def initialize(self):
+        """
+        加载 Embedding 模型 (含一次预热推理) 并连接 Milvus。
+        阻塞调用，应在后台线程中执行；可重复调用，已完成的阶段不会重做。
+        """
         if self._is_initialized:
             return
 
         logger.info("[Startup] Initializing RAG Service...")
         try:
-            logger.info(f"   - Loading Model: {settings.embedding_model_name}...")
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name=settings.embedding_model_name,
-                model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True}
-            )
+            if self.embeddings is None:
+                started = time.perf_counter()
+                logger.info(
+                    f"   - Loading Model: {settings.embedding_model_name} "
+                    f"(runtime={settings.embedding_runtime})..."
+                )
+                embeddings = create_embeddings()
+                self._record_phase("load_model", started)
+
+                # 预热推理：触发权重页载入与算子初始化，避免首个真实请求承担冷启动开销
+                started = time.perf_counter()
+                embeddings.embed_query("warm up")
+                self._record_phase("warmup_inference", started)
+                self.embeddings = embeddings
 
+            started = time.perf_counter()
+            if self.chunk_store is None:
+                self.chunk_store = ChunkStore(settings.chunk_store_dir, settings.chunk_store_cache_size)
             logger.info(f"   - Connecting to Milvus at {settings.milvus_host}:{settings.milvus_port}...")
-            self.vector_store = Milvus(
-                embedding_function=self.embeddings,
-                connection_args={
-                    "host": settings.milvus_host, 
-                    "port": settings.milvus_port
-                },
+            self.vector_store = MilvusVectorIndex(
+                self.chunk_store,
                 collection_name=settings.milvus_collection,
-                auto_id=True
+                host=settings.milvus_host,
+                port=settings.milvus_port,
             )
-            
-            if not os.path.exists(METADATA_FILE):
-                with open(METADATA_FILE, 'w', encoding='utf-8') as f:
-                    json.dump({}, f)
+            self._record_phase("connect_milvus", started)
+
+            # 状态文件损坏时在此失败 (服务保持未就绪)，而不是在之后的写盘中被空状态覆盖
+            with self._metadata_lock:
+                if not os.path.exists(METADATA_FILE):
+                    self._save_metadata(self._load_metadata())
+                self._load_tombstones()
+                self._mark_stale_entries()
 
             self._is_initialized = True
-            logger.info("[Startup] RAG Service is READY.")
+            logger.info(f"[Startup] RAG Service is READY. Timings: {self.startup_timings}")
             
         except Exception as e:
             logger.critical(f"[Error] RAG Init Failed: {e}")
             raise e
 
-    def _load_metadata(self) -> dict:
+    def ping_vector_store(self) -> bool:
+        """探测 Milvus 连通性 (阻塞调用)"""
+        if not self._is_initialized:
+            return False
         try:
-            with open(METADATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            return {}
+            from pymilvus import utility
+            utility.get_server_version(using=self.vector_store.alias)
+            return True
+        except Exception as e:
+            logger.warning(f"[Warn] Milvus ping failed: {e}")
+            return False
+
+    def _load_metadata(self) -> dict:
+        """元数据常驻内存 (检索时需据此把会话文件映射到向量)，首次访问时从磁盘加载"""
+        if self._metadata is None:
+            self._metadata = _read_state(METADATA_FILE, {})
+            # 旧条目没有访问时间，按加载时刻计算 TTL
+            now = time.time()
+            for info in self._metadata.values():
+                info.setdefault("last_access", now)
+        return self._metadata
+
+    def _mark_stale_entries(self) -> int:
+        """
+        启动时检查未经当前集合确认的条目 (集合升级前写入，或缺少 vector_file_id)：
+        其向量在本地切片存储中不存在时标记为 error，不再参与检索与去重；其余条目记下当前集合名。
+        仅在存在未确认条目时扫描切片存储。调用方需持有 _metadata_lock。
+        """
+        collection = settings.milvus_collection
+        metadata = self._load_metadata()
+        unchecked = [info for info in metadata.values()
+                     if info.get("collection") != collection and info.get("status") == "indexed"]
+        if not unchecked:
+            return 0
+        stored = self.chunk_store.file_ids()
+        stale = 0
+        for info in unchecked:
+            if info.get("vector_file_id") and info["vector_file_id"] in stored:
+                info["collection"] = collection
+            else:
+                info["status"] = "error"
+                info["error"] = STALE_ERROR
+                stale += 1
+        self._save_metadata(metadata)
+        if stale:
+            logger.warning(f"[RAG] {stale} file entries have no vectors in collection {collection}; marked stale")
+        return stale
 
     def _save_metadata(self, data: dict):
-        with open(METADATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self._metadata = data
+        _write_state(METADATA_FILE, data, ensure_ascii=False, indent=2)
+
+    async def _save_upload(self, file: UploadFile, file_path: str) -> Tuple[int, str]:
+        """分块读取上传流并写入临时文件，同时计算内容哈希；返回 (字节数, sha256)"""
+        size = 0
+        digest = hashlib.sha256()
+        with open(file_path, "wb") as buffer:
+            while True:
+                chunk = await file.read(UPLOAD_READ_CHUNK)
+                if not chunk:
+                    break
+                buffer.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        return size, digest.hexdigest()
+
+    def _embed_and_insert(self, texts: List[str], metadatas: List[dict]):
+        """跨文件共享批次编码，再按大批次写入向量库 (阻塞调用，在线程中执行)"""
+        vectors = []
+        batch_size = settings.rag_embed_batch_size
+        with stage("embedding"):
+            for start in range(0, len(texts), batch_size):
+                vectors.extend(self.embeddings.embed_documents(texts[start:start + batch_size]))
+        with stage("vector_insert"):
+            self.vector_store.add_embeddings(texts, vectors, metadatas, batch_size=settings.rag_insert_batch_size)
+
+    def _record_file(self, job: dict, session_id: str, vector_file_id: str, upload_time: str) -> dict:
+        """登记一个会话文件 (调用方需持有 _metadata_lock)"""
+        file_info = {
+            "id": job["id"],
+            "name": job["name"],
+            "size": job["size"],
+            "status": "indexed",
+            "upload_time": upload_time,
+            "session_id": session_id,
+            "content_hash": job["hash"],
+            "vector_file_id": vector_file_id,
+            "deduplicated": vector_file_id != job["id"],
+            "last_access": time.time(),
+            "collection": settings.milvus_collection,
+        }
+        self._load_metadata()[job["id"]] = file_info
+        return file_info
+
+    def _attach_existing(self, job: dict, session_id: str, upload_time: str) -> Optional[dict]:
+        """内容已入库时按引用挂到当前会话；查找与登记在同一把锁内完成，避免与 delete_file 竞争"""
+        with self._metadata_lock:
+            for info in list(self._load_metadata().values()):
+                if info.get("content_hash") == job["hash"] and info.get("status") == "indexed":
+                    return self._record_file(job, session_id, _vector_file_id(info), upload_time)
+        return None
 
     async def handle_file_upload(self, file: UploadFile, session_id: str) -> RagFileResponse:
+        results = await self.handle_bulk_upload([file], session_id)
+        return results[0]
+
+    async def handle_bulk_upload(self, files: List[UploadFile], session_id: str) -> List[RagFileResponse]:
+        """
+        批量上传：落盘(计算哈希) -> 内容去重 -> 进程池并行解析切分 -> 跨文件共享批次编码 -> 分组写入。
+        内容哈希已入库的文件直接引用已有向量，不再解析与编码。
+        单个文件失败只影响该文件，结果按上传顺序逐个返回。
+        """
         if not self._is_initialized:
             raise RuntimeError("RAG Service not initialized.")
 
-        file_id = str(uuid.uuid4())
-        file_path = os.path.join(TEMP_UPLOAD_DIR, f"{file_id}_{file.filename}")
-        
+        start_operation("upload")
+        ingest_started = time.perf_counter()
+        upload_time = datetime.now().strftime("%Y-%m-%d %H:%M")
+        jobs = []
+        for file in files:
+            file_id = str(uuid.uuid4())
+            jobs.append({
+                "id": file_id,
+                "name": file.filename,
+                "file": file,
+                "path": os.path.join(TEMP_UPLOAD_DIR, f"{file_id}_{os.path.basename(file.filename)}"),
+                "size": 0,
+                "hash": None,
+                "chunks": [],
+                "info": None,
+                "leader": None,
+                "error": None,
+            })
+        # 本请求负责入库的内容哈希；结束时通知等待同一内容的其他请求
+        owned_hashes = []
+        texts = []
+
         try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-
-            loader = None
-            if file.filename.endswith(".pdf"):
-                loader = PyPDFLoader(file_path)
-            elif file.filename.endswith(".docx"):
-                loader = Docx2txtLoader(file_path)
-            else:
-                loader = TextLoader(file_path, encoding="utf-8")
+            # 1. 落盘 (边写边算哈希)
+            with stage("save_file"):
+                for job in jobs:
+                    try:
+                        job["size"], job["hash"] = await self._save_upload(job["file"], job["path"])
+                    except Exception as e:
+                        job["error"] = e
 
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=600, chunk_overlap=100)
-            docs = loader.load_and_split(text_splitter)
+            # 2. 去重：已入库的内容直接引用；同一内容正由其他请求入库时等待其完成后再判断
+            leaders: Dict[str, dict] = {}
+            for job in jobs:
+                if job["error"] is not None:
+                    continue
+                if job["hash"] in leaders:
+                    job["leader"] = leaders[job["hash"]]
+                    continue
+                while True:
+                    job["info"] = self._attach_existing(job, session_id, upload_time)
+                    if job["info"] is not None:
+                        INGEST_DEDUP_HITS.inc()
+                        break
+                    inflight = self._inflight.get(job["hash"])
+                    if inflight is None:
+                        self._inflight[job["hash"]] = asyncio.Event()
+                        owned_hashes.append(job["hash"])
+                        leaders[job["hash"]] = job
+                        break
+                    await inflight.wait()
 
-            for doc in docs:
-                doc.metadata["session_id"] = session_id
-                doc.metadata["file_id"] = file_id
-                doc.metadata["file_name"] = file.filename
-                doc.metadata["timestamp"] = datetime.now().isoformat()
+            # 3. 进程池并行解析与切分 (仅新内容)
+            pending = list(leaders.values())
+            with stage("parse_split"):
+                parsed = await asyncio.gather(
+                    *[parse_in_pool(job["path"], job["name"]) for job in pending],
+                    return_exceptions=True,
+                )
+            for job, result in zip(pending, parsed):
+                if isinstance(result, BaseException):
+                    job["error"] = result
+                else:
+                    job["chunks"] = result
 
-            if docs:
-                self.vector_store.add_documents(docs)
+            # 4. 编码与写入 (所有文件的切片共享批次)
+            timestamp = datetime.now().isoformat()
+            metadatas = []
+            for job in pending:
+                if job["error"] is not None:
+                    continue
+                for text, loader_metadata in job["chunks"]:
+                    texts.append(text)
+                    metadatas.append({
+                        **loader_metadata,
+                        "session_id": session_id,
+                        "file_id": job["id"],
+                        "file_name": job["name"],
+                        "timestamp": timestamp,
+                    })
 
-            metadata = self._load_metadata()
-            file_info = {
-                "id": file_id,
-                "name": file.filename,
-                "size": file.size,
-                "status": "indexed",
-                "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                "session_id": session_id
-            }
-            metadata[file_id] = file_info
-            self._save_metadata(metadata)
+            if texts:
+                try:
+                    await asyncio.to_thread(self._embed_and_insert, texts, metadatas)
+                    INGEST_CHUNKS.inc(len(texts))
+                    INGEST_CHUNKS_PER_SECOND.observe(len(texts) / (time.perf_counter() - ingest_started))
+                except Exception as e:
+                    failed = [job for job in pending if job["error"] is None and job["chunks"]]
+                    for job in failed:
+                        job["error"] = e
+                    # 部分批次可能已写入切片存储与向量库，且不会被任何元数据引用：记为墓碑由后台回收
+                    with self._metadata_lock:
+                        self._load_tombstones().update(job["id"] for job in failed)
+                        self._save_tombstones()
 
-            return RagFileResponse(**file_info)
+            # 5. 元数据 (一次写盘)
+            with self._metadata_lock:
+                for job in pending:
+                    if job["error"] is None:
+                        job["info"] = self._record_file(job, session_id, job["id"], upload_time)
+                for job in jobs:
+                    leader = job["leader"]
+                    if leader is None:
+                        continue
+                    if leader["error"] is not None:
+                        job["error"] = leader["error"]
+                    else:
+                        job["info"] = self._record_file(job, session_id, leader["id"], upload_time)
+                        INGEST_DEDUP_HITS.inc()
+                if any(job["info"] for job in jobs):
+                    self._save_metadata(self._load_metadata())
 
-        except Exception as e:
-            logger.error(f"[Error] Upload Failed: {e}", exc_info=True)
-            return RagFileResponse(
-                id=file_id, name=file.filename, size=0, status="error", upload_time=""
+            responses = []
+            for job in jobs:
+                if job["error"] is not None:
+                    logger.error(f"[Error] Upload Failed ({job['name']}): {job['error']}")
+                    responses.append(RagFileResponse(
+                        id=job["id"], name=job["name"], size=0, status="error", upload_time="",
+                        error=str(job["error"])
+                    ))
+                else:
+                    responses.append(RagFileResponse(**job["info"]))
+
+            indexed = [job["info"] for job in jobs if job["info"]]
+            deduplicated = sum(1 for info in indexed if info["deduplicated"])
+            logger.info(
+                f"[Ingest] {len(indexed)}/{len(jobs)} files ({deduplicated} deduplicated), "
+                f"{len(texts)} chunks in {time.perf_counter() - ingest_started:.2f}s"
             )
+            return responses
+
         finally:
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            for content_hash in owned_hashes:
+                self._inflight.pop(content_hash).set()
+            for job in jobs:
+                if os.path.exists(job["path"]):
+                    os.remove(job["path"])
+
+    def _visible_vector_file_ids(self, session_id: str, file_ids: Optional[List[str]]) -> List[str]:
+        """会话文件 -> 其引用的向量 file_id (内容去重后，向量可能归属于其他会话上传的同一文件)"""
+        wanted = set(file_ids) if file_ids else None
+        vector_file_ids = []
+        now = time.time()
+        with self._metadata_lock:
+            for info in self._load_metadata().values():
+                if info.get("session_id") != session_id:
+                    continue
+                # 仅更新内存，随下一次元数据写盘持久化
+                info["last_access"] = now
+                if info.get("status") != "indexed" or (wanted is not None and info["id"] not in wanted):
+                    continue
+                vector_file_id = _vector_file_id(info)
+                if vector_file_id not in vector_file_ids:
+                    vector_file_ids.append(vector_file_id)
+        return vector_file_ids
+
+    def _file_filter(self, file_ids: Optional[List[str]]) -> str:
+        quoted = ", ".join(f'"{fid}"' for fid in file_ids)
+        return f'file_id in [{quoted}]'
 
-    def search_context(self, query: str, session_id: str, k: int = 3) -> str:
+    def _pack(self, query_vector, candidates) -> List[Candidate]:
+        packed = pack_context(
+            query_vector,
+            candidates,
+            token_budget=settings.rag_context_token_budget,
+            lambda_mult=settings.rag_mmr_lambda,
+            max_chunks=settings.rag_max_chunks,
+        )
+        RAG_CHUNKS_RETRIEVED.labels(current_timer().operation).observe(len(packed))
+        return packed
+
+    def search_context(self, query: str, session_id: str, file_ids: Optional[List[str]] = None) -> str:
+        """
+        语义检索 + 上下文打包：过量召回 rag_fetch_k 个候选，经 MMR 去冗余后
+        在 rag_context_token_budget 内返回 (预算在所选文件间平均分配)。
+        """
         if not self._is_initialized:
             return ""
             
         try:
-            expr = f'session_id == "{session_id}"'
-            docs = self.vector_store.similarity_search(query, k=k, expr=expr)
-            return "\n\n".join([doc.page_content for doc in docs])
+            # 向量可能被多个会话共享，按会话可见文件引用的向量 file_id 过滤
+            vector_file_ids = self._visible_vector_file_ids(session_id, file_ids)
+            if not vector_file_ids:
+                return ""
+            expr = self._file_filter(vector_file_ids)
+            with stage("query_embedding"):
+                embedding = self.embeddings.embed_query(query)
+            with stage("vector_search"):
+                candidates = self.vector_store.search_with_vectors(embedding, k=settings.rag_fetch_k, expr=expr)
+            with stage("context_pack"):
+                packed = self._pack(embedding, candidates)
+            return "\n\n".join(c.text for c in packed)
         except Exception as e:
             logger.warning(f"[Warn] Search failed: {e}")
             return ""
 
-    def fetch_file_preview(self, file_ids: List[str], limit_per_file: int = 2) -> str:
+    def fetch_file_preview(self, session_id: str, file_ids: List[str], limit_per_file: int = 4) -> str:
+        """语义检索无结果时的兜底：逐文件取候选 (仅限该会话可见的文件)，再按相同的预算与公平分配规则打包"""
         if not self._is_initialized or not file_ids: return ""
         try:
-            context_pieces = []
-            for fid in file_ids:
-                docs = self.vector_store.similarity_search(
-                    query="", 
-                    k=limit_per_file, 
-                    expr=f'file_id == "{fid}"'
-                )
-                for doc in docs:
-                    context_pieces.append(f"[File Content]: {doc.page_content}")
-            return "\n\n".join(context_pieces)
+            vector_file_ids = self._visible_vector_file_ids(session_id, file_ids)
+            if not vector_file_ids:
+                return ""
+            candidates = []
+            with stage("file_preview"):
+                embedding = self.embeddings.embed_query("")
+                for fid in vector_file_ids:
+                    candidates.extend(self.vector_store.search_with_vectors(
+                        embedding,
+                        k=limit_per_file,
+                        expr=f'file_id == "{fid}"'
+                    ))
+                packed = self._pack(embedding, candidates)
+            return "\n\n".join(f"[File Content]: {c.text}" for c in packed)
         except Exception as e:
             logger.error(f"[Error] Preview fetch failed: {e}")
             return ""
 
     def list_files(self, session_id: str) -> List[RagFileResponse]:
-        metadata = self._load_metadata()
-        user_files = [
-            RagFileResponse(**info) 
-            for info in metadata.values() 
-            if info.get("session_id") == session_id
-        ]
+        now = time.time()
+        user_files = []
+        with self._metadata_lock:
+            for info in self._load_metadata().values():
+                if info.get("session_id") == session_id:
+                    info["last_access"] = now
+                    user_files.append(RagFileResponse(**info))
         return sorted(user_files, key=lambda x: x.upload_time, reverse=True)
 
+    # ---------------------------------------------------------------- 生命周期
+
+    def _load_tombstones(self) -> set:
+        if self._tombstones is None:
+            self._tombstones = set(_read_state(TOMBSTONE_FILE, []))
+            RAG_TOMBSTONES_PENDING.set(len(self._tombstones))
+        return self._tombstones
+
+    def _save_tombstones(self):
+        tombstones = self._load_tombstones()
+        _write_state(TOMBSTONE_FILE, sorted(tombstones))
+        RAG_TOMBSTONES_PENDING.set(len(tombstones))
+
+    def _remove_entries(self, file_ids: List[str]) -> int:
+        """
+        删除文件条目，不再被任何条目引用的向量 file_id 记为墓碑，由后台批量删除。
+        检索只按现存条目引用的向量过滤，墓碑中的向量立即不可见。调用方需持有 _metadata_lock。
+        """
+        metadata = self._load_metadata()
+        removed = [metadata.pop(fid) for fid in file_ids if fid in metadata]
+        if not removed:
+            return 0
+        referenced = {_vector_file_id(info) for info in metadata.values()}
+        released = {_vector_file_id(info) for info in removed} - referenced
+        if released:
+            self._load_tombstones().update(released)
+            self._save_tombstones()
+        self._save_metadata(metadata)
+        return len(removed)
+
     def delete_file(self, file_id: str):
+        """删除单个文件：只写元数据与墓碑，向量由后台清理任务批量删除"""
+        with self._metadata_lock:
+            self._remove_entries([file_id])
+
+    def delete_session(self, session_id: str) -> int:
+        """删除会话的全部知识库文件，返回删除的文件数"""
+        with self._metadata_lock:
+            file_ids = [fid for fid, info in self._load_metadata().items() if info.get("session_id") == session_id]
+            return self._remove_entries(file_ids)
+
+    def expire_sessions(self, now: Optional[float] = None) -> int:
+        """删除闲置超过 rag_session_ttl_seconds 的会话，返回过期会话数"""
+        ttl = settings.rag_session_ttl_seconds
+        if ttl <= 0:
+            return 0
+        deadline = (now or time.time()) - ttl
+        with self._metadata_lock:
+            last_access: Dict[str, float] = {}
+            for info in self._load_metadata().values():
+                session_id = info.get("session_id")
+                last_access[session_id] = max(last_access.get(session_id, 0.0), info.get("last_access", 0.0))
+            expired = {sid for sid, ts in last_access.items() if ts < deadline}
+            if expired:
+                self._remove_entries([
+                    fid for fid, info in self._load_metadata().items() if info.get("session_id") in expired
+                ])
+        RAG_SESSIONS_EXPIRED.inc(len(expired))
+        return len(expired)
+
+    def flush_tombstones(self) -> int:
+        """按 rag_delete_batch_size 分组，以 `file_id in [...]` 表达式批量删除向量，返回删除的 file_id 数"""
+        with self._metadata_lock:
+            pending = sorted(self._load_tombstones())
+        flushed = 0
+        batch_size = max(1, settings.rag_delete_batch_size)
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            try:
+                self.vector_store.delete(expr=self._file_filter(batch))
+            except Exception as e:
+                logger.warning(f"[Warn] Tombstone flush failed, retry on next sweep: {e}")
+                break
+            # 向量已删除，对应切片在下一次压缩时从本地切片存储回收
+            self.vector_store.chunk_store.delete_files(batch)
+            with self._metadata_lock:
+                self._load_tombstones().difference_update(batch)
+                self._save_tombstones()
+            flushed += len(batch)
+        RAG_VECTOR_FILES_PURGED.inc(flushed)
+        self._purged_since_compact += flushed
+        return flushed
+
+    def _maybe_compact(self) -> bool:
+        """按间隔压缩向量集合与本地切片存储 (回收已删除文件的切片)"""
+        interval = settings.rag_compact_interval_seconds
+        chunk_store = self.vector_store.chunk_store
+        if interval <= 0 or not (self._purged_since_compact or chunk_store.pending_deletes()):
+            return False
+        if time.monotonic() - self._last_compact < interval:
+            return False
+        try:
+            self.vector_store.compact()
+            chunk_store.compact()
+        except Exception as e:
+            logger.warning(f"[Warn] Compaction failed: {e}")
+            return False
+        self._last_compact = time.monotonic()
+        self._purged_since_compact = 0
+        RAG_COMPACTIONS.inc()
+        return True
+
+    def sweep(self) -> Dict[str, float]:
+        """
+        后台维护 (阻塞调用，在线程中执行)：过期会话 -> 批量删除墓碑向量 -> 按间隔压缩集合。
+        同时把内存中的访问时间写回磁盘。
+        """
         if not self._is_initialized:
-             raise RuntimeError("RAG Service not initialized.")
+            return {}
+        started = time.perf_counter()
+        expired = self.expire_sessions()
+        flushed = self.flush_tombstones()
+        compacted = self._maybe_compact()
+        with self._metadata_lock:
+            self._save_metadata(self._load_metadata())
+            pending = len(self._load_tombstones())
+            files = len(self._load_metadata())
 
-        self.vector_store.delete(expr=f'file_id == "{file_id}"')
-        metadata = self._load_metadata()
-        if file_id in metadata:
-            del metadata[file_id]
-            self._save_metadata(metadata)
+        elapsed = time.perf_counter() - started
+        RAG_SWEEP_SECONDS.observe(elapsed)
+        self.last_sweep = {
+            "at": time.time(),
+            "duration_ms": round(elapsed * 1000, 1),
+            "sessions_expired": expired,
+            "vector_files_purged": flushed,
+            "tombstones_pending": pending,
+            "files": files,
+            "compacted": compacted,
+        }
+        if expired or flushed or compacted:
+            logger.info(f"[RAG] Sweep: {self.last_sweep}")
+        return self.last_sweep
 
 rag_service = RagService()
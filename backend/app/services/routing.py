@@ -0,0 +1,141 @@
+"""
+按复杂度的模型路由 (无需额外的 LLM 调用)
+
+根据指令长度、涉及的幻灯片页数、当前幻灯片规模以及是否启用 RAG，把请求分为：
+- light: 小范围修改 (如 "把第三页标题改短一点")，走 settings.llm_route_light (更快 / 更便宜的端点)
+- heavy: 大纲生成、整体改写、RAG 精修，走 settings.llm_route_heavy (主模型)
+路由定义在 settings.llm_routes；路由模型在输出首个 token 前失败时，回退到其 fallback (默认 llm_route_default)。
+"""
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import LLM_ROUTE_FALLBACKS, LLM_ROUTE_LATENCY_SECONDS, LLM_ROUTE_REQUESTS
+from app.core.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_CN_DIGITS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+# 指向具体页面: "第3页" / "第三张" / "slide 2" / "page 4" / "P5"
+_SLIDE_REFERENCE = re.compile(
+    # 英文引用前只排除字母 (不用 \b)：中文紧邻时 "把P5改成" 也能匹配
+    r"第\s*([0-9一二两三四五六七八九十]+)\s*[页张]|(?<![A-Za-z])(?:slide|page|p)\s*(\d+)(?!\d)", re.IGNORECASE
+)
+# 作用于整份演示稿或需要大量生成的指令
+_GLOBAL_HINTS = re.compile(
+    r"每一?[页张]|所有|全部|整体|整个|全文|通篇|重写|重新生成|扩写|扩充|新增|增加.{0,4}[页张]|翻译|"
+    r"\b(?:all|every|each|whole|entire|rewrite|regenerate|expand|translate)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    tier: str
+    reason: str
+    features: Dict[str, int] = field(default_factory=dict)
+
+
+def _slide_number(token: str) -> int:
+    if token.isdigit():
+        return int(token)
+    if token.startswith("十"):
+        return 10 + _CN_DIGITS.get(token[1:], 0)
+    if "十" in token:
+        tens, _, ones = token.partition("十")
+        return _CN_DIGITS.get(tens, 1) * 10 + _CN_DIGITS.get(ones, 0)
+    return _CN_DIGITS.get(token, 0)
+
+
+def referenced_slides(instruction: str) -> List[int]:
+    numbers = set()
+    for cn, en in _SLIDE_REFERENCE.findall(instruction or ""):
+        number = _slide_number(cn or en)
+        if number:
+            numbers.add(number)
+    return sorted(numbers)
+
+
+def resolve_route(name: str) -> str:
+    """未配置的路由名回退到默认路由"""
+    return name if name in settings.llm_routes else settings.llm_route_default
+
+
+def route_spec(name: str) -> dict:
+    return settings.llm_routes.get(resolve_route(name), {})
+
+
+def classify(operation: str, instruction: str, current_slides: Optional[list] = None, rag: bool = False) -> RouteDecision:
+    """纯本地规则的复杂度判定"""
+    slides = current_slides or []
+    referenced = referenced_slides(instruction)
+    features = {
+        "chars": len(instruction or ""),
+        "slides": len(slides),
+        "touched": len(referenced) if referenced else len(slides),
+        "deck_tokens": estimate_tokens(str(slides)) if slides else 0,
+    }
+
+    def heavy(reason: str) -> RouteDecision:
+        return RouteDecision(resolve_route(settings.llm_route_heavy), "heavy", reason, features)
+
+    if not settings.routing_enabled:
+        return RouteDecision(settings.llm_route_default, "heavy", "disabled", features)
+    if operation == "outline" or not slides:
+        return heavy("full_generation")
+    if rag:
+        return heavy("rag")
+    if features["chars"] > settings.routing_light_max_chars:
+        return heavy("long_instruction")
+    if _GLOBAL_HINTS.search(instruction or ""):
+        return heavy("global_edit")
+    if not referenced or features["touched"] > settings.routing_light_max_slides:
+        return heavy("many_slides")
+    if features["deck_tokens"] > settings.routing_light_max_deck_tokens:
+        return heavy("large_deck")
+    return RouteDecision(resolve_route(settings.llm_route_light), "light", "small_edit", features)
+
+
+def _fallback_for(route: str) -> Optional[str]:
+    fallback = settings.llm_routes.get(route, {}).get("fallback") or settings.llm_route_default
+    fallback = resolve_route(fallback)
+    return fallback if fallback != route else None
+
+
+async def stream_with_fallback(
+    operation: str,
+    decision: RouteDecision,
+    make_stream: Callable[[str], AsyncIterator[str]],
+) -> AsyncIterator[str]:
+    """
+    按路由发起流式生成并记录分路由的延迟。
+    首个 token 之前失败时改用 fallback 路由重试；已输出内容后失败则直接抛出 (避免重复输出)。
+    """
+    route = decision.route
+    tried = set()
+    while True:
+        tried.add(route)
+        started = time.perf_counter()
+        emitted = False
+        try:
+            async for text in make_stream(route):
+                if not emitted:
+                    emitted = True
+                    LLM_ROUTE_LATENCY_SECONDS.labels(operation, route, "ttft").observe(time.perf_counter() - started)
+                yield text
+        except Exception as e:
+            LLM_ROUTE_REQUESTS.labels(operation, route, "error").inc()
+            fallback = _fallback_for(route)
+            if emitted or fallback is None or fallback in tried:
+                raise
+            logger.warning(f"[Route] {operation} on '{route}' failed before first token ({e}); falling back to '{fallback}'")
+            LLM_ROUTE_FALLBACKS.labels(operation, route, fallback).inc()
+            route = fallback
+            continue
+        LLM_ROUTE_REQUESTS.labels(operation, route, "ok").inc()
+        LLM_ROUTE_LATENCY_SECONDS.labels(operation, route, "total").observe(time.perf_counter() - started)
+        return
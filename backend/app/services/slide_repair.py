@@ -0,0 +1,239 @@
+"""
+LLM 幻灯片 JSON 的本地校验与修复
+
+即使开启了 response_format=json_object，模型输出仍可能被截断或格式不严格
+(代码块围栏、首尾多余文字、{"slides": [...]} 包装、字段类型不符)。
+生成结束后先在本地修复，只有输出被截断时才请求模型续写缺失的尾部，而不是整份重新生成：
+1. 去掉围栏与 JSON 前后的多余文字
+2. 截断的结构：补全未闭合的字符串 / 括号，补全失败则回退到最近一个完整元素
+3. 解包 {"slides": [...]} / 单页对象，识别 {"refusal": ...}
+4. 用 Slide 模型逐页校验并转换类型，丢弃无法识别的元素
+"""
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.core.metrics import SLIDE_CONTINUATIONS, SLIDE_REPAIRS
+from app.core.timing import stage
+from app.schemas.slides import Slide
+
+logger = logging.getLogger(__name__)
+
+CONTINUE_INSTRUCTION = (
+    "Your previous reply was cut off. Continue the JSON EXACTLY from the last character you wrote. "
+    "Output ONLY the missing remainder: do not repeat earlier text, do not add explanations or code fences."
+)
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```\s*$")
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+_CLOSERS = {"[": "]", "{": "}"}
+# 回退修复时最多尝试的截断点个数 (从末尾往前)
+_MAX_CUT_ATTEMPTS = 64
+# 拼接续写时检查的重叠长度 (模型有时会重复上一段的结尾)
+_MAX_OVERLAP = 200
+
+
+@dataclass
+class RepairResult:
+    status: str  # valid / repaired / refusal / failed
+    slides: List[dict] = field(default_factory=list)
+    truncated: bool = False
+    refusal: Optional[str] = None
+    text: str = ""  # 去掉围栏与前缀后的 JSON 文本 (截断时即续写的起点)
+
+
+def _strip_fences(text: str) -> str:
+    return _FENCE.sub("", text.strip())
+
+
+def _scan(text: str) -> Tuple[int, List[str], bool, List[Tuple[int, List[str]]]]:
+    """
+    扫描 JSON 结构，返回 (结束位置, 未闭合的括号栈, 是否停在字符串内, 可截断点)。
+    结束位置为顶层结构闭合处 (之后的文字视为多余)，未闭合时为 -1。
+    可截断点: (位置, 当时的括号栈)，在该位置截断并补全括号即得到只含完整元素的 JSON。
+    """
+    stack: List[str] = []
+    cuts: List[Tuple[int, List[str]]] = []
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(ch)
+        elif ch in "]}":
+            if stack:
+                stack.pop()
+            if not stack:
+                return i, [], False, cuts
+            cuts.append((i + 1, list(stack)))
+        elif ch == ",":
+            cuts.append((i, list(stack)))
+    return -1, stack, in_string, cuts
+
+
+def _close(stack: List[str]) -> str:
+    return "".join(_CLOSERS[ch] for ch in reversed(stack))
+
+
+def _loads(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        try:
+            return json.loads(_TRAILING_COMMA.sub(r"\1", text))
+        except ValueError:
+            return None
+
+
+def _parse_lenient(text: str) -> Tuple[object, bool, str]:
+    """解析可能被截断 / 带多余文字的 JSON，返回 (对象或 None, 是否截断, JSON 文本)"""
+    text = _strip_fences(text)
+    starts = [i for i in (text.find("["), text.find("{")) if i >= 0]
+    if not starts:
+        return None, False, text
+    text = text[min(starts):]
+
+    end, stack, in_string, cuts = _scan(text)
+    if end >= 0:
+        return _loads(text[:end + 1]), False, text
+
+    # 截断：先原位补全 (保留最后一个不完整的元素)，失败再逐个回退到更早的完整元素
+    parsed = _loads(text + ('"' if in_string else "") + _close(stack))
+    for position, cut_stack in reversed(cuts[-_MAX_CUT_ATTEMPTS:]):
+        if parsed is not None:
+            break
+        parsed = _loads(text[:position] + _close(cut_stack))
+    return parsed, True, text
+
+
+def _unwrap(parsed) -> Tuple[Optional[list], Optional[str]]:
+    """返回 (幻灯片列表, 拒答信息)"""
+    if isinstance(parsed, list):
+        return parsed, None
+    if not isinstance(parsed, dict):
+        return None, None
+    for key in ("slides", "outline", "pages", "data", "ppt"):
+        if isinstance(parsed.get(key), list):
+            return parsed[key], None
+    if "refusal" in parsed and "title" not in parsed:
+        return None, str(parsed["refusal"])
+    lists = [v for v in parsed.values() if isinstance(v, list) and v and all(isinstance(i, dict) for i in v)]
+    if len(lists) == 1:
+        return lists[0], None
+    if "title" in parsed or "content" in parsed:
+        return [parsed], None
+    return None, None
+
+
+def _coerce(items: list) -> List[dict]:
+    slides = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        raw_type = item.get("slide_type")
+        try:
+            slide = Slide.model_validate(item)
+        except ValidationError:
+            continue
+        if not slide.title and not slide.content:
+            continue
+        if not raw_type:
+            slide.slide_type = "title" if not slides and not slide.content else "content"
+        if not slide.image_prompt:
+            slide.image_prompt = slide.title
+        slides.append(slide.model_dump(exclude_none=True))
+    return slides
+
+
+def repair_slides(raw: str) -> RepairResult:
+    """校验并修复一次完整的模型输出"""
+    parsed, truncated, text = _parse_lenient(raw or "")
+    items, refusal = _unwrap(parsed)
+    if refusal is not None:
+        return RepairResult("refusal", refusal=refusal, text=text)
+    slides = _coerce(items or [])
+    if not slides:
+        return RepairResult("failed", truncated=truncated, text=text)
+
+    untouched = (
+        not truncated
+        and isinstance(parsed, list)
+        and raw.strip() == text
+        and len(slides) == len(parsed)
+        # 只补了默认字段 (如缺省的 content / image_prompt) 不算修复
+        and all(all(slide.get(k) == v for k, v in item.items()) for slide, item in zip(slides, parsed))
+    )
+    return RepairResult("valid" if untouched else "repaired", slides, truncated, text=text)
+
+
+def join_continuation(partial: str, tail: str) -> str:
+    """拼接续写内容：去掉围栏，并去除与已有结尾重复的部分"""
+    tail = _strip_fences(tail)
+    for size in range(min(len(partial), len(tail), _MAX_OVERLAP), 0, -1):
+        if partial.endswith(tail[:size]):
+            return partial + tail[size:]
+    return partial + tail
+
+
+async def finalize_slides(
+    operation: str,
+    raw: str,
+    continue_fn: Optional[Callable[[str], Awaitable[str]]] = None,
+) -> dict:
+    """
+    生成结束后的收尾：修复输出并构造 SSE 事件。
+    输出被截断时调用 continue_fn(已有文本) 请求续写缺失的尾部 (最多 slide_continuation_max_rounds 轮)，
+    续写失败则使用本地补全的结果。
+    """
+    with stage("slide_repair"):
+        result = repair_slides(raw)
+
+    rounds = settings.slide_continuation_max_rounds if continue_fn else 0
+    continued = False
+    while result.truncated and rounds > 0 and result.text:
+        rounds -= 1
+        try:
+            with stage("slide_continuation"):
+                tail = await continue_fn(result.text)
+        except Exception as e:
+            logger.warning(f"[Repair] Continuation failed for {operation}: {e}")
+            SLIDE_CONTINUATIONS.labels(operation, "error").inc()
+            break
+        continued = True
+        with stage("slide_repair"):
+            candidate = repair_slides(join_continuation(result.text, tail))
+        if candidate.status == "failed":
+            SLIDE_CONTINUATIONS.labels(operation, "error").inc()
+            break
+        result = candidate
+        SLIDE_CONTINUATIONS.labels(operation, "incomplete" if result.truncated else "completed").inc()
+
+    SLIDE_REPAIRS.labels(operation, result.status).inc()
+    if result.status == "refusal":
+        return {"refusal": result.refusal, "repair": result.status}
+    if result.status == "failed":
+        logger.warning(f"[Repair] Unusable {operation} output ({len(raw or '')} chars)")
+        return {"repair": result.status, "continued": continued}
+    return {"slides": result.slides, "repair": result.status, "truncated": result.truncated, "continued": continued}
+
+
+def history_reply(event: dict, raw: str) -> str:
+    """写入会话历史的 AI 回复：修复/续写后的幻灯片 JSON；拒绝原样保留；修复失败时退回原始输出"""
+    if "slides" in event:
+        return json.dumps(event["slides"], ensure_ascii=False)
+    if "refusal" in event:
+        return json.dumps({"refusal": event["refusal"]}, ensure_ascii=False)
+    return raw
@@ -0,0 +1,345 @@
+"""
+可续传的生成流 (Resumable SSE)
+
+生成任务与 HTTP 连接解耦：生产者作为独立的 asyncio 任务运行，把每个事件追加到
+以 generation id 为键的 Redis Stream；SSE 响应只是该 Stream 的订阅者。
+- 每个 SSE 事件携带 `id:` (即 Stream 条目 id)
+- 断线的客户端带上 Last-Event-ID 重新订阅 GET /stream/{generation_id}，
+  先补发错过的事件，再继续实时推送
+- 生成结束后 Stream 保留 stream_replay_ttl_seconds，期间仍可完整回放
+- 取消：最后一个订阅者断开且 stream_disconnect_grace_seconds 内无人重连，或显式调用
+  cancel()，生产者任务被取消，CancelledError 传入 chain.astream 并关闭上游 HTTP 连接。
+  生产者可能运行在另一个 worker：request_cancel() 在本进程找不到任务且生成未结束时，
+  经 Redis Pub/Sub 广播取消请求，由持有该任务的 worker (listen_cancels) 执行取消。
+  生成器只在一轮正常结束 (含本地修复) 后写入历史，被取消的这一轮不会进入会话历史。
+  准入名额在收尾开始时同步归还，关闭上游与写入结束事件在 shield 中完成，不受再次取消影响。
+
+settings.stream_backend == "memory" 时使用进程内实现 (本地开发 / 基准测试)。
+"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import GENERATION_REQUESTS, GENERATION_CANCELLED
+from app.core.redis import get_redis
+from app.core.timing import current_timer
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY_PREFIX = "chatppt:gen:"
+# 跨 worker 取消请求的广播频道
+CANCEL_CHANNEL = "chatppt:gen-cancel"
+# 取消监听断开后的重连间隔
+CANCEL_LISTEN_RETRY_SECONDS = 1.0
+# 生成进行中的 Stream 过期时间 (防止进程崩溃后遗留)，结束后缩短为 stream_replay_ttl_seconds
+RUNNING_TTL_SECONDS = 3600
+# 订阅者单次阻塞读取的超时；超时无新事件时发送一条 SSE 注释作为心跳
+READ_BLOCK_MS = 15000
+READ_BATCH = 200
+
+DONE_EVENT = {"done": True}
+
+
+def _parse_entry_id(entry_id: str) -> Tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def is_valid_event_id(entry_id: str) -> bool:
+    try:
+        _parse_entry_id(entry_id)
+        return True
+    except ValueError:
+        return False
+
+
+class RedisStreamLog:
+    """Redis Streams: XADD 追加事件，XREAD BLOCK 订阅"""
+
+    @staticmethod
+    def _key(generation_id: str) -> str:
+        return STREAM_KEY_PREFIX + generation_id
+
+    async def append(self, generation_id: str, event: dict) -> str:
+        return await get_redis().xadd(self._key(generation_id), {"e": json.dumps(event, ensure_ascii=False)})
+
+    async def expire(self, generation_id: str, ttl: int):
+        await get_redis().expire(self._key(generation_id), ttl)
+
+    async def exists(self, generation_id: str) -> bool:
+        return bool(await get_redis().exists(self._key(generation_id)))
+
+    async def finished(self, generation_id: str) -> bool:
+        entries = await get_redis().xrevrange(self._key(generation_id), count=1)
+        return bool(entries) and json.loads(entries[0][1]["e"]) == DONE_EVENT
+
+    async def publish_cancel(self, generation_id: str, reason: str):
+        await get_redis().publish(CANCEL_CHANNEL, json.dumps({"id": generation_id, "reason": reason}))
+
+    async def cancel_requests(self) -> AsyncIterator[Tuple[str, str]]:
+        """订阅取消广播，逐条产出 (generation_id, reason)"""
+        pubsub = get_redis().pubsub()
+        await pubsub.subscribe(CANCEL_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    request = json.loads(message["data"])
+                    yield request["id"], request["reason"]
+        finally:
+            await pubsub.aclose()
+
+    async def read(self, generation_id: str, after: str, block_ms: int) -> List[Tuple[str, dict]]:
+        key = self._key(generation_id)
+        result = await get_redis().xread({key: after}, count=READ_BATCH, block=block_ms)
+        entries = []
+        for _, items in result or []:
+            for entry_id, fields in items:
+                entries.append((entry_id, json.loads(fields["e"])))
+        return entries
+
+
+class MemoryStreamLog:
+    """进程内实现，语义与 RedisStreamLog 一致 (条目 id 单调递增，过期惰性清理)"""
+
+    def __init__(self):
+        self._seq = itertools.count(1)
+        self._entries: Dict[str, List[Tuple[str, dict]]] = {}
+        self._expires: Dict[str, float] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._cancel_queues: List[asyncio.Queue] = []
+
+    def _purge(self):
+        now = time.monotonic()
+        for generation_id in [g for g, at in self._expires.items() if at <= now]:
+            self._entries.pop(generation_id, None)
+            self._expires.pop(generation_id, None)
+            self._wakeups.pop(generation_id, None)
+
+    async def append(self, generation_id: str, event: dict) -> str:
+        self._purge()
+        entry_id = f"{next(self._seq)}-0"
+        self._entries.setdefault(generation_id, []).append((entry_id, event))
+        wakeup = self._wakeups.pop(generation_id, None)
+        if wakeup:
+            wakeup.set()
+        return entry_id
+
+    async def expire(self, generation_id: str, ttl: int):
+        if generation_id in self._entries:
+            self._expires[generation_id] = time.monotonic() + ttl
+
+    async def exists(self, generation_id: str) -> bool:
+        self._purge()
+        return generation_id in self._entries
+
+    async def finished(self, generation_id: str) -> bool:
+        entries = self._entries.get(generation_id)
+        return bool(entries) and entries[-1][1] == DONE_EVENT
+
+    async def publish_cancel(self, generation_id: str, reason: str):
+        for queue in self._cancel_queues:
+            queue.put_nowait((generation_id, reason))
+
+    async def cancel_requests(self) -> AsyncIterator[Tuple[str, str]]:
+        queue = asyncio.Queue()
+        self._cancel_queues.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._cancel_queues.remove(queue)
+
+    async def read(self, generation_id: str, after: str, block_ms: int) -> List[Tuple[str, dict]]:
+        after_key = _parse_entry_id(after)
+        entries = [e for e in self._entries.get(generation_id, []) if _parse_entry_id(e[0]) > after_key]
+        if entries or not block_ms:
+            return entries[:READ_BATCH]
+        wakeup = self._wakeups.setdefault(generation_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(wakeup.wait(), block_ms / 1000)
+        except asyncio.TimeoutError:
+            return []
+        return await self.read(generation_id, after, 0)
+
+
+class GenerationBroker:
+    def __init__(self):
+        self._logs: Dict[str, object] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, int] = {}
+        self._cancel_timers: Dict[str, asyncio.TimerHandle] = {}
+        self._cancel_reasons: Dict[str, str] = {}
+
+    @property
+    def log(self):
+        backend = settings.stream_backend
+        if backend not in self._logs:
+            self._logs[backend] = MemoryStreamLog() if backend == "memory" else RedisStreamLog()
+        return self._logs[backend]
+
+    async def start(self, operation: str, stream, on_finish: Callable[[], None]) -> str:
+        """
+        启动与连接解耦的生产者任务，返回 generation id。
+        首条事件 (generation_id) 在返回前写入，订阅者随即可读。
+        """
+        generation_id = uuid.uuid4().hex
+        await self.log.append(generation_id, {"generation_id": generation_id})
+        await self.log.expire(generation_id, RUNNING_TTL_SECONDS)
+        # create_task 复制当前 context，生产者沿用本请求的 StageTimer
+        task = asyncio.create_task(self._produce(generation_id, operation, stream, on_finish))
+        self._tasks[generation_id] = task
+        task.add_done_callback(lambda _: self._forget(generation_id))
+        return generation_id
+
+    def _forget(self, generation_id: str):
+        self._tasks.pop(generation_id, None)
+        self._cancel_reasons.pop(generation_id, None)
+        timer = self._cancel_timers.pop(generation_id, None)
+        if timer:
+            timer.cancel()
+
+    def is_running(self, generation_id: str) -> bool:
+        return generation_id in self._tasks
+
+    def cancel(self, generation_id: str, reason: str = "user") -> bool:
+        """取消进行中的生成；返回是否确实取消了任务"""
+        task = self._tasks.get(generation_id)
+        if task is None or task.done():
+            return False
+        self._cancel_reasons.setdefault(generation_id, reason)
+        task.cancel()
+        return True
+
+    async def request_cancel(self, generation_id: str, reason: str = "user") -> Optional[str]:
+        """
+        取消生成，不论生产者运行在哪个 worker。返回:
+        "cancelled" (本进程已取消) | "cancelling" (已广播给持有任务的 worker) | "finished" | None (不存在或已过期)
+        """
+        if self.cancel(generation_id, reason):
+            return "cancelled"
+        if not await self.log.exists(generation_id):
+            return None
+        if await self.log.finished(generation_id):
+            return "finished"
+        await self.log.publish_cancel(generation_id, reason)
+        return "cancelling"
+
+    async def listen_cancels(self):
+        """接收其他 worker 广播的取消请求，取消本进程持有的对应任务 (应用生命周期内常驻)"""
+        while True:
+            try:
+                async for generation_id, reason in self.log.cancel_requests():
+                    if self.cancel(generation_id, reason):
+                        logger.info(f"[Stream] Generation {generation_id} cancelled on request from another worker")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[Stream] Cancel listener disconnected, retry in {CANCEL_LISTEN_RETRY_SECONDS}s: {e}")
+            await asyncio.sleep(CANCEL_LISTEN_RETRY_SECONDS)
+
+    def cancel_all(self, reason: str = "shutdown"):
+        for generation_id in list(self._tasks):
+            self.cancel(generation_id, reason)
+
+    def _subscribe(self, generation_id: str):
+        self._subscribers[generation_id] = self._subscribers.get(generation_id, 0) + 1
+        timer = self._cancel_timers.pop(generation_id, None)
+        if timer:
+            timer.cancel()
+
+    def _unsubscribe(self, generation_id: str):
+        remaining = self._subscribers.get(generation_id, 1) - 1
+        if remaining > 0:
+            self._subscribers[generation_id] = remaining
+            return
+        self._subscribers.pop(generation_id, None)
+        if not self.is_running(generation_id):
+            return
+        grace = settings.stream_disconnect_grace_seconds
+        if grace <= 0:
+            self.cancel(generation_id, "client_disconnect")
+        else:
+            self._cancel_timers[generation_id] = asyncio.get_running_loop().call_later(
+                grace, self.cancel, generation_id, "client_disconnect"
+            )
+
+    async def _produce(self, generation_id: str, operation: str, stream, on_finish: Callable[[], None]):
+        status = "error"
+        try:
+            async for token in stream:
+                # 文本片段包装为 {"text"}；生成器产出的 dict 为结构化事件 (如修复后的 slides)，原样写入
+                await self.log.append(generation_id, token if isinstance(token, dict) else {"text": token})
+            status = "ok"
+            timer = current_timer()
+            final = {"timing": timer.as_dict()}
+            if timer.usage:
+                final["usage"] = dict(timer.usage)
+            await self.log.append(generation_id, final)
+        except asyncio.CancelledError:
+            status = "cancelled"
+            reason = self._cancel_reasons.get(generation_id, "shutdown")
+            GENERATION_CANCELLED.labels(operation, reason).inc()
+            logger.info(f"[Stream] Generation {generation_id} cancelled ({reason})")
+            try:
+                await self.log.append(generation_id, {"cancelled": True, "reason": reason})
+            except Exception:
+                pass
+        except Exception as e:
+            logger.error(f"[Stream] Generation {generation_id} failed: {e}")
+            try:
+                await self.log.append(generation_id, {"error": str(e)})
+            except Exception:
+                pass
+        finally:
+            # 先同步归还准入名额并计数：之后的清理包含 await，再次取消也不会泄漏名额
+            on_finish()
+            GENERATION_REQUESTS.labels(operation, status).inc()
+            # 收尾 (关闭上游 + 写入 DONE) 放在 shield 中，即使本任务被再次取消也会执行完毕
+            await asyncio.shield(self._finalize(generation_id, stream))
+
+    async def _finalize(self, generation_id: str, stream):
+        # 取消发生在写入事件时，上游生成器仍挂起；显式关闭以立即释放上游连接
+        aclose = getattr(stream, "aclose", None)
+        if aclose:
+            try:
+                await aclose()
+            except Exception:
+                pass
+        try:
+            await self.log.append(generation_id, DONE_EVENT)
+            await self.log.expire(generation_id, settings.stream_replay_ttl_seconds)
+        except Exception as e:
+            logger.warning(f"[Stream] Failed to finalize {generation_id}: {e}")
+
+    async def exists(self, generation_id: str) -> bool:
+        return await self.log.exists(generation_id)
+
+    async def events(self, generation_id: str, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """订阅生成流并编码为 SSE：先回放 last_event_id 之后的事件，再实时推送直到结束"""
+        after = last_event_id or "0-0"
+        # 订阅计数：客户端断开时 (响应任务被取消) finally 触发，最后一个订阅者离开后按宽限期取消生成
+        self._subscribe(generation_id)
+        try:
+            while True:
+                entries = await self.log.read(generation_id, after, READ_BLOCK_MS)
+                if not entries:
+                    if not await self.log.exists(generation_id):
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                for entry_id, event in entries:
+                    after = entry_id
+                    if event.get("done"):
+                        yield f"id: {entry_id}\ndata: [DONE]\n\n"
+                        return
+                    yield f"id: {entry_id}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            self._unsubscribe(generation_id)
+
+
+broker = GenerationBroker()
@@ -0,0 +1,124 @@
+"""
+向量库适配层 - 精简 schema 的 Milvus 集合 + 本地切片存储
+
+Milvus 中每个切片只保存 chunk_id (INT64 主键)、file_id (分区键) 与向量，
+文本与元数据存放在本地 ChunkStore，检索命中后按 chunk_id 解析。
+集合更小、写入与检索的网络负载更小；按 file_id 过滤时可裁剪分区。
+检索时一并返回向量，供上下文打包器做 MMR 而无需重复编码。
+"""
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from app.services.context_packer import Candidate
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ID_FIELD = "chunk_id"
+FILE_ID_FIELD = "file_id"
+VECTOR_FIELD = "vector"
+FILE_ID_MAX_LENGTH = 64
+
+INDEX_PARAMS = {"index_type": "HNSW", "metric_type": "L2", "params": {"M": 8, "efConstruction": 64}}
+DEFAULT_SEARCH_PARAMS = {"metric_type": "L2", "params": {"ef": 64}}
+
+
+class MilvusVectorIndex:
+    def __init__(self, chunk_store, collection_name: str, host: str, port: str, alias: str = "chatppt"):
+        from pymilvus import connections
+
+        connections.connect(alias=alias, host=host, port=port)
+        self.alias = alias
+        self.collection_name = collection_name
+        self.chunk_store = chunk_store
+        self.col = None
+        self._create_lock = threading.Lock()
+        self._load_collection()
+
+    def _load_collection(self):
+        from pymilvus import Collection, utility
+
+        if utility.has_collection(self.collection_name, using=self.alias):
+            self.col = Collection(self.collection_name, using=self.alias)
+            self.col.load()
+
+    def _collection(self, dim: int):
+        """首次写入时按向量维度建集合与索引"""
+        if self.col is not None:
+            return self.col
+        from pymilvus import Collection, CollectionSchema, DataType, FieldSchema
+
+        with self._create_lock:
+            if self.col is None:
+                self._load_collection()
+            if self.col is None:
+                schema = CollectionSchema([
+                    FieldSchema(CHUNK_ID_FIELD, DataType.INT64, is_primary=True, auto_id=False),
+                    FieldSchema(FILE_ID_FIELD, DataType.VARCHAR, max_length=FILE_ID_MAX_LENGTH, is_partition_key=True),
+                    FieldSchema(VECTOR_FIELD, DataType.FLOAT_VECTOR, dim=dim),
+                ], description="chatppt RAG chunks (text and metadata live in the local chunk store)")
+                col = Collection(self.collection_name, schema, using=self.alias)
+                col.create_index(VECTOR_FIELD, INDEX_PARAMS)
+                col.load()
+                logger.info(f"[VectorStore] Created collection {self.collection_name} (dim={dim})")
+                self.col = col
+        return self.col
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]], metadatas: List[dict], batch_size: int = 1000) -> List[int]:
+        """
+        文本与元数据写入本地切片存储，向量按 batch_size 分组插入 Milvus；返回 chunk_id。
+        中途失败时已写入的切片与向量保留，由调用方按 file_id 记墓碑回收。
+        """
+        if not texts:
+            return []
+        chunk_ids = self.chunk_store.append(texts, metadatas)
+        col = self._collection(len(embeddings[0]))
+        for start in range(0, len(chunk_ids), batch_size):
+            end = start + batch_size
+            col.insert([
+                chunk_ids[start:end],
+                [m.get("file_id", "") for m in metadatas[start:end]],
+                embeddings[start:end],
+            ])
+        return chunk_ids
+
+    def search_with_vectors(self, embedding, k: int, expr: Optional[str] = None) -> List[Candidate]:
+        """ANN 检索 (只取回 file_id 与向量)，再从本地切片存储解析文本与元数据"""
+        if self.col is None:
+            return []
+        # HNSW 要求 ef >= limit，过量召回时需调大
+        params = {"metric_type": "L2", "params": {"ef": max(k, DEFAULT_SEARCH_PARAMS["params"]["ef"])}}
+        results = self.col.search(
+            data=[list(embedding)],
+            anns_field=VECTOR_FIELD,
+            param=params,
+            limit=k,
+            expr=expr,
+            output_fields=[FILE_ID_FIELD, VECTOR_FIELD],
+        )
+
+        hits = list(results[0])
+        records = self.chunk_store.get([hit.id for hit in hits])
+        candidates = []
+        for hit, record in zip(hits, records):
+            if record is None:
+                logger.warning(f"[VectorStore] Chunk {hit.id} missing from local chunk store")
+                continue
+            text, metadata = record
+            vector = np.asarray(hit.entity.get(VECTOR_FIELD), dtype=np.float32)
+            candidates.append(Candidate(text, vector, hit.entity.get(FILE_ID_FIELD) or "", metadata))
+        return candidates
+
+    def delete(self, expr: str):
+        if self.col is None:
+            return None
+        return self.col.delete(expr)
+
+    def compact(self):
+        """合并小段并物理清理已删除实体 (Milvus 后台执行)，返回 compaction id"""
+        if self.col is None:
+            return None
+        self.col.compact()
+        return getattr(self.col, "compaction_id", None)
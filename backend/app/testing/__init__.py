@@ -0,0 +1 @@
+# 测试与离线基准共用的确定性替身 (不在应用运行路径上导入)
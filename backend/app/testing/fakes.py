@@ -0,0 +1,171 @@
+"""
+测试与基准共用的确定性替身 (无需 HuggingFace 模型 / Milvus)
+
+- FakeEmbeddings: 基于字符 n-gram 哈希的确定性向量，可模拟每条文本的编码耗时
+- InMemoryVectorStore: 实现 RagService 用到的向量库接口 (同 MilvusVectorIndex，文本存于 ChunkStore)，支持简单的过滤表达式
+- ScriptedChatModel: 按固定回复分片流式输出的聊天模型，记录每次收到的消息
+"""
+import asyncio
+import hashlib
+import re
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.services.chunk_store import ChunkStore
+from app.services.context_packer import Candidate
+
+try:
+    from langchain_core.embeddings import Embeddings
+except ImportError:
+    Embeddings = object
+
+try:
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+except ImportError:
+    BaseChatModel = object
+
+
+class FakeEmbeddings(Embeddings):
+    """确定性伪向量：相同文本得到相同向量，共享 n-gram 的文本余弦相似度更高"""
+
+    def __init__(self, dim: int = 768, cost_ms_per_text: float = 0.0):
+        self.dim = dim
+        self.cost_ms_per_text = cost_ms_per_text
+
+    def _vector(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for i in range(max(len(text) - 1, 1)):
+            gram = text[i:i + 2].encode("utf-8")
+            digest = hashlib.blake2b(gram, digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vec[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _simulate_cost(self, count: int):
+        if self.cost_ms_per_text:
+            time.sleep(self.cost_ms_per_text * count / 1000)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._simulate_cost(len(texts))
+        return [self._vector(t).tolist() for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._simulate_cost(1)
+        return self._vector(text).tolist()
+
+
+_CONDITION = re.compile(r'^\s*(\w+)\s*(==|in)\s*(.+?)\s*$')
+
+
+def _parse_expr(expr: Optional[str]) -> List[Tuple[str, str, object]]:
+    """解析 `a == "x" and b in ["y", "z"]` 形式的 Milvus 布尔表达式子集"""
+    if not expr:
+        return []
+    conditions = []
+    for part in re.split(r'\s+and\s+', expr.strip()):
+        match = _CONDITION.match(part)
+        if not match:
+            raise ValueError(f"Unsupported expr: {part}")
+        field, op, raw = match.groups()
+        if op == "in":
+            value = set(re.findall(r'"([^"]*)"', raw))
+        else:
+            value = raw.strip().strip('"')
+        conditions.append((field, op, value))
+    return conditions
+
+
+def _matches(metadata: dict, conditions) -> bool:
+    for field, op, value in conditions:
+        actual = str(metadata.get(field))
+        if op == "==" and actual != value:
+            return False
+        if op == "in" and actual not in value:
+            return False
+    return True
+
+
+class InMemoryVectorStore:
+    """
+    暴力检索的内存向量库 (内积 / 余弦)，布局与 MilvusVectorIndex 一致：
+    只保存 chunk_id / file_id / 向量，文本与元数据经 ChunkStore 解析 (未传入时使用临时目录)
+    """
+
+    def __init__(self, embedding_function, chunk_store: Optional[ChunkStore] = None):
+        self.embedding_function = embedding_function
+        self.chunk_store = chunk_store or ChunkStore(tempfile.mkdtemp(prefix="chatppt-chunks-"))
+        self.chunk_ids: List[int] = []
+        self.file_ids: List[str] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+    @property
+    def texts(self) -> List[str]:
+        return [record[0] for record in self.chunk_store.get(self.chunk_ids)]
+
+    @property
+    def metadatas(self) -> List[dict]:
+        return [record[1] for record in self.chunk_store.get(self.chunk_ids)]
+
+    def add_embeddings(self, texts: List[str], embeddings, metadatas: List[dict], batch_size: int = 1000) -> List[int]:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        chunk_ids = self.chunk_store.append(texts, metadatas)
+        self.chunk_ids.extend(chunk_ids)
+        self.file_ids.extend(m.get("file_id", "") for m in metadatas)
+        self.vectors = vectors if not len(self.vectors) else np.vstack([self.vectors, vectors])
+        return chunk_ids
+
+    def _top_k(self, embedding, k: int, expr: Optional[str]) -> List[int]:
+        conditions = _parse_expr(expr)
+        candidates = [i for i, fid in enumerate(self.file_ids) if _matches({"file_id": fid}, conditions)]
+        if not candidates:
+            return []
+        scores = self.vectors[candidates] @ np.asarray(embedding, dtype=np.float32)
+        return [candidates[i] for i in np.argsort(-scores)[:k]]
+
+    def search_with_vectors(self, embedding, k: int, expr: Optional[str] = None):
+        positions = self._top_k(embedding, k, expr)
+        records = self.chunk_store.get([self.chunk_ids[i] for i in positions])
+        return [
+            Candidate(text, self.vectors[i], self.file_ids[i], metadata)
+            for i, (text, metadata) in zip(positions, records)
+        ]
+
+    def delete(self, expr: Optional[str] = None, **kwargs):
+        conditions = _parse_expr(expr)
+        keep = [i for i, fid in enumerate(self.file_ids) if not _matches({"file_id": fid}, conditions)]
+        self.chunk_ids = [self.chunk_ids[i] for i in keep]
+        self.file_ids = [self.file_ids[i] for i in keep]
+        self.vectors = self.vectors[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+        return True
+
+    def compact(self):
+        return None
+
+
+class ScriptedChatModel(BaseChatModel):
+    """回复固定文本；流式时每 chunk_chars 个字符一片，片间等待 delay 秒"""
+
+    reply: str = "[]"
+    chunk_chars: int = 4
+    delay: float = 0.0
+    calls: list = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(list(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls.append(list(messages))
+        for start in range(0, len(self.reply), self.chunk_chars):
+            await asyncio.sleep(self.delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=self.reply[start:start + self.chunk_chars]))
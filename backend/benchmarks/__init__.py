@@ -0,0 +1,3 @@
+"""
+离线性能基准与一致性校验工具 (不随服务部署)
+"""
@@ -0,0 +1,41 @@
+"""
+对比两次基准结果
+
+用法：
+    python -m benchmarks.compare base.json new.json
+"""
+import argparse
+import json
+from typing import Dict, Any
+
+
+def _flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = _flatten(json.load(f)["scenarios"])
+    with open(args.new, encoding="utf-8") as f:
+        new = _flatten(json.load(f)["scenarios"])
+
+    print(f"{'metric':<50} {'base':>12} {'new':>12} {'delta':>9}")
+    for key in sorted(base.keys() & new.keys()):
+        delta = (new[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+        print(f"{key:<50} {base[key]:>12.2f} {new[key]:>12.2f} {delta:>8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Embedding 运行时一致性 & 性能对比
+
+对比 HuggingFace (基准) 与 ONNX int8 运行时在同一语料上的：
+- 逐条向量余弦相似度 (parity)
+- 检索 top-k 结果重合率 (以语料自身作为查询)
+- 批量编码吞吐 (texts/s) 与单条查询延迟 (p50/p95)
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.embedding_parity --corpus docs.txt --output parity.json
+"""
+import argparse
+import json
+import time
+from typing import List, Dict, Any
+
+import numpy as np
+
+from app.services.embeddings import create_embeddings
+from benchmarks.stats import percentile
+
+# 内置小语料：覆盖中英文、长短句，未提供 --corpus 时使用
+SAMPLE_CORPUS = [
+    "新能源汽车的电池技术是行业竞争的核心，固态电池有望在五年内实现量产。",
+    "2024年国内乘用车销量同比增长，其中插电混动车型增速最快。",
+    "自动驾驶分为L0到L5六个等级，目前量产车型主要处于L2阶段。",
+    "充电基础设施建设滞后于电动车保有量的增长，是用户的主要顾虑之一。",
+    "车企通过OTA升级持续优化车辆性能，软件定义汽车成为趋势。",
+    "The quarterly report shows revenue growth driven by overseas markets.",
+    "供应链本地化可以降低关税和物流风险，但短期内会推高成本。",
+    "动力电池回收利用体系尚不完善，梯次利用的商业模式仍在探索。",
+    "智能座舱的核心是人机交互体验，包括语音助手和多屏联动。",
+    "碳化硅功率器件能提升电驱系统效率，延长续航里程。",
+    "企业数字化转型需要从业务流程梳理开始，而不是单纯采购软件。",
+    "Machine learning models require careful evaluation on held-out data.",
+    "年度总结：团队完成了三个核心项目的交付，客户满意度提升。",
+    "市场营销策略应聚焦目标用户画像，提高投放转化率。",
+    "数据安全法规对跨境数据传输提出了明确的合规要求。",
+    "产品路线图分为三个阶段：验证、规模化和生态建设。",
+]
+
+
+def _load_corpus(path: str) -> List[str]:
+    if not path:
+        return SAMPLE_CORPUS
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _measure(embeddings, corpus: List[str], queries: List[str]) -> Dict[str, Any]:
+    embeddings.embed_query("warm up")
+
+    started = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(corpus), dtype=np.float32)
+    batch_seconds = time.perf_counter() - started
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "vectors": vectors,
+        "stats": {
+            "throughput_texts_per_s": round(len(corpus) / batch_seconds, 2),
+            "query_latency_ms_p50": round(percentile(latencies, 50), 2),
+            "query_latency_ms_p95": round(percentile(latencies, 95), 2),
+        },
+    }
+
+
+def compare(reference: np.ndarray, candidate: np.ndarray, k: int = 5) -> Dict[str, float]:
+    """向量均已归一化：点积即余弦相似度"""
+    cosines = np.sum(reference * candidate, axis=1)
+    k = min(k, len(reference) - 1) or 1
+
+    overlaps = []
+    ref_scores = reference @ reference.T
+    cand_scores = candidate @ candidate.T
+    for i in range(len(reference)):
+        ref_top = set(np.argsort(-ref_scores[i])[1:k + 1])
+        cand_top = set(np.argsort(-cand_scores[i])[1:k + 1])
+        overlaps.append(len(ref_top & cand_top) / k)
+
+    return {
+        "cosine_mean": round(float(cosines.mean()), 5),
+        "cosine_min": round(float(cosines.min()), 5),
+        f"top{k}_overlap_mean": round(float(np.mean(overlaps)), 4),
+        "norm_max_deviation": round(float(np.abs(np.linalg.norm(candidate, axis=1) - 1).max()), 6),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding runtime parity check")
+    parser.add_argument("--corpus", default="", help="每行一段文本；缺省使用内置样例语料")
+    parser.add_argument("--reference", default="huggingface")
+    parser.add_argument("--candidate", default="onnx")
+    parser.add_argument("--queries", type=int, default=50, help="单条查询延迟的采样次数")
+    parser.add_argument("--output", default="", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    corpus = _load_corpus(args.corpus)
+    queries = [corpus[i % len(corpus)] for i in range(args.queries)]
+
+    results = {"corpus_size": len(corpus), "runtimes": {}}
+    measured = {}
+    for runtime in (args.reference, args.candidate):
+        started = time.perf_counter()
+        embeddings = create_embeddings(runtime)
+        load_seconds = time.perf_counter() - started
+        measured[runtime] = _measure(embeddings, corpus, queries)
+        results["runtimes"][runtime] = {"load_s": round(load_seconds, 2), **measured[runtime]["stats"]}
+
+    results["parity"] = compare(measured[args.reference]["vectors"], measured[args.candidate]["vectors"])
+
+    report = json.dumps(results, ensure_ascii=False, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+离线基准测试入口 - 无需 DeepSeek / Milvus / Redis
+
+被测应用 (app.main) 与 OpenAI 兼容桩服务均在本进程的后台线程中以 uvicorn 运行，
+负载通过真实 HTTP 连接发起；Embedding / 向量库 / 会话历史替换为确定性的内存替身。
+
+用法 (在 backend 目录下)：
+    python -m benchmarks.run --output benchmarks/results/baseline.json
+    python -m benchmarks.run --scenarios outline_ttft,concurrent_sse --concurrency 50
+    python -m benchmarks.compare benchmarks/results/baseline.json benchmarks/results/new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, Any, List
+
+import httpx
+
+from app.services.chunk_store import ChunkStore
+from app.testing.fakes import FakeEmbeddings, InMemoryVectorStore
+from benchmarks.stats import summarize
+from benchmarks.stub_llm import StubConfig, BackgroundServer, create_app as create_stub_app
+
+SAMPLE_SLIDES = [
+    {"slide_type": "title", "title": "新能源汽车行业分析", "subtitle": "2024", "image_prompt": "electric car"},
+] + [
+    {
+        "slide_type": "content",
+        "title": f"第{i}部分",
+        "content": ["市场规模持续扩大", "技术路线逐步收敛", "竞争格局加速分化"],
+        "image_prompt": "city traffic",
+    }
+    for i in range(1, 12)
+]
+
+SAMPLE_DOCUMENT = (
+    "新能源汽车产业链包括上游原材料、中游电池与电驱、下游整车与服务。"
+    "动力电池成本占整车成本的三到四成，是降本的关键环节。"
+    "充电网络、换电模式与车网互动是基础设施建设的三个方向。"
+    "智能化方面，高阶辅助驾驶和智能座舱成为差异化竞争的重点。"
+)
+
+
+def _configure(stub_url: str, workdir: str):
+    """将应用切换到桩服务与内存替身 (必须在应用收到请求前调用)"""
+    from app.core.config import settings
+    from app.services import rag as rag_module
+    from app.services.rag import rag_service
+
+    settings.deepseek_api_key = "stub"
+    settings.deepseek_base_url = stub_url
+    settings.chat_history_backend = "memory"
+    settings.stream_backend = "memory"
+
+    rag_module.METADATA_FILE = os.path.join(workdir, "rag_metadata.json")
+    rag_module.TOMBSTONE_FILE = os.path.join(workdir, "rag_tombstones.json")
+    rag_module.TEMP_UPLOAD_DIR = os.path.join(workdir, "uploads")
+    os.makedirs(rag_module.TEMP_UPLOAD_DIR, exist_ok=True)
+
+    rag_service.embeddings = FakeEmbeddings()
+    rag_service.chunk_store = ChunkStore(os.path.join(workdir, "chunks"))
+    rag_service.vector_store = InMemoryVectorStore(rag_service.embeddings, rag_service.chunk_store)
+    rag_service._is_initialized = True
+
+
+async def _consume_sse(client: httpx.AsyncClient, url: str, body: dict) -> Dict[str, float]:
+    """发起一次 SSE 请求，返回 ttft / 总耗时 / 事件数"""
+    started = time.perf_counter()
+    ttft = None
+    events = 0
+    usage = {}
+    async with client.stream("POST", url, json=body) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            if '"text"' in line:
+                events += 1
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+            elif '"usage"' in line:
+                usage = json.loads(line[len("data: "):]).get("usage", {})
+    total = time.perf_counter() - started
+    ttft = ttft if ttft is not None else total
+    streaming = max(total - ttft, 1e-9)
+    return {
+        "ttft_ms": ttft * 1000, "total_ms": total * 1000, "events": events,
+        "events_per_s": events / streaming, "usage": usage,
+    }
+
+
+def _stream_summary(results: List[Dict[str, float]]) -> Dict[str, Any]:
+    return {
+        "ttft_ms": summarize([r["ttft_ms"] for r in results]),
+        "total_ms": summarize([r["total_ms"] for r in results]),
+        "events_per_s": summarize([r["events_per_s"] for r in results]),
+    }
+
+
+async def scenario_outline_ttft(client, args) -> Dict[str, Any]:
+    results = []
+    for i in range(args.iterations):
+        results.append(await _consume_sse(client, "/api/v1/stream/outline", {
+            "session_id": f"bench-outline-{i}",
+            "user_message": "生成一份关于新能源汽车行业的 PPT 大纲",
+        }))
+    return _stream_summary(results)
+
+
+async def scenario_content_throughput(client, args) -> Dict[str, Any]:
+    results = []
+    for i in range(args.iterations):
+        results.append(await _consume_sse(client, "/api/v1/stream/content", {
+            "session_id": f"bench-content-{i}",
+            "user_message": "把每一页的要点改写得更精炼",
+            "current_slides": SAMPLE_SLIDES,
+        }))
+    return _stream_summary(results)
+
+
+async def scenario_prompt_cache(client, args) -> Dict[str, Any]:
+    """同一会话连续精修 (每轮幻灯片都有改动)，统计每轮提示词的前缀缓存命中率"""
+    slides = [dict(s) for s in SAMPLE_SLIDES]
+    turns = []
+    for i in range(max(args.iterations, 3)):
+        slides[-1] = {**slides[-1], "title": f"{SAMPLE_SLIDES[-1]['title']} (v{i})"}
+        result = await _consume_sse(client, "/api/v1/stream/content", {
+            "session_id": "bench-prompt-cache",
+            "user_message": f"第 {i + 1} 轮：把每一页的要点改写得更精炼",
+            "current_slides": slides,
+        })
+        usage = result["usage"]
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        hit = usage.get("prompt_cache_hit_tokens", 0)
+        turns.append({"prompt_tokens": prompt_tokens, "cache_hit_tokens": hit,
+                      "hit_ratio": round(hit / prompt_tokens, 3) if prompt_tokens else 0.0})
+    return {"turns": turns}
+
+
+async def scenario_concurrent_sse(client, args) -> Dict[str, Any]:
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        _consume_sse(client, "/api/v1/stream/outline", {
+            "session_id": f"bench-concurrent-{i}",
+            "user_message": "生成一份关于企业数字化转型的 PPT 大纲",
+        })
+        for i in range(args.concurrency)
+    ])
+    wall = time.perf_counter() - started
+    return {
+        "concurrency": args.concurrency,
+        "wall_s": round(wall, 3),
+        "aggregate_events_per_s": round(sum(r["events"] for r in results) / wall, 2),
+        **_stream_summary(results),
+    }
+
+
+def _sample_file(args, name: str) -> bytes:
+    """每个文件内容唯一 (带文件名前缀)，避免命中内容去重"""
+    body = SAMPLE_DOCUMENT * max(1, args.document_kb * 1024 // len(SAMPLE_DOCUMENT.encode("utf-8")))
+    return f"# {name}\n{body}".encode("utf-8")
+
+
+async def scenario_upload_ingestion(client, args) -> Dict[str, Any]:
+    from app.services.rag import rag_service
+
+    chunks_before = len(rag_service.vector_store.texts)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(args.files):
+        t0 = time.perf_counter()
+        response = await client.post(
+            "/api/v1/rag/upload",
+            data={"session_id": "bench-rag"},
+            files={"file": (f"doc_{i}.txt", _sample_file(args, f"doc_{i}"), "text/plain")},
+        )
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    wall = time.perf_counter() - started
+    chunks = len(rag_service.vector_store.texts) - chunks_before
+    return {
+        "files": args.files,
+        "file_kb": round(len(_sample_file(args, "doc_0")) / 1024, 1),
+        "chunks": chunks,
+        "files_per_s": round(args.files / wall, 2),
+        "chunks_per_s": round(chunks / wall, 2),
+        "upload_ms": summarize(latencies),
+    }
+
+
+async def scenario_bulk_ingestion(client, args) -> Dict[str, Any]:
+    from app.services.rag import rag_service
+
+    chunks_before = len(rag_service.vector_store.texts)
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/v1/rag/upload/batch",
+        data={"session_id": "bench-rag"},
+        files=[("files", (f"bulk_{i}.txt", _sample_file(args, f"bulk_{i}"), "text/plain")) for i in range(args.files)],
+    )
+    response.raise_for_status()
+    wall = time.perf_counter() - started
+    chunks = len(rag_service.vector_store.texts) - chunks_before
+    return {
+        "files": args.files,
+        "failed": response.json()["failed"],
+        "chunks": chunks,
+        "files_per_s": round(args.files / wall, 2),
+        "chunks_per_s": round(chunks / wall, 2),
+        "wall_ms": round(wall * 1000, 1),
+    }
+
+
+async def scenario_search_latency(client, args) -> Dict[str, Any]:
+    from app.services.rag import rag_service
+
+    queries = ["电池成本", "充电基础设施", "智能座舱与辅助驾驶", "产业链上游原材料"]
+    latencies = []
+    for i in range(args.queries):
+        t0 = time.perf_counter()
+        await asyncio.to_thread(rag_service.search_context, queries[i % len(queries)], "bench-rag")
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return {
+        "indexed_chunks": len(rag_service.vector_store.texts),
+        "latency_ms": summarize(latencies),
+    }
+
+
+# 顺序有意义：search_latency 依赖 upload_ingestion 写入的数据
+SCENARIOS = {
+    "outline_ttft": scenario_outline_ttft,
+    "content_throughput": scenario_content_throughput,
+    "prompt_cache": scenario_prompt_cache,
+    "concurrent_sse": scenario_concurrent_sse,
+    "upload_ingestion": scenario_upload_ingestion,
+    "bulk_ingestion": scenario_bulk_ingestion,
+    "search_latency": scenario_search_latency,
+}
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+async def run(args) -> Dict[str, Any]:
+    names = list(SCENARIOS) if args.scenarios == "all" else args.scenarios.split(",")
+    stub_config = StubConfig(args.ttft_ms, args.tokens_per_s, args.completion_tokens)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+        "scenarios": {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir, \
+            BackgroundServer(create_stub_app(stub_config)) as stub:
+        _configure(stub.url, workdir)
+        from app.main import app
+        with BackgroundServer(app) as server:
+            limits = httpx.Limits(max_connections=args.concurrency + 10)
+            async with httpx.AsyncClient(base_url=server.url, timeout=120, limits=limits) as client:
+                for name in names:
+                    started = time.perf_counter()
+                    report["scenarios"][name] = await SCENARIOS[name](client, args)
+                    print(f"[bench] {name} done in {time.perf_counter() - started:.2f}s")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChatPPT offline benchmark suite")
+    parser.add_argument("--scenarios", default="all", help=f"逗号分隔: {','.join(SCENARIOS)}")
+    parser.add_argument("--output", default="", help="结果 JSON 路径，缺省为 benchmarks/results/<时间戳>.json")
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=300)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--document-kb", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", datetime.now().strftime("%Y%m%d_%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report["scenarios"], ensure_ascii=False, indent=2))
+    print(f"[bench] results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+OpenAI 兼容的本地 LLM 桩服务 (Stub)
+
+模拟 DeepSeek /chat/completions 的流式行为：
+- ttft_ms: 首 token 延迟
+- tokens_per_s: 之后的出 token 速率
+- completion_tokens: 每次回复的 token 数 (回复内容为合法的幻灯片 JSON 数组)
+- usage: 按 DeepSeek 的格式返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens，
+  以 64 token 为单位模拟与历史请求的最长公共前缀命中 (流式请求需 stream_options.include_usage)
+
+单独运行：
+    python -m benchmarks.stub_llm --port 18080 --ttft-ms 300 --tokens-per-s 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+
+
+@dataclass
+class StubConfig:
+    ttft_ms: float = 300.0
+    tokens_per_s: float = 60.0
+    completion_tokens: int = 400
+    chars_per_token: int = 4
+
+
+def build_reply_tokens(config: StubConfig) -> List[str]:
+    """生成一段约 completion_tokens 个 token 的幻灯片 JSON，并按固定字符数切分"""
+    target_chars = config.completion_tokens * config.chars_per_token
+    slides = [{"slide_type": "title", "title": "基准测试", "subtitle": "Stub", "image_prompt": "abstract"}]
+    while len(json.dumps(slides, ensure_ascii=False)) < target_chars:
+        index = len(slides)
+        slides.append({
+            "slide_type": "content",
+            "title": f"第{index}页",
+            "content": [f"要点 {index}-{j} 用于填充生成长度" for j in range(3)],
+            "image_prompt": "office meeting",
+        })
+    text = json.dumps(slides, ensure_ascii=False)
+    step = config.chars_per_token
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+CACHE_BLOCK_TOKENS = 64
+
+
+class PrefixCache:
+    """模拟提供方的前缀 KV 缓存：命中长度为与任一历史提示词的最长公共前缀"""
+
+    def __init__(self, chars_per_token: int):
+        self.chars_per_token = chars_per_token
+        self.prompts: List[str] = []
+
+    def usage(self, messages: list, completion_tokens: int) -> dict:
+        prompt = "".join(f"<{m.get('role')}>{m.get('content')}" for m in messages)
+        common = max((len(os.path.commonprefix([prompt, p])) for p in self.prompts), default=0)
+        self.prompts.append(prompt)
+        prompt_tokens = len(prompt) // self.chars_per_token
+        hit = (common // self.chars_per_token) // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": hit,
+            "prompt_cache_miss_tokens": prompt_tokens - hit,
+        }
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="stub-llm")
+    tokens = build_reply_tokens(config)
+    cache = PrefixCache(config.chars_per_token)
+
+    def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def _stream(model: str, usage=None):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        await asyncio.sleep(config.ttft_ms / 1000)
+        yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+
+        interval = 1.0 / config.tokens_per_s if config.tokens_per_s > 0 else 0.0
+        started = time.perf_counter()
+        for i, token in enumerate(tokens):
+            # 以绝对时间对齐节拍，避免 sleep 误差累积
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield _chunk(completion_id, model, {"content": token})
+
+        yield _chunk(completion_id, model, {}, finish_reason="stop")
+        if usage:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": [], "usage": usage}
+            yield f"data: {json.dumps(payload)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        usage = cache.usage(body.get("messages") or [], len(tokens))
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            return StreamingResponse(_stream(model, usage if include_usage else None), media_type="text/event-stream")
+
+        await asyncio.sleep((config.ttft_ms + len(tokens) * 1000 / max(config.tokens_per_s, 1e-9)) / 1000)
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BackgroundServer:
+    """在后台线程中运行 uvicorn (用于桩服务与被测应用)"""
+
+    def __init__(self, app, port: int = 0):
+        import uvicorn
+        self.port = port or free_port()
+        self.server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="on"
+        ))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-s", type=float, default=60.0)
+    parser.add_argument("--completion-tokens", type=int, default=400)
+    args = parser.parse_args()
+
+    import uvicorn
+    config = StubConfig(args.ttft_ms, args.tokens_per_s, args.completion_tokens)
+    uvicorn.run(create_app(config), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Pytest 单元测试文件 for app/core/admission.py
+"""
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import admission as admission_module
+from app.core.admission import AdmissionController, AdmissionRejected, BodySizeLimitMiddleware
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    settings = admission_module.settings
+    monkeypatch.setattr(settings, "admission_max_active_streams", 1)
+    monkeypatch.setattr(settings, "admission_session_max_active", 1)
+    monkeypatch.setattr(settings, "admission_session_max_queued", 3)
+    monkeypatch.setattr(settings, "admission_max_queue", 8)
+    monkeypatch.setattr(settings, "admission_queue_timeout_seconds", 5)
+    return settings
+
+
+def test_fair_queue_interleaves_sessions(limits):
+    """
+    测试: 一个会话先排入多个大请求，另一个会话随后到达
+    验证: 出队顺序按虚拟完成时间交错，后到的小请求不会排在重度会话的全部请求之后
+    """
+    async def scenario():
+        controller = AdmissionController()
+        order = []
+        holder = await controller.acquire("warmup", 1)
+
+        async def run(session_id, cost):
+            ticket = await controller.acquire(session_id, cost)
+            order.append(session_id)
+            await asyncio.sleep(0)
+            controller.release(ticket)
+
+        heavy = [asyncio.create_task(run("heavy", 1000)) for _ in range(3)]
+        await asyncio.sleep(0)
+        light = asyncio.create_task(run("light", 10))
+        await asyncio.sleep(0)
+        controller.release(holder)
+        await asyncio.gather(*heavy, light)
+        return order
+
+    order = asyncio.run(scenario())
+    assert order.index("light") <= 1
+
+
+def test_rejects_with_retry_after(limits):
+    """
+    测试: 单会话超过并发 + 排队上限
+    验证: 直接拒绝并给出 Retry-After；归还名额后状态清零
+    """
+    async def scenario():
+        controller = AdmissionController()
+        ticket = await controller.acquire("s1", 10)
+        waiters = [asyncio.create_task(controller.acquire("s1", 10)) for _ in range(3)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as exc:
+            await controller.acquire("s1", 10)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        controller.release(ticket)
+        return exc.value, controller.snapshot()
+
+    rejected, snapshot = asyncio.run(scenario())
+    assert rejected.reason == "session_limit"
+    assert rejected.retry_after >= 1
+    assert snapshot["active"] == 0 and snapshot["queued"] == 0
+
+
+def test_idle_session_finish_tags_are_pruned(limits):
+    """
+    测试: 大量会话各自完成一次请求后离开
+    验证: 不再保留空闲会话的完成标签，V 推进到已服务的最大完成标签
+    """
+    async def scenario():
+        controller = AdmissionController()
+        for i in range(50):
+            ticket = await controller.acquire(f"s{i}", 100)
+            controller.release(ticket)
+        return controller
+
+    controller = asyncio.run(scenario())
+    assert controller._session_finish == {}
+    assert controller.snapshot()["virtual_time"] >= 100
+
+
+def test_body_size_limit():
+    """
+    测试: 请求体超过上限
+    验证: 受限路径返回 413 (Content-Length 与分块传输两种情况)，其他路径不受影响
+    """
+    app = FastAPI()
+
+    @app.post("/api/v1/stream/echo")
+    async def echo(payload: dict):
+        return payload
+
+    @app.post("/other")
+    async def other(payload: dict):
+        return payload
+
+    app.add_middleware(BodySizeLimitMiddleware, max_bytes=64, path_prefixes=("/api/v1/stream",))
+    client = TestClient(app)
+    big = {"text": "x" * 200}
+
+    assert client.post("/api/v1/stream/echo", json={"text": "ok"}).status_code == 200
+    assert client.post("/api/v1/stream/echo", json=big).status_code == 413
+    chunked = client.post("/api/v1/stream/echo", content=iter([b'{"text": "', b"x" * 200, b'"}']))
+    assert chunked.status_code == 413
+    assert client.post("/other", json=big).status_code == 200
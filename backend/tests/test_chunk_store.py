@@ -0,0 +1,117 @@
+"""
+Pytest 单元测试文件 for app/services/chunk_store.py
+"""
+import os
+import struct
+import threading
+
+from app.services.chunk_store import COMPACT_MARKER, COMPACT_SUFFIX, DATA_FILE, INDEX_FILE, ChunkStore
+
+
+def test_append_and_resolve_across_reopen(tmp_path):
+    """
+    测试: 追加切片后按 chunk_id 读取，重新打开存储后 id 与内容保持不变
+    验证: 未知 id 返回 None；LRU 容量生效
+    """
+    store = ChunkStore(str(tmp_path), cache_size=1)
+    ids = store.append(["电池成本下降", "charging network"], [{"file_id": "a", "page": 1}, {"file_id": "b"}])
+    more = store.append(["第三段"], [{"file_id": "a"}])
+    assert more[0] == ids[-1] + 1
+    assert store.get([ids[1], ids[0], 42]) == [("charging network", {"file_id": "b"}), ("电池成本下降", {"file_id": "a", "page": 1}), None]
+    assert store.stats()["cached"] == 1
+    store.close()
+
+    reopened = ChunkStore(str(tmp_path))
+    assert len(reopened) == 3
+    assert reopened.get([more[0]]) == [("第三段", {"file_id": "a"})]
+    assert reopened.append(["x"], [{}])[0] == more[0] + 1
+
+
+def test_incomplete_tail_is_discarded(tmp_path):
+    """测试: 写入中途崩溃 (索引项不完整 / 数据尾部未被索引) 后重新打开，只保留完整记录"""
+    store = ChunkStore(str(tmp_path))
+    ids = store.append(["one", "two"], [{}, {}])
+    store.close()
+    with open(tmp_path / INDEX_FILE, "ab") as f:
+        f.write(b"\x00" * 5)
+    with open(tmp_path / DATA_FILE, "ab") as f:
+        f.write(b"partial record")
+
+    reopened = ChunkStore(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.get(ids) == [("one", {}), ("two", {})]
+    assert os.path.getsize(tmp_path / DATA_FILE) == len("onetwo{}{}")
+
+
+def test_rebuilt_store_does_not_resolve_stale_ids(tmp_path):
+    """测试: 切片存储被重建 (新 epoch) 后，向量库中残留的旧 chunk_id 不会解析到新内容"""
+    old_ids = ChunkStore(str(tmp_path / "old")).append(["old"], [{}])
+    fresh = ChunkStore(str(tmp_path / "new"))
+    fresh.append(["new"], [{}])
+    assert fresh.get(old_ids) == [None]
+
+
+def test_compaction_reclaims_deleted_files_and_keeps_ids(tmp_path):
+    """
+    测试: 删除一个文件的切片后压缩
+    验证: 数据文件缩小；保留切片的 id 与内容不变，被回收的 id 返回 None；重新打开后结果一致，可继续追加
+    """
+    store = ChunkStore(str(tmp_path))
+    dropped = store.append(["旧文档" * 100, "旧文档第二段"], [{"file_id": "old"}, {"file_id": "old"}])
+    kept = store.append(["保留的切片"], [{"file_id": "new"}])
+    before = os.path.getsize(tmp_path / DATA_FILE)
+
+    store.delete_files(["old"])
+    stats = store.compact()
+
+    assert stats["reclaimed"] == 2
+    assert os.path.getsize(tmp_path / DATA_FILE) < before
+    assert store.get(dropped + kept) == [None, None, ("保留的切片", {"file_id": "new"})]
+    assert store.pending_deletes() == 0
+    store.close()
+
+    reopened = ChunkStore(str(tmp_path))
+    assert reopened.get(kept) == [("保留的切片", {"file_id": "new"})]
+    assert reopened.append(["x"], [{}])[0] == kept[0] + 1
+    assert reopened.get([kept[0] + 1]) == [("x", {})]
+
+
+def test_interrupted_compaction_is_completed_on_open(tmp_path):
+    """测试: 压缩产物与完成标记已落盘但尚未替换时崩溃，重新打开后完成替换；无标记时丢弃产物"""
+    store = ChunkStore(str(tmp_path))
+    ids = store.append(["a" * 50, "b"], [{"file_id": "x"}, {"file_id": "y"}])
+    store.delete_files(["x"])
+    store.compact()
+    compacted_data = (tmp_path / DATA_FILE).read_bytes()
+    compacted_index = (tmp_path / INDEX_FILE).read_bytes()
+    store.close()
+
+    # 模拟: 新文件写好并写入标记后、替换前崩溃 (当前文件仍是压缩前的内容)
+    (tmp_path / (DATA_FILE + COMPACT_SUFFIX)).write_bytes(compacted_data)
+    (tmp_path / (INDEX_FILE + COMPACT_SUFFIX)).write_bytes(compacted_index)
+    (tmp_path / DATA_FILE).write_bytes(b"a" * 50 + b'{"file_id":"x"}' + b'b{"file_id":"y"}')
+    (tmp_path / INDEX_FILE).write_bytes(b"".join([
+        struct.pack("<QII", 0, 50, 15), struct.pack("<QII", 65, 1, 15),
+    ]))
+    (tmp_path / COMPACT_MARKER).write_bytes(b"")
+    reopened = ChunkStore(str(tmp_path))
+    assert reopened.get(ids) == [None, ("b", {"file_id": "y"})]
+    assert not (tmp_path / COMPACT_MARKER).exists()
+    reopened.close()
+
+    (tmp_path / (DATA_FILE + COMPACT_SUFFIX)).write_bytes(b"garbage")
+    reopened = ChunkStore(str(tmp_path))
+    assert not (tmp_path / (DATA_FILE + COMPACT_SUFFIX)).exists()
+    assert reopened.get(ids) == [None, ("b", {"file_id": "y"})]
+
+
+def test_reads_do_not_block_on_writer(tmp_path):
+    """测试: 写锁被占用 (写入/压缩进行中) 时读取仍可完成"""
+    store = ChunkStore(str(tmp_path))
+    ids = store.append(["a"], [{}])
+    with store._lock:
+        done = []
+        reader = threading.Thread(target=lambda: done.append(store.get(ids)))
+        reader.start()
+        reader.join(timeout=1)
+    assert done == [[("a", {})]]
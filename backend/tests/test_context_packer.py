@@ -0,0 +1,61 @@
+"""
+Pytest 单元测试文件 for app/services/context_packer.py
+"""
+
+import numpy as np
+
+from app.services.context_packer import Candidate, mmr_order, pack_context, trim_overlap
+
+
+def _unit(*values):
+    vec = np.asarray(values, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def test_mmr_prefers_diverse_candidate_over_duplicate():
+    """测试: 与已选结果高度相似的候选被后置，即使其相关度更高"""
+    query = _unit(1, 1, 0)
+    vectors = np.stack([_unit(1, 0.9, 0), _unit(1, 0.95, 0), _unit(0.2, 1, 0.3)])
+
+    order = mmr_order(query, vectors, lambda_mult=0.5)
+
+    assert order[0] in (0, 1)
+    assert order[1] == 2
+
+
+def test_trim_overlap_removes_shared_boundary():
+    """测试: 切分器在相邻切片间保留的重叠部分被裁掉"""
+    overlap = "重叠的边界内容" * 4
+    previous = "第一段正文内容。" * 5 + overlap
+    current = overlap + "第二段新增内容。" * 5
+
+    trimmed = trim_overlap(current, [previous])
+
+    assert trimmed == ("第二段新增内容。" * 5)
+
+
+def test_pack_respects_budget_and_splits_fairly_across_files():
+    """测试: 总预算受控，且一个文件的高相关切片不会挤占其他文件的额度"""
+    query = _unit(1, 0, 0)
+    candidates = [
+        Candidate(f"文件A的第{i}段内容，" * 10, _unit(1, 0.05 * i, 0.01), "a") for i in range(6)
+    ] + [
+        Candidate(f"文件B的第{i}段内容，" * 10, _unit(0.6, 0.4, 0.1 * i), "b") for i in range(3)
+    ]
+
+    packed = pack_context(query, candidates, token_budget=150, lambda_mult=0.7)
+
+    files = [c.file_id for c in packed]
+    assert "a" in files and "b" in files
+    from app.core.tokens import estimate_tokens
+    assert sum(estimate_tokens(c.text) for c in packed) <= 150
+
+
+def test_pack_drops_exact_duplicates():
+    query = _unit(1, 0, 0)
+    text = "完全相同的切片内容出现在两个文件中。" * 3
+    candidates = [Candidate(text, _unit(1, 0, 0), "a"), Candidate(text, _unit(1, 0, 0), "b")]
+
+    packed = pack_context(query, candidates, token_budget=1000)
+
+    assert len(packed) == 1
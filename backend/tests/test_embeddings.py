@@ -0,0 +1,37 @@
+"""
+Pytest 单元测试文件 for app/services/embeddings.py
+"""
+
+import numpy as np
+
+from app.services.embeddings import pool_and_normalize
+
+
+def test_mean_pooling_ignores_padding():
+    """测试: mean pooling 只统计 attention_mask=1 的 token，且输出为单位向量"""
+    hidden = np.array([[[1.0, 0.0], [3.0, 0.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+
+    pooled = pool_and_normalize(hidden, mask)
+
+    np.testing.assert_allclose(pooled, [[1.0, 0.0]], atol=1e-6)
+
+
+def test_outputs_are_l2_normalized():
+    """测试: 与 normalize_embeddings=True 语义一致 (每行范数为 1)"""
+    rng = np.random.default_rng(0)
+    hidden = rng.normal(size=(4, 7, 16)).astype(np.float32)
+    mask = np.ones((4, 7), dtype=np.int64)
+
+    pooled = pool_and_normalize(hidden, mask)
+
+    np.testing.assert_allclose(np.linalg.norm(pooled, axis=1), np.ones(4), atol=1e-5)
+
+
+def test_cls_pooling_uses_first_token():
+    hidden = np.array([[[0.0, 2.0], [5.0, 5.0]]], dtype=np.float32)
+    mask = np.array([[1, 1]])
+
+    pooled = pool_and_normalize(hidden, mask, pooling="cls")
+
+    np.testing.assert_allclose(pooled, [[0.0, 1.0]], atol=1e-6)
@@ -0,0 +1,46 @@
+"""
+Pytest 单元测试文件 for app/main.py (存活/就绪探针)
+"""
+
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+# 不使用 with 语句，避免触发 lifespan 中的后台预热
+client = TestClient(app)
+
+
+def test_health_is_liveness_only():
+    """测试: /health 不依赖任何外部服务 -> 200"""
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json() == {"status": "healthy"}
+
+
+def test_ready_reports_unready_dependencies():
+    """测试: 依赖未就绪时 /ready 返回 503，并给出逐项检查结果"""
+    with patch("app.main.ping_redis", new=AsyncMock(return_value=True)):
+        response = client.get("/ready")
+
+    assert response.status_code == 503
+    data = response.json()
+    assert data["status"] == "not_ready"
+    assert data["checks"]["redis"] is True
+    assert data["checks"]["embedding_model"] is False
+    assert "import_app" in data["startup_timings"]
+
+
+def test_ready_when_all_checks_pass():
+    """测试: 所有依赖就绪时 /ready 返回 200"""
+    with patch("app.main.ping_redis", new=AsyncMock(return_value=True)), \
+         patch("app.main.generation.services_ready", return_value=True), \
+         patch("app.main.rag_service") as mock_rag:
+        mock_rag.is_ready = True
+        mock_rag.is_model_ready = True
+        mock_rag.ping_vector_store.return_value = True
+        mock_rag.startup_timings = {}
+        response = client.get("/ready")
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
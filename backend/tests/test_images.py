@@ -0,0 +1,128 @@
+"""
+Pytest 单元测试文件 for app/services/images.py
+"""
+import asyncio
+import io
+import os
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.main import app
+from app.services import images as images_module
+from app.services.images import DictionaryKeywordProvider, ImageService
+
+
+def _png_bytes(color=(30, 120, 200)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 900), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_dictionary_provider_prefers_longest_term():
+    """测试: 本地词典解析关键词 (长词优先，英文取首个实词，兜底 business)"""
+    provider = DictionaryKeywordProvider()
+    assert provider.resolve("人工智能在医疗中的应用") == "robot"
+    assert provider.resolve("A photo of electric cars") == "electric"
+    assert provider.resolve("！！！") == "business"
+
+
+def test_resolve_downloads_once_and_serves_variants(tmp_path, monkeypatch):
+    """
+    测试: 多个请求解析同一提示词
+    验证: 只下载一次；生成各尺寸变体；同源接口返回不可变缓存头，ETag 命中返回 304
+    """
+    monkeypatch.setattr(images_module.settings, "output_dir", str(tmp_path))
+    service = ImageService()
+    downloads = []
+
+    async def fake_download(url):
+        downloads.append(url)
+        await asyncio.sleep(0.01)
+        return _png_bytes()
+
+    monkeypatch.setattr(service, "_download", fake_download)
+    monkeypatch.setattr(images_module, "image_service", service)
+    monkeypatch.setattr("app.routers.images.image_service", service)
+
+    async def scenario():
+        return await asyncio.gather(*[service.resolve("新能源汽车市场分析", 800, 600) for _ in range(3)])
+
+    results = asyncio.run(scenario())
+    assert len(downloads) == 1
+    assert len({r.digest for r in results}) == 1
+    assert results[0].name.endswith("_800x600.jpg")
+    with Image.open(service.local_path(results[0].name)) as variant:
+        assert variant.size == (800, 600)
+
+    client = TestClient(app)
+    response = client.get(f"/api/v1/images/{results[0].name}")
+    assert response.status_code == 200
+    assert "immutable" in response.headers["cache-control"]
+    cached = client.get(f"/api/v1/images/{results[0].name}", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+    assert client.get("/api/v1/images/..%2Fsecret.jpg").status_code == 404
+
+
+def test_followers_finish_when_leader_is_cancelled(tmp_path, monkeypatch):
+    """
+    测试: 首个请求 (负责下载) 在下载途中被取消
+    验证: 等待同一来源的其他请求不会挂起，由它们重新下载并拿到结果
+    """
+    monkeypatch.setattr(images_module.settings, "output_dir", str(tmp_path))
+    service = ImageService()
+    downloads = []
+
+    async def fake_download(url):
+        downloads.append(url)
+        await asyncio.sleep(0.05)
+        return _png_bytes()
+
+    monkeypatch.setattr(service, "_download", fake_download)
+
+    async def scenario():
+        leader = asyncio.create_task(service.resolve("市场分析", 400, 300))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(service.resolve("市场分析", 400, 300)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*followers), 2)
+        return leader, results
+
+    leader, results = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert len({r.digest for r in results}) == 1
+    assert len(downloads) == 2
+    assert service._fetches == {}
+
+
+def test_prune_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    """测试: 缓存超过上限时按最近使用时间整组淘汰 (原图 + 变体 + 来源引用)"""
+    monkeypatch.setattr(images_module.settings, "output_dir", str(tmp_path))
+    service = ImageService()
+    colors = iter([(200, 30, 30), (30, 200, 30)])
+
+    async def fake_download(url):
+        return _png_bytes(next(colors))
+
+    monkeypatch.setattr(service, "_download", fake_download)
+
+    async def scenario():
+        old = await service.resolve("旧主题 A", 400, 300)
+        os.utime(service.local_path(f"{old.digest}.jpg"), (1, 1))
+        new = await service.resolve("新主题 B", 400, 300)
+        return old, new
+
+    old, new = asyncio.run(scenario())
+    group_bytes = sum(
+        os.path.getsize(os.path.join(tmp_path, "image_cache", new.digest[:2], name))
+        for name in os.listdir(os.path.join(tmp_path, "image_cache", new.digest[:2]))
+        if name.startswith(new.digest)
+    )
+    monkeypatch.setattr(images_module.settings, "image_cache_max_mb", group_bytes / 1024 / 1024 * 1.5)
+
+    stats = service.prune_cache()
+    assert stats["evicted"] == 1
+    assert service.local_path(f"{old.digest}.jpg") is None
+    assert service.local_path(new.name) is not None
+    assert len(os.listdir(os.path.join(tmp_path, "image_cache", "refs"))) == 1
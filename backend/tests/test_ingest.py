@@ -0,0 +1,37 @@
+"""
+Pytest 单元测试文件 for app/services/ingest.py
+"""
+import asyncio
+
+from app.services import ingest
+
+
+def test_parse_and_split_text_file(tmp_path):
+    """
+    测试: 文本文件解析
+    验证: 长文本被切分为多个不超过 CHUNK_SIZE 的切片，并保留 loader 元数据
+    """
+    path = tmp_path / "notes.txt"
+    path.write_text("\n\n".join(f"第{i}段内容 " * 40 for i in range(10)), encoding="utf-8")
+
+    chunks = ingest.parse_and_split(str(path), "notes.txt")
+
+    assert len(chunks) > 1
+    assert all(len(text) <= ingest.CHUNK_SIZE for text, _ in chunks)
+    assert chunks[0][1]["source"] == str(path)
+
+
+def test_parse_in_pool_matches_inline(tmp_path):
+    """
+    测试: 进程池解析
+    验证: 在子进程中解析的结果与直接调用一致
+    """
+    path = tmp_path / "short.md"
+    path.write_text("# 标题\n\n正文内容", encoding="utf-8")
+
+    try:
+        result = asyncio.run(ingest.parse_in_pool(str(path), "short.md"))
+    finally:
+        ingest.shutdown_parse_pool()
+
+    assert result == ingest.parse_and_split(str(path), "short.md")
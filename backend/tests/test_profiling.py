@@ -0,0 +1,141 @@
+"""
+Pytest 单元测试文件 for app/core/profiling.py 与 app/routers/admin.py
+"""
+
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.profiling import ProfilingMiddleware
+from app.core.timing import ServerTimingMiddleware, stage
+from app.routers.admin import router as admin_router
+
+app = FastAPI()
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(ServerTimingMiddleware)
+app.include_router(admin_router, prefix="/api/v1/admin")
+
+
+@app.get("/blocking")
+def blocking():
+    with stage("work"):
+        time.sleep(0.05)
+    return {"ok": True}
+
+
+client = TestClient(app)
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture(autouse=True)
+def _admin_enabled():
+    with patch.object(settings, "admin_token", "secret"), \
+         patch.object(settings, "profiling_enabled", True):
+        yield
+
+
+def test_no_trace_without_trigger(tmp_path):
+    """测试: 未携带剖析标记且未配置慢阈值时不写追踪文件"""
+    with patch.object(settings, "output_dir", str(tmp_path)), \
+         patch.object(settings, "profile_slow_threshold_ms", 0):
+        client.get("/blocking")
+        assert client.get("/api/v1/admin/traces", headers=ADMIN).json() == []
+
+
+def test_header_trigger_writes_trace_with_stages(tmp_path):
+    """测试: X-Profile 头触发采样剖析，追踪包含阶段耗时与 profile 报告，并可下载"""
+    with patch.object(settings, "output_dir", str(tmp_path)):
+        response = client.get("/blocking", headers={"X-Profile": "1", **ADMIN})
+        assert "work;dur=" in response.headers["server-timing"]
+
+        traces = client.get("/api/v1/admin/traces", headers=ADMIN).json()
+        assert len(traces) == 1
+        assert traces[0]["trigger"] == "header"
+
+        trace = client.get(f"/api/v1/admin/traces/{traces[0]['name']}", headers=ADMIN).json()
+        assert trace["stages"]["work"] >= 40
+        assert trace["profile"]["samples"] > 0
+        assert "blocked_ms" in trace["loop_blocking"]
+
+
+def test_slow_threshold_trace_has_no_profile(tmp_path):
+    """测试: 超过慢阈值的请求只记录阶段耗时 (无采样开销)"""
+    with patch.object(settings, "output_dir", str(tmp_path)), \
+         patch.object(settings, "profile_slow_threshold_ms", 10):
+        client.get("/blocking")
+        traces = client.get("/api/v1/admin/traces", headers=ADMIN).json()
+
+    assert traces[0]["trigger"] == "slow"
+
+
+def test_admin_token_required_when_configured(tmp_path):
+    """测试: 配置 admin_token 后管理接口必须携带匹配的 X-Admin-Token"""
+    assert client.get("/api/v1/admin/traces").status_code == 403
+    assert client.get("/api/v1/admin/traces", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/api/v1/admin/traces", headers=ADMIN).status_code == 200
+
+
+def test_admin_and_profiling_disabled_without_token(tmp_path):
+    """测试: 未配置 admin_token 时管理接口返回 404，剖析标记被忽略"""
+    with patch.object(settings, "admin_token", ""), \
+         patch.object(settings, "output_dir", str(tmp_path)):
+        assert client.get("/api/v1/admin/traces", headers=ADMIN).status_code == 404
+        client.get("/blocking?profile=1", headers={"X-Profile": "1", **ADMIN})
+
+    assert not (tmp_path / "traces").exists()
+
+
+def test_profile_trigger_requires_admin_token(tmp_path):
+    """测试: 不带 X-Admin-Token 的剖析请求不会触发采样"""
+    with patch.object(settings, "output_dir", str(tmp_path)):
+        client.get("/blocking", headers={"X-Profile": "1"})
+        assert client.get("/api/v1/admin/traces", headers=ADMIN).json() == []
+
+
+def test_query_trigger_parses_profile_parameter(tmp_path):
+    """测试: ?profile=1 通过查询参数解析触发，相似的参数名 (noprofile=1) 不触发"""
+    with patch.object(settings, "output_dir", str(tmp_path)):
+        client.get("/blocking?noprofile=1", headers=ADMIN)
+        assert client.get("/api/v1/admin/traces", headers=ADMIN).json() == []
+
+        client.get("/blocking?x=2&profile=true", headers=ADMIN)
+        traces = client.get("/api/v1/admin/traces", headers=ADMIN).json()
+
+    assert [t["trigger"] for t in traces] == ["query"]
+
+
+def test_profiled_requests_are_serialized(tmp_path):
+    """测试: 并发的剖析请求串行执行，采样窗口不重叠"""
+    active = {"now": 0, "max": 0}
+
+    async def inner(scope, receive, send):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.02)
+        active["now"] -= 1
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = ProfilingMiddleware(inner)
+    scope = {
+        "type": "http", "method": "GET", "path": "/x", "query_string": b"profile=1",
+        "headers": [(b"x-admin-token", b"secret")],
+    }
+
+    async def send(message):
+        pass
+
+    async def main():
+        await asyncio.gather(*(middleware(dict(scope), None, send) for _ in range(3)))
+
+    with patch.object(settings, "output_dir", str(tmp_path)):
+        asyncio.run(main())
+
+    assert active["max"] == 1
+    assert len(list((tmp_path / "traces").iterdir())) == 3
@@ -0,0 +1,92 @@
+"""
+Pytest 单元测试文件 for app/services/prompting.py 与 app/services/llm.py
+"""
+import asyncio
+
+from openai.types import CompletionUsage
+
+from app.core.timing import StageTimer, bind_timer
+from app.services.content import CONTENT_SYSTEM_PROMPT
+from app.services.llm import UsageRecordingCompletions
+from app.services.prompting import assemble_context, build_chat_prompt, format_turn
+
+
+def test_context_segments_ordered_by_stability():
+    """测试: 易变上下文按 知识库上下文 -> 当前幻灯片 排列，两者皆无时不追加消息"""
+    context = assemble_context("电池成本下降", deck='[{"title": "A"}]')
+    assert context.index("电池成本下降") < context.index('[{"title": "A"}]')
+    assert assemble_context() == ""
+
+    prompt = build_chat_prompt(CONTENT_SYSTEM_PROMPT)
+    assert [m.type for m in format_turn(prompt, [], "精炼要点")] == ["system", "human"]
+    assert [m.type for m in format_turn(prompt, [], "精炼要点", context)] == ["system", "human", "human"]
+
+
+def test_next_turn_reuses_previous_request_as_prefix(monkeypatch):
+    """
+    测试: 同一会话连续两轮精修 (幻灯片与知识库上下文每轮都变)
+    验证: 第 N 轮请求除最后一条易变上下文外，逐字节是第 N+1 轮请求的前缀
+    """
+    from app.services import content as content_module
+    from app.testing.fakes import ScriptedChatModel
+
+    monkeypatch.setattr(content_module.settings, "deepseek_api_key", "test")
+    monkeypatch.setattr(content_module.settings, "chat_history_backend", "memory")
+    model = ScriptedChatModel(reply='[{"title": "新标题", "content": ["要点"]}]')
+    monkeypatch.setattr(content_module, "create_chat_model", lambda **kwargs: model)
+    contexts = iter(["第一轮检索结果", "第二轮检索结果"])
+    monkeypatch.setattr(content_module.rag_service, "search_context", lambda *args: next(contexts))
+    generator = content_module.ContentGeneratorV1()
+
+    async def scenario():
+        for i, title in enumerate(["旧标题", "新标题"]):
+            slides = [{"title": title, "content": [f"v{i}"]}]
+            async for _ in generator.generate_content_stream("prefix-session", "精炼要点", slides, ["f1"]):
+                pass
+
+    asyncio.run(scenario())
+    render = lambda messages: "".join(f"<{m.type}>{m.content}" for m in messages)
+    turn_n, turn_next = model.calls
+    assert "第一轮检索结果" in turn_n[-1].content
+    assert render(turn_next).startswith(render(turn_n[:-1]))
+    assert len(turn_next) == len(turn_n) + 2
+
+
+def test_streaming_usage_records_cache_hits():
+    """测试: 流式响应最后一个 chunk 的 DeepSeek usage (缓存命中字段) 写入当前请求计时器"""
+    class Chunk:
+        def __init__(self, usage=None):
+            self.usage = usage
+
+    class FakeStream:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc_info):
+            return None
+
+        async def __aiter__(self):
+            yield Chunk()
+            yield Chunk(CompletionUsage.model_validate({
+                "prompt_tokens": 1000, "completion_tokens": 50, "total_tokens": 1050,
+                "prompt_cache_hit_tokens": 768, "prompt_cache_miss_tokens": 232,
+            }))
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            return FakeStream()
+
+    async def scenario():
+        timer = StageTimer("content")
+        bind_timer(timer)
+        response = await UsageRecordingCompletions(FakeCompletions()).create(stream=True)
+        async with response:
+            chunks = [chunk async for chunk in response]
+        return timer, chunks
+
+    timer, chunks = asyncio.run(scenario())
+    assert len(chunks) == 2
+    assert timer.usage == {
+        "prompt_tokens": 1000, "completion_tokens": 50,
+        "prompt_cache_hit_tokens": 768, "prompt_cache_miss_tokens": 232,
+    }
@@ -0,0 +1,216 @@
+"""
+Pytest 单元测试文件 for app/services/rag.py (内容去重与向量引用计数)
+"""
+import asyncio
+import io
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from app.services import rag as rag_module
+from app.services.ingest import parse_and_split
+from app.testing.fakes import FakeEmbeddings, InMemoryVectorStore
+
+DOCUMENT = "新能源汽车行业报告。电池成本持续下降，充电网络快速扩张。" * 60
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_module, "METADATA_FILE", str(tmp_path / "meta.json"))
+    monkeypatch.setattr(rag_module, "TOMBSTONE_FILE", str(tmp_path / "tombstones.json"))
+    monkeypatch.setattr(rag_module, "TEMP_UPLOAD_DIR", str(tmp_path))
+
+    async def parse_inline(file_path, filename):
+        return parse_and_split(file_path, filename)
+
+    monkeypatch.setattr(rag_module, "parse_in_pool", parse_inline)
+
+    svc = rag_module.RagService()
+    svc.embeddings = FakeEmbeddings(dim=64)
+    svc.vector_store = InMemoryVectorStore(svc.embeddings)
+    svc._is_initialized = True
+    return svc
+
+
+def _upload(svc, session_id, *names):
+    files = [UploadFile(io.BytesIO(DOCUMENT.encode("utf-8")), filename=name) for name in names]
+    return asyncio.run(svc.handle_bulk_upload(files, session_id))
+
+
+def test_same_content_is_indexed_once_and_shared(service):
+    """
+    测试: 不同会话上传相同内容
+    验证: 第二次上传直接引用已有向量，且检索仍按会话可见文件过滤
+    """
+    first = _upload(service, "s1", "report.txt")[0]
+    chunks = len(service.vector_store.texts)
+    second = _upload(service, "s2", "copy.txt")[0]
+
+    assert not first.deduplicated
+    assert second.deduplicated
+    assert len(service.vector_store.texts) == chunks
+    assert service.search_context("电池成本", "s2")
+    assert service.search_context("电池成本", "s3") == ""
+
+
+def test_file_preview_is_scoped_to_session(service):
+    """测试: 兜底预览只返回调用方会话拥有的文件内容，其他会话拿到文件 id 也读不到"""
+    uploaded = _upload(service, "s1", "report.txt")[0]
+
+    assert "电池成本" in service.fetch_file_preview("s1", [uploaded.id])
+    assert service.fetch_file_preview("s2", [uploaded.id]) == ""
+
+
+def test_duplicates_within_one_batch_share_vectors(service):
+    """测试: 同一批次内的重复文件只解析与编码一次"""
+    results = _upload(service, "s1", "a.txt", "b.txt")
+
+    assert [r.status for r in results] == ["indexed", "indexed"]
+    assert [r.deduplicated for r in results] == [False, True]
+    assert {m["file_id"] for m in service.vector_store.metadatas} == {results[0].id}
+
+
+def test_vectors_deleted_only_with_last_reference(service):
+    """
+    测试: 删除共享内容的文件
+    验证: 仍有引用时保留向量，最后一个引用删除后才物理删除
+    """
+    first = _upload(service, "s1", "report.txt")[0]
+    second = _upload(service, "s2", "report.txt")[0]
+
+    service.delete_file(first.id)
+    service.flush_tombstones()
+    assert service.vector_store.texts
+    assert service.search_context("电池成本", "s2")
+
+    service.delete_file(second.id)
+    assert service.search_context("电池成本", "s2") == ""
+    assert service.flush_tombstones() == 1
+    assert service.vector_store.texts == []
+
+
+def test_sweep_expires_idle_sessions_in_batches(service, monkeypatch):
+    """
+    测试: 会话 TTL 清理
+    验证: 闲置超时的会话被移除，其向量被批量删除；活跃会话不受影响
+    """
+    monkeypatch.setattr(rag_module.settings, "rag_session_ttl_seconds", 60)
+    stale = _upload(service, "old", "report.txt")[0]
+    service._load_metadata()[stale.id]["last_access"] -= 3600
+    fresh = asyncio.run(service.handle_bulk_upload(
+        [UploadFile(io.BytesIO(("另一份文档，讨论储能与光伏。" * 80).encode("utf-8")), filename="other.txt")], "new"
+    ))[0]
+
+    stats = service.sweep()
+
+    assert stats["sessions_expired"] == 1
+    assert stats["vector_files_purged"] == 1
+    assert service.list_files("old") == []
+    assert {m["file_id"] for m in service.vector_store.metadatas} == {fresh.id}
+
+
+def test_sweep_compaction_reclaims_chunk_store(service, monkeypatch):
+    """测试: 删除文件后的压缩会回收本地切片存储中的记录，剩余切片 id 不变且仍可检索"""
+    monkeypatch.setattr(rag_module.settings, "rag_compact_interval_seconds", 1)
+    kept = _upload(service, "s1", "report.txt")[0]
+    removed = asyncio.run(service.handle_bulk_upload(
+        [UploadFile(io.BytesIO(("另一份文档，讨论储能与光伏。" * 80).encode("utf-8")), filename="other.txt")], "s1"
+    ))[0]
+    chunk_store = service.vector_store.chunk_store
+    size_before = chunk_store.stats()["bytes"]
+
+    service.delete_file(removed.id)
+    service._last_compact -= 10
+    stats = service.sweep()
+
+    assert stats["compacted"]
+    assert chunk_store.pending_deletes() == 0
+    assert chunk_store.stats()["bytes"] < size_before
+    assert {m["file_id"] for m in service.vector_store.metadatas} == {kept.id}
+    assert service.search_context("电池成本", "s1")
+
+
+def test_failed_state_write_keeps_previous_file(service, monkeypatch):
+    """测试: 写盘中途失败 (如磁盘写满) 时旧元数据文件保持完整，且不遗留临时文件"""
+    uploaded = _upload(service, "s1", "report.txt")[0]
+
+    def fail(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(rag_module.os, "replace", fail)
+    with pytest.raises(OSError):
+        service.delete_file(uploaded.id)
+
+    directory = rag_module.os.path.dirname(rag_module.METADATA_FILE)
+    assert not [name for name in rag_module.os.listdir(directory) if name.endswith(".tmp")]
+    with open(rag_module.METADATA_FILE, encoding="utf-8") as f:
+        assert uploaded.id in rag_module.json.load(f)
+
+
+def test_corrupt_state_is_not_replaced_by_empty_state(service):
+    """测试: 元数据或墓碑文件损坏时拒绝以空状态继续，原文件保留供排查"""
+    for path in (rag_module.METADATA_FILE, rag_module.TOMBSTONE_FILE):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('{"truncated": ')
+
+    with pytest.raises(RuntimeError):
+        service.list_files("s1")
+    with pytest.raises(RuntimeError):
+        service.flush_tombstones()
+    for path in (rag_module.METADATA_FILE, rag_module.TOMBSTONE_FILE):
+        with open(path, encoding="utf-8") as f:
+            assert f.read() == '{"truncated": '
+
+
+def test_failed_insert_tombstones_partial_writes(service, monkeypatch):
+    """
+    测试: 向量写入中途失败 (前一批已写入切片存储与向量库)
+    验证: 上传报错，已写入的行记为墓碑；清理后向量被删除，切片在压缩时回收
+    """
+    monkeypatch.setattr(rag_module.settings, "rag_compact_interval_seconds", 1)
+    store = service.vector_store
+    original = store.add_embeddings
+
+    def fail_after_first_batch(texts, embeddings, metadatas, batch_size=1000):
+        original(texts[:1], embeddings[:1], metadatas[:1])
+        raise RuntimeError("insert failed")
+
+    monkeypatch.setattr(store, "add_embeddings", fail_after_first_batch)
+    result = _upload(service, "s1", "report.txt")[0]
+    orphan_ids = list(store.chunk_ids)
+
+    assert result.status == "error"
+    assert orphan_ids
+    assert service._load_tombstones() == {result.id}
+
+    service._last_compact -= 10
+    stats = service.sweep()
+
+    assert stats["vector_files_purged"] == 1 and stats["compacted"]
+    assert store.chunk_ids == []
+    assert store.chunk_store.get(orphan_ids) == [None] * len(orphan_ids)
+
+
+def test_entries_without_vectors_in_current_collection_are_marked_stale(service):
+    """
+    测试: 集合升级前写入的元数据条目 (无 vector_file_id，或其向量不在当前切片存储中)
+    验证: 启动检查将其标记为 error 且不再参与检索；当前集合中的条目记下集合名，之后不再重复扫描
+    """
+    service.chunk_store = service.vector_store.chunk_store
+    current = _upload(service, "s1", "report.txt")[0]
+    metadata = service._load_metadata()
+    del metadata[current.id]["collection"]
+    metadata["legacy"] = {"id": "legacy", "name": "old.txt", "size": 1, "status": "indexed",
+                          "upload_time": "2025-12-05 22:03", "session_id": "s1"}
+    metadata["v1"] = {**metadata["legacy"], "id": "v1", "vector_file_id": "v1"}
+
+    with service._metadata_lock:
+        assert service._mark_stale_entries() == 2
+        assert service._mark_stale_entries() == 0
+
+    statuses = {f.id: (f.status, f.error) for f in service.list_files("s1")}
+    assert statuses["legacy"] == ("error", rag_module.STALE_ERROR)
+    assert statuses["v1"][0] == "error"
+    assert statuses[current.id] == ("indexed", None)
+    assert service._visible_vector_file_ids("s1", ["legacy", "v1"]) == []
+    assert service.search_context("电池成本", "s1")
@@ -0,0 +1,78 @@
+"""
+Pytest 单元测试文件 for app/services/routing.py
+"""
+import asyncio
+
+import pytest
+
+from app.services import routing
+from app.services.routing import RouteDecision, classify, referenced_slides, stream_with_fallback
+
+SLIDES = [{"title": f"第{i}页", "content": ["要点"]} for i in range(1, 9)]
+
+
+@pytest.fixture(autouse=True)
+def routes(monkeypatch):
+    monkeypatch.setattr(routing.settings, "llm_routes", {
+        "primary": {"model": "deepseek-chat"},
+        "fast": {"model": "small-chat", "fallback": "primary"},
+    })
+    monkeypatch.setattr(routing.settings, "routing_enabled", True)
+
+
+def test_referenced_slides_parses_chinese_and_english():
+    """测试: 从指令中识别页码 (中文数字 / 阿拉伯数字 / slide N)"""
+    assert referenced_slides("把第三页和第12张的标题改短") == [3, 12]
+    assert referenced_slides("shorten the title on slide 2") == [2]
+    assert referenced_slides("把P5改成两栏，page3也一样") == [3, 5]
+    assert referenced_slides("改短一点，参考 GDP5 的数据") == []
+    assert referenced_slides("改短一点") == []
+
+
+@pytest.mark.parametrize("operation, instruction, rag, route, reason", [
+    ("content", "把第三页标题改短一点", False, "fast", "small_edit"),
+    ("content", "把第三页标题改短一点", True, "primary", "rag"),
+    ("content", "把每一页的要点改写得更精炼", False, "primary", "global_edit"),
+    ("content", "标题改短一点", False, "primary", "many_slides"),
+    ("content", "把第二页、第三页、第五页的标题改短", False, "primary", "many_slides"),
+    ("outline", "新能源汽车", False, "primary", "full_generation"),
+])
+def test_classify(operation, instruction, rag, route, reason):
+    """测试: 按指令长度 / 涉及页数 / 是否 RAG 判定路由，无需调用模型"""
+    decision = classify(operation, instruction, SLIDES if operation == "content" else None, rag=rag)
+    assert (decision.route, decision.reason) == (route, reason)
+
+
+def test_unconfigured_light_route_uses_default(monkeypatch):
+    """测试: 未配置轻量路由时回退到默认路由"""
+    monkeypatch.setattr(routing.settings, "llm_routes", {"primary": {"model": "deepseek-chat"}})
+    assert classify("content", "把第三页标题改短一点", SLIDES).route == "primary"
+
+
+def test_fallback_only_before_first_token():
+    """
+    测试: 路由模型在首个 token 前失败 -> 回退到 fallback 路由；
+    已输出内容后失败 -> 直接抛出，不重复输出
+    """
+    calls = []
+
+    def make_stream(fail_after):
+        async def stream(route):
+            calls.append(route)
+            if route == "fast":
+                for token in ["a"][:fail_after]:
+                    yield token
+                raise ConnectionError("fast endpoint down")
+            yield "ok"
+        return stream
+
+    async def collect(stream):
+        return [t async for t in stream_with_fallback("content", RouteDecision("fast", "light", "small_edit"), stream)]
+
+    assert asyncio.run(collect(make_stream(0))) == ["ok"]
+    assert calls == ["fast", "primary"]
+
+    calls.clear()
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect(make_stream(1)))
+    assert calls == ["fast"]
@@ -0,0 +1,83 @@
+"""
+Pytest 单元测试文件 for app/services/slide_repair.py
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.services.slide_repair import finalize_slides, repair_slides
+
+
+@pytest.mark.parametrize("raw, status, titles", [
+    ('[{"slide_type": "title", "title": "A"}]', "valid", ["A"]),
+    ('```json\n[{"title": "A", "content": "- x\\n- y"}]\n```\nHope this helps!', "repaired", ["A"]),
+    ('{"slides": [{"title": "A"}, {"title": "B", "content": ["b"]}]}', "repaired", ["A", "B"]),
+    ('[{"title": "A"}, {"title": "B", "content": ["b1", "b', "repaired", ["A", "B"]),
+    ('[{"title": "A"}, {"title": "B", "conte', "repaired", ["A", "B"]),
+    ('[{"title": "A", "content": [1, 2],},]', "repaired", ["A"]),
+    ('{"refusal": "Please provide a topic."}', "refusal", []),
+    ("抱歉，我无法完成。", "failed", []),
+])
+def test_repair_slides(raw, status, titles):
+    """测试: 围栏/多余文字/包装对象/截断/类型错误/尾逗号/拒答 等输出的本地修复"""
+    result = repair_slides(raw)
+    assert result.status == status
+    assert [s["title"] for s in result.slides] == titles
+    assert all(isinstance(s["content"], list) and s["image_prompt"] for s in result.slides)
+
+
+def test_truncated_output_requests_only_the_tail():
+    """
+    测试: 输出在第二页中途被截断
+    验证: 续写请求收到的是已有文本；拼接时去掉与结尾重复的部分；最终得到完整的两页
+    """
+    raw = '[{"title": "A", "content": ["a"]}, {"title": "B", "content": ["b1", "b'
+    requests = []
+
+    async def continue_fn(partial):
+        requests.append(partial)
+        return '"b1", "b2"]}]'
+
+    event = asyncio.run(finalize_slides("outline", raw, continue_fn))
+    assert requests == [raw]
+    assert event["continued"] and not event["truncated"]
+    assert event["slides"][1]["content"] == ["b1", "b2"]
+
+
+def test_failed_continuation_falls_back_to_local_repair():
+    """测试: 续写失败时使用本地补全的结果，不影响已生成的内容"""
+    async def continue_fn(partial):
+        raise RuntimeError("upstream down")
+
+    event = asyncio.run(finalize_slides("content", '[{"title": "A"}, {"title": "B", "content": ["b', continue_fn))
+    assert event["repair"] == "repaired" and event["truncated"]
+    assert [s["title"] for s in event["slides"]] == ["A", "B"]
+
+
+def test_history_records_repaired_slides(monkeypatch):
+    """
+    测试: 模型输出被截断 (不续写，只做本地补全)
+    验证: 会话历史写入的是修复后的幻灯片 JSON，而不是截断的原始文本
+    """
+    from app.services import outline as outline_module
+    from app.services.history import get_session_history
+    from app.testing.fakes import ScriptedChatModel
+
+    monkeypatch.setattr(outline_module.settings, "deepseek_api_key", "test")
+    monkeypatch.setattr(outline_module.settings, "chat_history_backend", "memory")
+    monkeypatch.setattr(outline_module.settings, "slide_continuation_max_rounds", 0)
+    model = ScriptedChatModel(reply='[{"title": "A"}, {"title": "B", "content": ["b1", "b')
+    monkeypatch.setattr(outline_module, "create_chat_model", lambda **kwargs: model)
+    generator = outline_module.OutlineGenerator()
+
+    async def scenario():
+        return [event async for event in generator.generate_outline_stream("repair-history", "新能源汽车市场")]
+
+    events = asyncio.run(scenario())
+    final = events[-1]
+    stored = get_session_history("repair-history").messages
+
+    assert final["repair"] == "repaired"
+    assert json.loads(stored[-1].content) == final["slides"]
+    assert [s["title"] for s in final["slides"]] == ["A", "B"]
@@ -0,0 +1,240 @@
+"""
+Pytest 单元测试文件 for app/services/stream_broker.py
+"""
+import asyncio
+import json
+
+import pytest
+
+from app.services import stream_broker as broker_module
+from app.services.stream_broker import GenerationBroker
+
+
+@pytest.fixture(autouse=True)
+def memory_backend(monkeypatch):
+    monkeypatch.setattr(broker_module.settings, "stream_backend", "memory")
+
+
+async def _tokens(*tokens, delay=0.0):
+    for token in tokens:
+        await asyncio.sleep(delay)
+        yield token
+
+
+def _parse(frames):
+    events = []
+    for frame in frames:
+        if frame.startswith(":"):
+            continue
+        lines = dict(line.split(": ", 1) for line in frame.strip().split("\n"))
+        events.append((lines["id"], lines["data"]))
+    return events
+
+
+async def _collect(broker, generation_id, last_event_id=None):
+    return _parse([frame async for frame in broker.events(generation_id, last_event_id)])
+
+
+def test_generation_runs_detached_and_replays_after_reconnect():
+    """
+    测试: 客户端读到一半断开，再携带 Last-Event-ID 重连
+    验证: 生成不受断线影响；重连只补发错过的事件并以 [DONE] 结束；名额在生成结束时归还
+    """
+    async def scenario():
+        broker = GenerationBroker()
+        finished = asyncio.Event()
+        generation_id = await broker.start("outline", _tokens("a", "b", "c", delay=0.01), finished.set)
+
+        first = []
+        async for frame in broker.events(generation_id):
+            first.extend(_parse([frame]))
+            if len(first) == 2:
+                break  # 模拟断线
+        await asyncio.wait_for(finished.wait(), 1)
+        resumed = await _collect(broker, generation_id, first[-1][0])
+        full = await _collect(broker, generation_id)
+        return generation_id, first, resumed, full
+
+    generation_id, first, resumed, full = asyncio.run(scenario())
+
+    assert json.loads(first[0][1]) == {"generation_id": generation_id}
+    assert json.loads(first[1][1]) == {"text": "a"}
+    texts = [json.loads(data)["text"] for _, data in resumed if data.startswith('{"text"')]
+    assert texts == ["b", "c"]
+    assert resumed[-1][1] == "[DONE]"
+    assert full[len(first):] == resumed
+
+
+def test_failed_generation_emits_error_then_done():
+    """测试: 生成过程中抛出异常时，订阅者收到 error 事件和 [DONE]"""
+    async def failing():
+        yield "partial"
+        raise RuntimeError("upstream failed")
+
+    async def scenario():
+        broker = GenerationBroker()
+        generation_id = await broker.start("content", failing(), lambda: None)
+        return await _collect(broker, generation_id)
+
+    events = asyncio.run(scenario())
+    assert json.loads(events[-2][1]) == {"error": "upstream failed"}
+    assert events[-1][1] == "[DONE]"
+
+
+def test_last_subscriber_disconnect_cancels_upstream(monkeypatch):
+    """
+    测试: 唯一的订阅者断开且宽限期为 0
+    验证: 生产者立即被取消 (上游生成器收到 CancelledError)，回放以 cancelled 事件结束
+    """
+    monkeypatch.setattr(broker_module.settings, "stream_disconnect_grace_seconds", 0)
+    upstream = {"closed": False}
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "x"
+        except asyncio.CancelledError:
+            upstream["closed"] = True
+            raise
+
+    async def scenario():
+        broker = GenerationBroker()
+        finished = asyncio.Event()
+        generation_id = await broker.start("content", endless(), finished.set)
+        frames = broker.events(generation_id)
+        async for frame in frames:
+            if '"text"' in frame:
+                break
+        await frames.aclose()  # 模拟客户端断开
+        await asyncio.wait_for(finished.wait(), 1)
+        return await _collect(broker, generation_id)
+
+    events = asyncio.run(scenario())
+    assert upstream["closed"]
+    assert json.loads(events[-2][1]) == {"cancelled": True, "reason": "client_disconnect"}
+    assert events[-1][1] == "[DONE]"
+
+
+def test_reconnect_within_grace_keeps_generation(monkeypatch):
+    """测试: 宽限期内重连时生成不被取消，显式 cancel 以 user 原因结束"""
+    monkeypatch.setattr(broker_module.settings, "stream_disconnect_grace_seconds", 0.2)
+
+    async def scenario():
+        broker = GenerationBroker()
+        generation_id = await broker.start("outline", _tokens(*"abcdefghij", delay=0.02), lambda: None)
+        frames = broker.events(generation_id)
+        await frames.__anext__()
+        await frames.aclose()
+        await asyncio.sleep(0.05)
+        resumed = await _collect(broker, generation_id)
+        second = await broker.start("outline", _tokens(*"abcdefghij", delay=0.05), lambda: None)
+        await asyncio.sleep(0.01)
+        cancelled = broker.cancel(second)
+        return resumed, cancelled, await _collect(broker, second)
+
+    resumed, cancelled, second_events = asyncio.run(scenario())
+    assert resumed[-2][1].startswith('{"timing"')
+    assert cancelled
+    assert json.loads(second_events[-2][1])["reason"] == "user"
+
+
+def test_cancel_is_forwarded_to_the_owning_worker():
+    """
+    测试: 取消请求到达未持有生产者的 worker (两个 broker 共享同一事件日志)
+    验证: 返回 cancelling 而不是 finished，持有任务的 worker 收到广播后取消生成；结束后再取消返回 finished
+    """
+    async def scenario():
+        owner, other = GenerationBroker(), GenerationBroker()
+        other._logs["memory"] = owner.log
+        listener = asyncio.create_task(owner.listen_cancels())
+        await asyncio.sleep(0)
+        generation_id = await owner.start("outline", _tokens(*"abcdefghij", delay=0.05), lambda: None)
+        await asyncio.sleep(0.01)
+
+        status = await other.request_cancel(generation_id, "user")
+        events = await _collect(other, generation_id)
+        after = await other.request_cancel(generation_id, "user")
+        missing = await other.request_cancel("unknown", "user")
+        listener.cancel()
+        return status, events, after, missing
+
+    status, events, after, missing = asyncio.run(scenario())
+    assert status == "cancelling"
+    assert json.loads(events[-2][1]) == {"cancelled": True, "reason": "user"}
+    assert after == "finished"
+    assert missing is None
+
+
+def test_second_cancel_during_cleanup_still_releases_slot():
+    """测试: 收尾阶段 (关闭上游) 再次被取消，名额仍然归还，DONE 仍然写入"""
+    released = []
+
+    class SlowClose:
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            await asyncio.sleep(0.01)
+            return "x"
+
+        async def aclose(self):
+            await asyncio.sleep(0.05)
+
+    async def scenario():
+        broker = GenerationBroker()
+        generation_id = await broker.start("content", SlowClose(), lambda: released.append(True))
+        task = broker._tasks[generation_id]
+        await asyncio.sleep(0.03)
+        task.cancel()
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return await _collect(broker, generation_id)
+
+    events = asyncio.run(scenario())
+    assert released == [True]
+    assert events[-1][1] == "[DONE]"
+
+
+def test_cancel_mid_stream_leaves_session_history_unchanged(monkeypatch):
+    """
+    测试: 内容生成流式输出到一半被取消
+    验证: 会话历史保持不变 (被取消的这一轮不写入)；未取消的一轮正常写入
+    """
+    from app.services import content as content_module
+    from app.services.history import get_session_history
+    from app.testing.fakes import ScriptedChatModel
+
+    monkeypatch.setattr(content_module.settings, "deepseek_api_key", "test")
+    monkeypatch.setattr(content_module.settings, "chat_history_backend", "memory")
+    model = ScriptedChatModel(reply='[{"title": "新能源", "content": ["电池成本下降"]}]', delay=0.01)
+    monkeypatch.setattr(content_module, "create_chat_model", lambda **kwargs: model)
+    generator = content_module.ContentGeneratorV1()
+    slides = [{"title": "旧标题", "content": ["要点"]}]
+
+    async def scenario():
+        broker = GenerationBroker()
+        history = get_session_history("cancel-session")
+        before = list(history.messages)
+
+        finished = asyncio.Event()
+        stream = generator.generate_content_stream("cancel-session", "改写标题", slides)
+        generation_id = await broker.start("content", stream, finished.set)
+        async for frame in broker.events(generation_id):
+            if '"text"' in frame:
+                broker.cancel(generation_id)
+                break
+        await asyncio.wait_for(finished.wait(), 1)
+        cancelled = list(history.messages)
+
+        finished.clear()
+        generation_id = await broker.start(
+            "content", generator.generate_content_stream("cancel-session", "改写标题", slides), finished.set
+        )
+        await _collect(broker, generation_id)
+        return before, cancelled, list(history.messages)
+
+    before, cancelled, completed = asyncio.run(scenario())
+    assert cancelled == before
+    assert len(completed) == len(before) + 2
@@ -0,0 +1,51 @@
+"""
+Pytest 单元测试文件 for app/core/timing.py 与 app/core/tokens.py
+"""
+
+import asyncio
+
+from app.core.timing import StageTimer, bind_timer, stage, track_llm_stream
+from app.core.tokens import estimate_tokens
+
+
+def test_stage_accumulates_into_bound_timer():
+    """测试: 同名阶段多次出现时耗时累加，并输出 Server-Timing 格式"""
+    timer = StageTimer("outline")
+    bind_timer(timer)
+
+    with stage("vector_search"):
+        pass
+    with stage("vector_search"):
+        pass
+    timer.record("llm_ttft", 0.25)
+
+    assert set(timer.stages) == {"vector_search", "llm_ttft"}
+    assert timer.stages["llm_ttft"] == 250.0
+    assert "llm_ttft;dur=250.0" in timer.server_timing()
+    assert "total" in timer.as_dict()
+
+
+def test_track_llm_stream_records_ttft_and_stream():
+    """测试: 透传 LLM 流的同时记录 llm_ttft 与 llm_stream"""
+    async def _fake_stream():
+        for token in ["[", "{}", "]"]:
+            await asyncio.sleep(0)
+            yield token
+
+    async def _collect():
+        timer = StageTimer("content")
+        bind_timer(timer)
+        tokens = [t async for t in track_llm_stream(_fake_stream())]
+        return tokens, timer
+
+    tokens, timer = asyncio.run(_collect())
+
+    assert tokens == ["[", "{}", "]"]
+    assert "llm_ttft" in timer.stages
+    assert "llm_stream" in timer.stages
+
+
+def test_estimate_tokens_weights_cjk_higher():
+    """测试: 中文字符的 token 权重高于英文字符"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("新能源汽车行业分析" * 10) > estimate_tokens("electric car" * 10)
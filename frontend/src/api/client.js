@@ -30,6 +30,17 @@ export const ragAPI = {
     });
   },
 
+  uploadFiles: (files, sessionId, onProgress) => {
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+    formData.append('session_id', sessionId);
+
+    return apiClient.post('/api/v1/rag/upload/batch', formData, {
+      headers: { 'Content-Type': 'multipart/form-data' },
+      onUploadProgress: onProgress
+    });
+  },
+
   listFiles: (sessionId, signal) => {
     return apiClient.get(`/api/v1/rag/files`, {
       params: { session_id: sessionId },
@@ -41,6 +52,10 @@ export const ragAPI = {
     return apiClient.delete(`/api/v1/rag/files/${fileId}`);
   },
 
+  deleteSession: (sessionId) => {
+    return apiClient.delete(`/api/v1/rag/sessions/${sessionId}`);
+  },
+
   getIndexStatus: (sessionId) => {
     return apiClient.get(`/api/v1/rag/status`, {
       params: { session_id: sessionId }
@@ -51,6 +66,8 @@ export const ragAPI = {
 export const streamEndpoints = {
   outline: `${baseURL}/api/v1/stream/outline`,
   content: `${baseURL}/api/v1/stream/content`,
+  resume: (generationId) => `${baseURL}/api/v1/stream/${generationId}`,
+  cancel: (generationId) => `${baseURL}/api/v1/stream/${generationId}/cancel`,
 };
 
 export default apiClient;
@@ -44,7 +44,7 @@ const KnowledgeBaseDialog = ({ open, onClose, files = [], selectedIds = [], onUp
           sx={{ border: '2px dashed #1a73e8', bgcolor: '#f0f7ff', borderRadius: 2, p: 4, mb: 3, display: 'flex', flexDirection: 'column', alignItems: 'center', cursor: status === 'uploading' ? 'not-allowed' : 'pointer', transition: 'all 0.2s', '&:hover': { bgcolor: '#e8f0fe', borderColor: '#174ea6' } }}
         >
           {/* [CTO Fix]: 修正文件类型限制，与后端对齐 */}
-          <input type="file" ref={fileInputRef} hidden accept=".pdf,.docx,.txt,.md,.json,.csv" onChange={onUpload} />
+          <input type="file" ref={fileInputRef} hidden multiple accept=".pdf,.docx,.txt,.md,.json,.csv" onChange={onUpload} />
 
           <CloudUpload sx={{ fontSize: 48, color: '#1a73e8', mb: 1, opacity: status === 'uploading' ? 0.5 : 1 }} />
           <Typography variant="subtitle1" fontWeight="bold" color="#1a73e8">{status === 'uploading' ? '正在上传并索引...' : '点击上传文档'}</Typography>
@@ -115,6 +115,7 @@ const Sidebar = ({ mobileOpen, setMobileOpen }) => {
   const fetchRagFiles = store.fetchRagFiles || (() => console.warn("fetchRagFiles not ready"));
   const deleteRagFile = store.deleteRagFile || (() => { });
   const uploadRAGFile = store.uploadRAGFile || (() => { });
+  const uploadRAGFiles = store.uploadRAGFiles || (() => { });
   const selectedRagFileIds = store.selectedRagFileIds || [];
   const toggleRagFileSelection = store.toggleRagFileSelection || (() => { });
 
@@ -133,8 +134,9 @@ const Sidebar = ({ mobileOpen, setMobileOpen }) => {
   const handleEditSave = (e) => { e.stopPropagation(); if (editingId) renameSession(editingId, editTitle); setEditingId(null); };
 
   const handleFileUpload = (e) => {
-    const file = e.target.files?.[0];
-    if (file) uploadRAGFile(file);
+    const files = Array.from(e.target.files || []);
+    if (files.length === 1) uploadRAGFile(files[0]);
+    else if (files.length > 1) uploadRAGFiles(files);
     e.target.value = null;
   };
 
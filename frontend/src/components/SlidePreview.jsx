@@ -27,13 +27,13 @@ const SlideRenderer = ({ slide, index, onUpdate }) => {
     const timer = setTimeout(() => {
         const load = async () => {
             setLoading(true);
-            const url = await getSmartImageUrl(slide.title, 800, 600);
+            const url = await getSmartImageUrl(slide.image_prompt || slide.title, 800, 600);
             if (active) { setBgImage(url); setLoading(false); }
         };
         load();
     }, 800);
     return () => { clearTimeout(timer); active = false; };
-  }, [slide.title]);
+  }, [slide.image_prompt, slide.title]);
 
   const handleChange = (field, value, subIndex) => onUpdate(index, field, value, subIndex);
   const isTitle = slide.slide_type === 'title';
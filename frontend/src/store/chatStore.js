@@ -3,6 +3,7 @@ import { immer } from 'zustand/middleware/immer';
 import { streamEndpoints, ragAPI } from '../api/client';
 import { exportToPPTX } from '../utils/pptxExporter';
 import { splitSlides } from '../utils/slideSplitter'; // [New Import]
+import { readSSE } from '../utils/sse';
 
 const SESSION_PREFIX = 'chatppt_session_';
 const INDEX_KEY = 'chatppt_history_index';
@@ -18,6 +19,8 @@ const extractJSON = (str) => {
 };
 
 let currentController = null;
+let currentGenerationId = null;
+const MAX_RESUME_ATTEMPTS = 5;
 
 export const useChatStore = create(
   immer((set, get) => ({
@@ -76,6 +79,33 @@ export const useChatStore = create(
       }
     },
 
+    // [New] 批量上传：一次请求携带多个文件，服务端逐文件返回结果
+    uploadRAGFiles: async (files) => {
+      const { sessionId } = get();
+      set(state => { state.ragStatus = 'uploading'; });
+      try {
+        const res = await ragAPI.uploadFiles(files, sessionId);
+        const results = res?.files || [];
+        await get().fetchRagFiles();
+        set(state => {
+          const indexed = results.filter(f => f.status === 'indexed');
+          const failed = results.filter(f => f.status === 'error');
+          state.ragStatus = failed.length ? 'error' : 'success';
+          indexed.forEach(f => {
+            if (!state.selectedRagFileIds.includes(f.id)) state.selectedRagFileIds.push(f.id);
+          });
+          const lines = [`已上传并选中 ${indexed.length} 个文档。`];
+          failed.forEach(f => lines.push(`- **${f.name}** 失败: ${f.error || 'unknown error'}`));
+          state.messages.push({ role: 'assistant', content: lines.join('\n') });
+        });
+      } catch (e) {
+        set(state => { state.ragStatus = 'error'; });
+        alert(`上传失败: ${e.message}`);
+      } finally {
+        setTimeout(() => set(state => { state.ragStatus = 'idle'; }), 2000);
+      }
+    },
+
     fetchRagFiles: async () => {
       const { sessionId } = get();
       if (!sessionId) return;
@@ -115,13 +145,14 @@ export const useChatStore = create(
 
       if (currentController) currentController.abort();
       currentController = new AbortController();
+      const { signal } = currentController;
 
       const endpoint = (phase === 'outline' && currentSlides.length === 0)
         ? streamEndpoints.outline
         : streamEndpoints.content;
 
       try {
-        const response = await fetch(endpoint, {
+        let response = await fetch(endpoint, {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({
@@ -130,38 +161,65 @@ export const useChatStore = create(
             current_slides: currentSlides.length > 0 ? currentSlides : undefined,
             rag_file_ids: selectedRagFileIds.length > 0 ? selectedRagFileIds : undefined
           }),
-          signal: currentController.signal,
+          signal,
         });
 
+        if (response.status === 429) {
+          const retryAfter = response.headers.get('Retry-After') || '?';
+          throw new Error(`当前生成请求过多，请 ${retryAfter} 秒后重试`);
+        }
         if (!response.ok) throw new Error(`HTTP ${response.status}`);
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
 
-        while (true) {
-          const { value, done } = await reader.read();
-          if (done) break;
-          const chunk = decoder.decode(value, { stream: true });
-          const lines = chunk.split('\n\n');
-          for (const line of lines) {
-            if (line.startsWith('data: ')) {
-              const dataStr = line.slice(6);
-              if (dataStr.trim() === '[DONE]') break;
-              try {
-                const parsed = JSON.parse(dataStr);
-                if (parsed.text) {
-                  set(state => {
-                    const lastMsg = state.messages[state.messages.length - 1];
-                    lastMsg.content += parsed.text;
-                  });
-                }
-              } catch (e) { }
+        // [New] 生成在服务端独立运行；断线后携带 Last-Event-ID 续传，只补发错过的事件
+        let generationId = response.headers.get('X-Generation-Id');
+        currentGenerationId = generationId;
+        let lastEventId = null;
+        let finished = false;
+        let attempts = 0;
+
+        const onEvent = ({ id, data }) => {
+          if (id) lastEventId = id;
+          if (data.trim() === '[DONE]') { finished = true; return; }
+          try {
+            const parsed = JSON.parse(data);
+            if (parsed.generation_id) generationId = currentGenerationId = parsed.generation_id;
+            if (parsed.text) {
+              set(state => {
+                const lastMsg = state.messages[state.messages.length - 1];
+                lastMsg.content += parsed.text;
+              });
+            }
+            // [New] 服务端校验/修复后的幻灯片：替换原始输出，截断或格式错误无需重新生成
+            if (parsed.slides || parsed.refusal) {
+              set(state => {
+                const lastMsg = state.messages[state.messages.length - 1];
+                lastMsg.content = parsed.slides ? JSON.stringify(parsed.slides, null, 2) : parsed.refusal;
+              });
             }
+          } catch (e) { }
+        };
+
+        while (true) {
+          try {
+            await readSSE(response, onEvent);
+          } catch (err) {
+            if (err.name === 'AbortError') throw err;
+            console.warn('[SSE] Connection lost, resuming...', err);
           }
+          if (finished || !generationId || attempts >= MAX_RESUME_ATTEMPTS) break;
+          attempts += 1;
+          await new Promise(resolve => setTimeout(resolve, 1000 * attempts));
+          response = await fetch(streamEndpoints.resume(generationId), {
+            headers: lastEventId ? { 'Last-Event-ID': lastEventId } : {},
+            signal,
+          });
+          if (!response.ok) break;
         }
       } catch (err) {
         if (err.name !== 'AbortError') console.error(err);
       } finally {
         currentController = null;
+        currentGenerationId = null;
         set(state => { state.isLoading = false });
         get().saveSession();
       }
@@ -210,6 +268,8 @@ export const useChatStore = create(
     },
 
     stopGeneration: () => {
+      // 生成在服务端独立运行，断开连接不会立即停止，需显式取消以中止上游请求
+      if (currentGenerationId) fetch(streamEndpoints.cancel(currentGenerationId), { method: 'POST' }).catch(() => {});
       if (currentController) currentController.abort();
       set(state => { state.isLoading = false; });
     },
@@ -252,6 +312,8 @@ export const useChatStore = create(
 
     deleteSession: (id) => {
       localStorage.removeItem(SESSION_PREFIX + id);
+      // 会话的知识库文件一并清理 (失败时由服务端 TTL 兜底)
+      ragAPI.deleteSession(id).catch(() => {});
       set(state => {
         state.historyList = state.historyList.filter(i => i.id !== id);
         localStorage.setItem(INDEX_KEY, JSON.stringify(state.historyList));
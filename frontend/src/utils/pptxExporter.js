@@ -41,7 +41,7 @@ export const exportToPPTX = async (slides) => {
   if (!slides?.length) throw new Error("No content");
 
   const slidesWithImages = await Promise.all(slides.map(async (slide) => {
-    const imgUrl = await getSmartImageUrl(slide.title, 1280, 720); 
+    const imgUrl = await getSmartImageUrl(slide.image_prompt || slide.title, 1280, 720);
     const base64 = imgUrl ? await fetchImageToBase64(imgUrl) : "";
     return { ...slide, _base64Image: base64 };
   }));
@@ -1,33 +1,34 @@
-const translationCache = new Map();
+import { getEnv } from './env';
+
+// 配图由后端解析关键词并缓存 (同源 /api/v1/images/...)，这里只做标签页内的去重
+const baseURL = getEnv('API_BASE_URL') || '';
+const urlCache = new Map();
 
 export const getSmartImageUrl = async (text, width = 1024, height = 768) => {
   if (!text) return null;
-  
-  if (translationCache.has(text)) {
-    return translationCache.get(text);
-  }
 
-  let keyword = 'business'; 
-
-  try {
-    const prompt = `Extract a single concrete English noun for a background photo representing: "${text}". Do not explain.`;
-    const response = await fetch(`https://text.pollinations.ai/${encodeURIComponent(prompt)}?private=true&model=openai`);
-    
-    if (response.ok) {
-        const rawText = await response.text();
-        keyword = rawText.replace(/[^a-zA-Z\s]/g, '').trim().split(' ')[0] || 'work';
-    }
-  } catch (e) {
-    console.warn("Translation fallback:", e);
+  const cacheKey = `${text}|${width}x${height}`;
+  if (urlCache.has(cacheKey)) {
+    return urlCache.get(cacheKey);
   }
 
-  // 构造 LoremFlickr 链接 (使用高清图，保证 PPT 质量)
-  let hash = 0;
-  for (let i = 0; i < text.length; i++) hash = text.charCodeAt(i) + ((hash << 5) - hash);
-  const lockId = Math.abs(hash) % 1000;
-  
-  const finalUrl = `https://loremflickr.com/${width}/${height}/${keyword}?lock=${lockId}`;
-  
-  translationCache.set(text, finalUrl);
-  return finalUrl;
+  const request = fetch(`${baseURL}/api/v1/images/resolve`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ prompt: text, width, height }),
+  })
+    .then(async (response) => {
+      if (!response.ok) throw new Error(`HTTP ${response.status}`);
+      const data = await response.json();
+      return `${baseURL}${data.url}`;
+    })
+    .catch((e) => {
+      console.warn("Image resolve failed:", e);
+      urlCache.delete(cacheKey);
+      return null;
+    });
+
+  // 缓存 Promise：同一张幻灯片的预览与导出并发请求时只发一次
+  urlCache.set(cacheKey, request);
+  return request;
 };
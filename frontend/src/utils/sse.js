@@ -0,0 +1,28 @@
+/**
+ * SSE 流读取工具
+ * - 按空行切分事件，跨 chunk 的半个事件会缓存到下一次读取
+ * - 解析 `id:` 与 `data:` 字段，忽略以 `:` 开头的注释 (服务端心跳)
+ */
+export const readSSE = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    const frames = buffer.split('\n\n');
+    buffer = frames.pop();
+    for (const frame of frames) {
+      let id = null;
+      const data = [];
+      for (const line of frame.split('\n')) {
+        if (line.startsWith('id: ')) id = line.slice(4);
+        else if (line.startsWith('data: ')) data.push(line.slice(6));
+      }
+      if (data.length > 0) onEvent({ id, data: data.join('\n') });
+    }
+  }
+};